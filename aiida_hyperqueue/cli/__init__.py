@@ -1,5 +1,13 @@
 # -*- coding: utf-8 -*-
-from .root import cmd_root  # noqa: F401
-from .install import cmd_install  # noqa: F401
-from .server import cmd_info, cmd_start, cmd_stop  # noqa: F401
-from .alloc import cmd_list, cmd_add, cmd_remove  # noqa: F401
+import importlib
+
+from .root import COMMAND_MODULES, cmd_root  # noqa: F401
+
+
+# The commands are only imported from their module when accessed here, see ``COMMAND_MODULES``
+def __getattr__(name):
+    if name in COMMAND_MODULES:
+        module = importlib.import_module(f".{COMMAND_MODULES[name]}", __name__)
+        return getattr(module, name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,10 +1,39 @@
 # -*- coding: utf-8 -*-
+import datetime
+import functools
+import hashlib
+import json
+import math
+import re
+import time
+import typing as t
+
 import click
 
 from aiida.cmdline.params import options, arguments
 from aiida.cmdline.utils import echo
+from aiida.common.escaping import escape_for_bash
 
+from .params import options as options_hq
 from .root import cmd_root
+from .utils import Result, echo_results, get_computers, run_on_computers
+
+# Computer property with the allocation profiles: the shapes of the allocation queues that ``aiida-hq alloc apply``
+# creates on the HQ server of the computer
+ALLOC_PROFILES_PROPERTY = "hyperqueue_alloc_profiles"
+
+# Prefix of the names of the allocation queues that are created from a profile
+PROFILE_QUEUE_PREFIX = "ahq-"
+
+# Fetches the waiting and running jobs and the workers of the HQ server for ``aiida-hq alloc autoscale``
+AUTOSCALE_COMMAND = (
+    "jq -n "
+    '--argjson jobs "$(hq job list --filter waiting,running --output-mode json | '
+    "jq -c '[.[] | {job_id: .id | tostring, name, task_stats}]')\" "
+    '--argjson workers "$(hq worker list --output-mode json | '
+    "jq -c '[.[] | {configuration: {resources: .configuration.resources}}]')\" "
+    "'{jobs: $jobs, workers: $workers}'"
+)
 
 
 @cmd_root.group("alloc")
@@ -12,56 +41,266 @@ def alloc_group():
     """Commands to configure HQ allocations."""
 
 
+def alloc_options(func):
+    """Decorate a command with the options that define the shape of an allocation queue."""
+    for option in reversed(
+        [
+            click.option(
+                "-t",
+                "--time-limit",
+                type=str,
+                required=True,
+                help=(
+                    "Time limit for each job run by the allocation. The duration can be expressed using various "
+                    "shortcuts recognised by HyperQueue, e.g. 30m, 2h, ... For the full list, see "
+                    "https://tinyurl.com/hq-duration."
+                ),
+            ),
+            click.option(
+                "--hyper-threading/--no-hyper-threading",
+                default=True,
+                type=click.BOOL,
+                help=(
+                    "Allow HyperQueue to consider hyperthreads when assigning resources."
+                ),
+            ),
+            click.option(
+                "-b",
+                "--backlog",
+                type=click.INT,
+                required=False,
+                default=1,
+                help=(
+                    "Set the backlog for the allocator. This is the number of allocations HyperQueue will make sure is "
+                    "waiting with the job manager."
+                ),
+            ),
+            click.option(
+                "-w",
+                "--workers-per-alloc",
+                type=click.INT,
+                required=False,
+                default=1,
+                help=("Option to allow pooled jobs to launch on multiple nodes."),
+            ),
+            click.option(
+                "-r",
+                "--worker-resource",
+                "worker_resources",
+                type=str,
+                multiple=True,
+                help=(
+                    "Custom resource advertised by the workers of the allocation, e.g. `scratch_a=sum(1000)`. "
+                    "Calculations that set the `locality` resource to the resource name are only run on these workers. "
+                    "Can be passed multiple times."
+                ),
+            ),
+        ]
+    ):
+        func = option(func)
+
+    return func
+
+
+def get_alloc_add_command(
+    name: str,
+    time_limit: str,
+    backlog: int = 1,
+    workers_per_alloc: int = 1,
+    hyper_threading: bool = True,
+    worker_resources: t.Sequence[str] = (),
+    slurm_options: t.Sequence[str] = (),
+) -> str:
+    """Return the ``hq alloc add`` command that creates a Slurm allocation queue with the given shape."""
+    # from hq==0.13.0: ``--cpus=no-ht`` is now changed to a flag ``--no-hyper-threading``
+    hyper = "" if hyper_threading else "--no-hyper-threading"
+    resources = "".join(
+        f"--resource {escape_for_bash(resource)} " for resource in worker_resources
+    )
+
+    return (
+        f"hq alloc add slurm --backlog {backlog} --time-limit {time_limit} --name {name} {hyper} {resources}"
+        f'--workers-per-alloc {workers_per_alloc} -- {" ".join(slurm_options)}'
+    )
+
+
+def get_queue_name(profile: str, spec: dict) -> str:
+    """Return the name of the allocation queue of a profile.
+
+    The name contains a hash of the shape of the queue, so a queue whose profile has changed is recognised as stale.
+    The backlog is not part of the hash, since it is changed by ``aiida-hq alloc autoscale`` and compared separately.
+    """
+    shape = {key: value for key, value in spec.items() if key != "backlog"}
+    digest = hashlib.sha256(json.dumps(shape, sort_keys=True).encode()).hexdigest()
+    return f"{PROFILE_QUEUE_PREFIX}{profile}-{digest[:8]}"
+
+
+def get_queue_profile(name: str) -> str:
+    """Return the name of the profile of an allocation queue, see ``get_queue_name``."""
+    return name[len(PROFILE_QUEUE_PREFIX) :].rpartition("-")[0]
+
+
+def diff_alloc_queues(profiles: dict, queues: list) -> t.Tuple[dict, list, list]:
+    """Return the changes that make the allocation queues of the HQ server match the allocation profiles.
+
+    Only the queues created from a profile, recognised by their name, are considered, so queues that were added with
+    ``aiida-hq alloc add`` or directly with ``hq`` are left alone. HQ cannot change a queue, so a queue whose profile
+    changed shape or backlog is stale and replaced by a new one.
+
+    :param profiles: the allocation profiles of the computer, a mapping of the profile name to its queue shape.
+    :param queues: the queues of the HQ server, as returned by ``hq alloc list --output-mode json``.
+    :return: the queues to add, as a mapping of the queue name to the shape, the stale queues to remove and the ids of
+        the paused queues to resume.
+    """
+    wanted = {get_queue_name(profile, spec): spec for profile, spec in profiles.items()}
+    kept = set()
+    to_remove = []
+    to_resume = []
+
+    for queue in queues:
+        name = queue.get("name") or ""
+        if not name.startswith(PROFILE_QUEUE_PREFIX):
+            continue
+        spec = wanted.get(name)
+        if spec is None or queue.get("backlog") != spec["backlog"] or name in kept:
+            to_remove.append(queue)
+            continue
+        if str(queue.get("state", "")).lower() == "paused":
+            to_resume.append(queue["id"])
+        kept.add(name)
+
+    to_add = {name: spec for name, spec in wanted.items() if name not in kept}
+
+    return to_add, to_remove, to_resume
+
+
+def get_running_allocations(transport, queue_id: int) -> int:
+    """Return the number of running allocations of an allocation queue.
+
+    :raises RuntimeError: if the allocations cannot be listed.
+    """
+    retval, stdout, stderr = transport.exec_command_wait(
+        f"hq alloc info {queue_id} --output-mode json"
+    )
+    if retval != 0:
+        raise RuntimeError(
+            f"failed to list the allocations of queue {queue_id}: {stderr}"
+        )
+
+    return sum(
+        1
+        for allocation in json.loads(stdout)
+        if str(allocation.get("status", "")).lower() == "running"
+    )
+
+
+def apply_alloc_profiles(transport, profiles: dict, dry_run: bool = False) -> bool:
+    """Make the allocation queues of the HQ server match the allocation profiles, see ``diff_alloc_queues``.
+
+    A stale queue without running allocations is removed with its queued allocations, before the queue that replaces it
+    is added, so the queued allocations of both queues never add up. A stale queue with running allocations cannot be
+    removed without killing their workers, so it is paused and the queue that replaces it is only added by a later call,
+    once the running allocations have ended and the stale queue is removed.
+
+    :param transport: an open transport to the computer of the HQ server.
+    :param profiles: the allocation profiles of the computer.
+    :param dry_run: only report the changes, without applying them.
+    :return: whether any changes were needed.
+    :raises RuntimeError: if the queues cannot be listed or a new queue cannot be added.
+    """
+    retval, stdout, stderr = transport.exec_command_wait(
+        "hq alloc list --output-mode json"
+    )
+    if retval != 0:
+        raise RuntimeError(f"failed to list allocations: {stderr}")
+
+    to_add, to_remove, to_resume = diff_alloc_queues(profiles, json.loads(stdout))
+
+    # Profiles whose stale queue is still there, their new queue is only added once the stale queue is removed
+    draining = set()
+
+    for queue in to_remove:
+        queue_id = queue["id"]
+        running = get_running_allocations(transport, queue_id)
+        if running:
+            draining.add(get_queue_profile(queue["name"]))
+            echo.echo_report(
+                f"pausing allocation queue {queue_id} until its {running} running allocations end"
+            )
+            if dry_run or str(queue.get("state", "")).lower() == "paused":
+                continue
+            retval, _, stderr = transport.exec_command_wait(
+                f"hq alloc pause {queue_id}"
+            )
+            if retval != 0:
+                echo.echo_error(
+                    f"failed to pause allocation queue {queue_id}: {stderr}"
+                )
+            continue
+
+        echo.echo_report(f"removing allocation queue {queue_id}")
+        if dry_run:
+            continue
+        # No allocation is running, so this only cancels the queued allocations
+        retval, _, stderr = transport.exec_command_wait(
+            f"hq alloc remove --force {queue_id}"
+        )
+        if retval != 0:
+            draining.add(get_queue_profile(queue["name"]))
+            echo.echo_error(f"failed to remove allocation queue {queue_id}: {stderr}")
+
+    for queue_id in to_resume:
+        echo.echo_report(f"resuming allocation queue {queue_id}")
+        if dry_run:
+            continue
+        retval, _, stderr = transport.exec_command_wait(f"hq alloc resume {queue_id}")
+        if retval != 0:
+            echo.echo_error(f"failed to resume allocation queue {queue_id}: {stderr}")
+
+    for name, spec in to_add.items():
+        if get_queue_profile(name) in draining:
+            echo.echo_report(
+                f"adding allocation queue {name} once the stale queue of its profile is removed"
+            )
+            continue
+        echo.echo_report(f"adding allocation queue {name}")
+        if dry_run:
+            continue
+        retval, _, stderr = transport.exec_command_wait(
+            get_alloc_add_command(name, **spec)
+        )
+        if retval != 0:
+            raise RuntimeError(f"failed to create allocation queue {name}: {stderr}")
+
+    return bool(to_add or to_remove or to_resume)
+
+
 @alloc_group.command("add")
 @click.argument("slurm-options", nargs=-1)
 @options.COMPUTER(required=True)
-@click.option(
-    "-t",
-    "--time-limit",
-    type=str,
-    required=True,
-    help=(
-        "Time limit for each job run by the allocation. The duration can be expressed using various shortcuts "
-        "recognised by HyperQueue, e.g. 30m, 2h, ... For the full list, see https://tinyurl.com/hq-duration."
-    ),
-)
-@click.option(
-    "--hyper-threading/--no-hyper-threading",
-    default=True,
-    type=click.BOOL,
-    help=("Allow HyperQueue to consider hyperthreads when assigning resources."),
-)
-@click.option(
-    "-b",
-    "--backlog",
-    type=click.INT,
-    required=False,
-    default=1,
-    help=(
-        "Set the backlog for the allocator. This is the number of allocations HyperQueue will make sure is waiting with"
-        " the job manager."
-    ),
-)
-@click.option(
-    "-w",
-    "--workers-per-alloc",
-    type=click.INT,
-    required=False,
-    default=1,
-    help=("Option to allow pooled jobs to launch on multiple nodes."),
-)
+@alloc_options
 def cmd_add(
-    slurm_options, computer, time_limit, hyper_threading, backlog, workers_per_alloc
+    slurm_options,
+    computer,
+    time_limit,
+    hyper_threading,
+    backlog,
+    workers_per_alloc,
+    worker_resources,
 ):
     """Add a new allocation to the HQ server."""
 
-    # from hq==0.13.0: ``--cpus=no-ht`` is now changed to a flag ``--no-hyper-threading``
-    hyper = "" if hyper_threading else "--no-hyper-threading"
-
     with computer.get_transport() as transport:
         retval, _, stderr = transport.exec_command_wait(
-            f'hq alloc add slurm --backlog {backlog} --time-limit {time_limit} --name ahq {hyper} '
-            f'--workers-per-alloc {workers_per_alloc} -- {" ".join(slurm_options)}'
+            get_alloc_add_command(
+                "ahq",
+                time_limit,
+                backlog,
+                workers_per_alloc,
+                hyper_threading,
+                worker_resources,
+                slurm_options,
+            )
         )
 
     if retval != 0:
@@ -70,18 +309,43 @@ def cmd_add(
     echo.echo_success(f"{stderr}")
 
 
-@alloc_group.command("list")
-@arguments.COMPUTER()
-def cmd_list(computer):
-    """List the allocations on the HQ server."""
+def list_allocs(transport, summary: bool = False) -> Result:
+    """Return the allocation queues of the HQ server on the computer of an open transport.
 
-    with computer.get_transport() as transport:
+    :param summary: only return the id, name and backlog of the queues on one line.
+    """
+    if not summary:
         retval, stdout, stderr = transport.exec_command_wait("hq alloc list")
+    else:
+        retval, stdout, stderr = transport.exec_command_wait(
+            "hq alloc list --output-mode json"
+        )
 
     if retval != 0:
-        echo.echo_critical(f"failed to list allocations: {stderr}\n")
+        return "error", f"failed to list allocations: {stderr}\n"
+
+    if summary:
+        queues = json.loads(stdout)
+        stdout = ", ".join(
+            f"{queue['id']} {queue.get('name') or ''} (backlog {queue.get('backlog')})"
+            for queue in queues
+        )
+        stdout = stdout or "no allocation queues"
+
+    return "output", stdout
+
 
-    echo.echo(stdout)
+@alloc_group.command("list")
+@arguments.COMPUTERS()
+@options_hq.ALL_COMPUTERS()
+def cmd_list(computers, all_computers):
+    """List the allocations on the HQ server."""
+    computers = get_computers(computers, all_computers)
+    single = len(computers) == 1 and not all_computers
+    results = run_on_computers(
+        computers, functools.partial(list_allocs, summary=not single)
+    )
+    echo_results(computers, results, single)
 
 
 @alloc_group.command("remove")
@@ -97,3 +361,336 @@ def cmd_remove(alloc_id, computer):
         echo.echo_critical(f"failed to remove allocation: {stderr}\n")
 
     echo.echo_success(f"{stderr}")
+
+
+@alloc_group.group("profile")
+def profile_group():
+    """Commands to configure the allocation profiles of a computer."""
+
+
+@profile_group.command("set")
+@click.argument("name", type=click.STRING)
+@click.argument("slurm-options", nargs=-1)
+@options.COMPUTER(required=True)
+@alloc_options
+def cmd_profile_set(
+    name,
+    slurm_options,
+    computer,
+    time_limit,
+    hyper_threading,
+    backlog,
+    workers_per_alloc,
+    worker_resources,
+):
+    """Add or update an allocation profile of a computer.
+
+    The profile is only stored on the computer, run `aiida-hq alloc apply` to create its allocation queue on the HQ
+    server.
+    """
+    if re.fullmatch(r"[\w-]+", name) is None:
+        echo.echo_critical(
+            "the profile name can only contain letters, digits, `_` and `-`."
+        )
+
+    profiles = computer.get_property(ALLOC_PROFILES_PROPERTY, {})
+    profiles[name] = {
+        "time_limit": time_limit,
+        "backlog": backlog,
+        "workers_per_alloc": workers_per_alloc,
+        "hyper_threading": hyper_threading,
+        "worker_resources": list(worker_resources),
+        "slurm_options": list(slurm_options),
+    }
+    computer.set_property(ALLOC_PROFILES_PROPERTY, profiles)
+
+    echo.echo_success(f"allocation profile `{name}` set for {computer.label}")
+
+
+@profile_group.command("remove")
+@click.argument("name", type=click.STRING)
+@options.COMPUTER(required=True)
+def cmd_profile_remove(name, computer):
+    """Remove an allocation profile of a computer.
+
+    The allocation queue of the profile is only removed from the HQ server by the next `aiida-hq alloc apply`.
+    """
+    profiles = computer.get_property(ALLOC_PROFILES_PROPERTY, {})
+
+    if profiles.pop(name, None) is None:
+        echo.echo_critical(f"no allocation profile `{name}` for {computer.label}")
+
+    computer.set_property(ALLOC_PROFILES_PROPERTY, profiles)
+
+    echo.echo_success(f"allocation profile `{name}` removed from {computer.label}")
+
+
+@profile_group.command("list")
+@arguments.COMPUTER()
+def cmd_profile_list(computer):
+    """List the allocation profiles of a computer."""
+
+    profiles = computer.get_property(ALLOC_PROFILES_PROPERTY, {})
+
+    if not profiles:
+        echo.echo_info(f"no allocation profiles for {computer.label}")
+        return
+
+    for name, spec in sorted(profiles.items()):
+        queue_name = get_queue_name(name, spec)
+        echo.echo(f"{name}: {get_alloc_add_command(queue_name, **spec)}")
+
+
+@alloc_group.command("apply")
+@arguments.COMPUTER()
+@click.option(
+    "-n",
+    "--dry-run",
+    is_flag=True,
+    help="Only show the changes, without applying them to the HQ server.",
+)
+def cmd_apply(computer, dry_run):
+    """Make the allocation queues of the HQ server match the allocation profiles of the computer.
+
+    Queues of new or changed profiles are added and queues of removed or changed profiles are removed, together with
+    their queued allocations. A queue that still has running allocations is paused instead, so it stops submitting new
+    allocations, and the queue of its changed profile is only added by a later apply, once it is removed. Queues that
+    were not created from a profile are left alone.
+    """
+    profiles = computer.get_property(ALLOC_PROFILES_PROPERTY, {})
+
+    with computer.get_transport() as transport:
+        try:
+            changed = apply_alloc_profiles(transport, profiles, dry_run)
+        except RuntimeError as exception:
+            echo.echo_critical(f"{exception}\n")
+
+    if not changed:
+        echo.echo_success("allocation queues are up to date")
+    elif not dry_run:
+        echo.echo_success("allocation queues applied")
+
+
+def get_calcjob_cpus(computer_pk: int) -> t.Dict[int, t.Tuple[t.Optional[str], int]]:
+    """Return the job id and the number of cores of each active calculation job on a computer.
+
+    :return: the job id, or ``None`` if the calculation job was not submitted yet, and the number of cores for the pk
+        of each active calculation job.
+    """
+    from aiida import orm
+
+    from ..jobs import ACTIVE_PROCESS_STATES
+
+    builder = orm.QueryBuilder().append(
+        orm.CalcJobNode,
+        filters={
+            "dbcomputer_id": computer_pk,
+            "attributes.process_state": {"in": list(ACTIVE_PROCESS_STATES)},
+        },
+        project=["id", "attributes.job_id", "attributes.resources.num_cpus"],
+    )
+
+    return {
+        pk: (None if job_id is None else str(job_id), num_cpus or 1)
+        for pk, job_id, num_cpus in builder.iterall()
+    }
+
+
+def get_pending_cpus(
+    jobs: t.Sequence[dict],
+    workers: t.Sequence[dict],
+    calcjob_cpus: t.Dict[int, t.Tuple[t.Optional[str], int]],
+    profile_tag: t.Optional[str],
+) -> int:
+    """Return the number of cores that the work which is not running yet needs beyond the idle cores of the workers.
+
+    The pending work is made of the waiting tasks of the HQ server and the calculation jobs that are not submitted yet.
+    The idle cores are the cores of the workers that are not used by running tasks.
+
+    :param jobs: the waiting and running jobs of the HQ server, each with its ``job_id``, ``name`` and ``task_stats``.
+    :param workers: the workers of the HQ server, as returned by ``hq worker list --output-mode json``.
+    :param calcjob_cpus: the job id and number of cores of the active calculation jobs, see ``get_calcjob_cpus``.
+    :param profile_tag: the tag of the loaded profile, see ``aiida_hyperqueue.scheduler.get_profile_tag``.
+    """
+    from ..jobs import get_job_pks
+    from ..scheduler import parse_inventory
+
+    job_pks = get_job_pks(jobs, profile_tag)
+
+    waiting = sum(
+        num_cpus for job_id, num_cpus in calcjob_cpus.values() if job_id is None
+    )
+    running = 0
+    for job in jobs:
+        # Jobs that were not submitted by a calculation job are assumed to use one core per task
+        _, num_cpus = calcjob_cpus.get(job_pks.get(job["job_id"]), (None, None))
+        task_stats = job["task_stats"]
+        tasks = sum(task_stats.values()) or 1
+        cpus_per_task = (num_cpus or tasks) / tasks
+        waiting += task_stats.get("waiting", 0) * cpus_per_task
+        running += task_stats.get("running", 0) * cpus_per_task
+
+    worker_cpus = sum(
+        cpus or 0 for cpus, _ in parse_inventory(list(workers), [])["shapes"]
+    )
+    idle = max(worker_cpus - running, 0)
+
+    return max(math.ceil(waiting - idle), 0)
+
+
+def get_autoscaled_backlog(
+    pending_cpus: int, cpus_per_alloc: int, min_backlog: int, max_backlog: int
+) -> int:
+    """Return the backlog of an allocation queue that covers the pending demand, within the given limits."""
+    backlog = -(-pending_cpus // cpus_per_alloc)
+
+    return max(min_backlog, min(backlog, max_backlog))
+
+
+@alloc_group.command("autoscale")
+@click.argument("profile", type=click.STRING)
+@options.COMPUTER(required=True)
+@click.option(
+    "-c",
+    "--cpus-per-alloc",
+    type=click.IntRange(min=1),
+    required=True,
+    help="Number of cores of the workers started by one allocation of the profile.",
+)
+@click.option(
+    "--min-backlog",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Lowest backlog the queue of the profile is scaled down to.",
+)
+@click.option(
+    "--max-backlog",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help="Highest backlog the queue of the profile is scaled up to.",
+)
+@click.option(
+    "-i",
+    "--interval",
+    type=click.IntRange(min=1),
+    default=300,
+    show_default=True,
+    help="Number of seconds between the updates of the backlog.",
+)
+@click.option("--once", is_flag=True, help="Update the backlog once and exit.")
+def cmd_autoscale(
+    profile, computer, cpus_per_alloc, min_backlog, max_backlog, interval, once
+):
+    """Scale the backlog of the queue of an allocation profile with the pending work of the computer.
+
+    The pending work is made of the waiting tasks of the HQ server and the calculation jobs that are not submitted yet,
+    minus what the idle cores of the workers can run. The backlog is set to the number of allocations needed to run it,
+    within the given limits. When it changes, the profile is updated and applied: the queue is replaced by one with the
+    new backlog once it has no running allocations, see `aiida-hq alloc apply`.
+    """
+    from ..scheduler import get_profile_tag
+
+    if min_backlog > max_backlog:
+        echo.echo_critical("the minimum backlog is larger than the maximum backlog.")
+
+    while True:
+        profiles = computer.get_property(ALLOC_PROFILES_PROPERTY, {})
+        if profile not in profiles:
+            echo.echo_critical(
+                f"no allocation profile `{profile}` for {computer.label}"
+            )
+
+        try:
+            with computer.get_transport() as transport:
+                retval, stdout, stderr = transport.exec_command_wait(AUTOSCALE_COMMAND)
+                if retval != 0:
+                    raise RuntimeError(
+                        f"failed to list the jobs and workers of the HQ server: {stderr}"
+                    )
+                data = json.loads(stdout)
+                pending_cpus = get_pending_cpus(
+                    data["jobs"],
+                    data["workers"],
+                    get_calcjob_cpus(computer.pk),
+                    get_profile_tag(),
+                )
+                backlog = get_autoscaled_backlog(
+                    pending_cpus, cpus_per_alloc, min_backlog, max_backlog
+                )
+
+                if backlog != profiles[profile]["backlog"]:
+                    echo.echo_report(
+                        f"{pending_cpus} pending cores, scaling the backlog of `{profile}` from "
+                        f"{profiles[profile]['backlog']} to {backlog}"
+                    )
+                    profiles[profile]["backlog"] = backlog
+                    computer.set_property(ALLOC_PROFILES_PROPERTY, profiles)
+
+                apply_alloc_profiles(transport, profiles)
+        except Exception as exception:
+            echo.echo_warning(f"failed to autoscale the allocation queue: {exception}")
+
+        if once:
+            break
+
+        time.sleep(interval)
+
+
+@alloc_group.command("report")
+@arguments.COMPUTER()
+def cmd_report(computer):
+    """Report how efficiently the allocations of each allocation queue were used.
+
+    For each queue, the report shows the mean time its allocations waited in the Slurm queue, the fraction of the
+    lifetime of its workers that was spent running tasks, and the mean time the workers were idle after their last task
+    until the allocation ended. A low utilization or a long idle tail suggests to shorten the time limit or reduce the
+    workers per allocation, a long latency to increase the backlog.
+    """
+    from tabulate import tabulate
+
+    from ..report import REPORT_COMMAND, get_alloc_report
+
+    with computer.get_transport() as transport:
+        retval, stdout, stderr = transport.exec_command_wait(REPORT_COMMAND)
+
+    if retval != 0:
+        echo.echo_critical(f"failed to fetch the allocations: {stderr}\n")
+
+    data = json.loads(stdout)
+    report = get_alloc_report(data["queues"], data["workers"], data["tasks"] or [])
+
+    if not report:
+        echo.echo_info("no allocation queues on the HQ server")
+        return
+
+    def format_seconds(seconds):
+        return (
+            "-" if seconds is None else str(datetime.timedelta(seconds=round(seconds)))
+        )
+
+    rows = [
+        [
+            row["queue"],
+            row["allocations"],
+            row["workers"],
+            format_seconds(row["latency"]),
+            "-" if row["utilization"] is None else f"{row['utilization']:.0%}",
+            format_seconds(row["idle_tail"]),
+        ]
+        for row in report
+    ]
+    echo.echo(
+        tabulate(
+            rows,
+            headers=[
+                "Queue",
+                "Allocations",
+                "Workers",
+                "Start-up latency",
+                "Utilization",
+                "Idle tail",
+            ],
+        )
+    )
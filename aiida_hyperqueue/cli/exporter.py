@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import json
+
+import click
+
+from aiida.cmdline.utils import echo
+
+from .root import cmd_root
+from .params import arguments
+
+
+@cmd_root.command("exporter")
+@arguments.COMPUTER()
+@click.option(
+    "--host",
+    type=click.STRING,
+    default="127.0.0.1",
+    show_default=True,
+    help="Address the HTTP server listens on.",
+)
+@click.option(
+    "-p",
+    "--port",
+    type=click.IntRange(min=0, max=65535),
+    default=9876,
+    show_default=True,
+    help="Port the HTTP server listens on.",
+)
+@click.option(
+    "-i",
+    "--interval",
+    type=click.FloatRange(min=1),
+    default=30,
+    show_default=True,
+    help="Number of seconds between two refreshes of the metrics.",
+)
+def cmd_exporter(computer, host, port, interval):
+    """Serve the metrics of the HQ server for Prometheus on `http://HOST:PORT/metrics`.
+
+    The metrics are fetched from the computer in a single round trip, once per `--interval` seconds, however many
+    scrapes there are.
+    """
+    from ..exporter import MetricsCache, get_server
+    from ..monitor import SAMPLE_COMMAND
+
+    # The transport is created here, since the storage is not accessed from other threads
+    transport = computer.get_transport()
+
+    def fetch():
+        with transport:
+            retval, stdout, stderr = transport.exec_command_wait(SAMPLE_COMMAND)
+
+        if retval != 0:
+            echo.echo_warning(f"the HQ server is not running: {stderr}")
+            return None
+
+        return json.loads(stdout)
+
+    cache = MetricsCache(fetch, {"computer": computer.label}, interval)
+    cache.start()
+    server = get_server(host, port, cache)
+
+    echo.echo_info(
+        f"serving the metrics of {computer.label} on http://{host}:{server.server_port}/metrics"
+    )
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        cache.stop()
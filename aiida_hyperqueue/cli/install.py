@@ -1,19 +1,268 @@
 # -*- coding: utf-8 -*-
 import click
-import tempfile
-import requests
-import tarfile
+import functools
+import hashlib
+import re
+import shutil
+import threading
+import typing as t
 from pathlib import Path
 
-from aiida import orm
 from aiida.cmdline.utils import echo
 
-from .params import arguments
+from .params import arguments, options
 from .root import cmd_root
+from .utils import (
+    MAX_CONCURRENT_COMPUTERS,
+    Result,
+    echo_results,
+    get_computers,
+    run_on_computers,
+)
+
+
+if t.TYPE_CHECKING:
+    from aiida import orm
+
+# The hq build for each machine architecture reported by ``uname -m``
+HQ_ARCHS = {
+    "x86_64": "linux-x64",
+    "aarch64": "linux-arm64-linux",
+    "arm64": "linux-arm64-linux",
+}
+
+# Release tarballs of hq, e.g. ``hq-v0.19.0-linux-x64.tar.gz``
+HQ_TARBALL_REGEX = re.compile(r"^hq-v(?P<version>[\w.]+)-(?P<arch>[\w-]+)\.tar\.gz$")
+
+# The hq build for each machine of the ELF header of a binary
+ELF_ARCHS = {62: "linux-x64", 183: "linux-arm64-linux"}
+
+# Serializes the downloads of the installs that run concurrently
+_binary_lock = threading.Lock()
+
+
+def get_cache_dir() -> Path:
+    """Return the directory where downloaded hq binaries are cached."""
+    from aiida.manage.configuration.settings import AiiDAConfigDir
+
+    return AiiDAConfigDir.get() / "hyperqueue" / "cache"
+
+
+def get_sha256(path: Path) -> str:
+    """Return the SHA-256 checksum of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def get_cached_binary(version: str, arch: str) -> t.Optional[Path]:
+    """Return the cached hq binary of a version and architecture, or ``None`` if it is not cached.
+
+    Each binary is cached in a directory named after its version, architecture and checksum. A cached binary whose
+    checksum no longer matches is ignored.
+    """
+    for entry in sorted(get_cache_dir().glob(f"hq-v{version}-{arch}-*")):
+        binary = entry / "hq"
+        if binary.is_file() and get_sha256(binary) == entry.name.rsplit("-", 1)[-1]:
+            return binary
+
+    return None
+
+
+def get_binary_arch(binary: Path) -> t.Optional[str]:
+    """Return the hq build of the architecture of a binary from its ELF header, or ``None`` if it is not known."""
+    with open(binary, "rb") as handle:
+        header = handle.read(20)
+
+    if len(header) < 20 or header[:4] != b"\x7fELF":
+        return None
+
+    byteorder = "little" if header[5] == 1 else "big"
+    return ELF_ARCHS.get(int.from_bytes(header[18:20], byteorder))
+
+
+def add_to_cache(
+    tarball: Path, version: str, arch: str, require_arch: bool = False
+) -> Path:
+    """Extract the hq binary from a release tarball into the cache and return its path.
+
+    :param require_arch: refuse a binary whose architecture cannot be read from its ELF header, instead of trusting
+        that it is for the given architecture.
+    :raises ValueError: if the tarball has no hq binary, or the binary is not for the given architecture.
+    """
+    import tarfile
+    import tempfile
+
+    cache_dir = get_cache_dir()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    temp_dir = Path(tempfile.mkdtemp(dir=cache_dir))
+    try:
+        with tarfile.open(tarball, "r") as tar:
+            try:
+                member = tar.getmember("hq")
+            except KeyError:
+                raise ValueError(
+                    f"The tarball {tarball} does not contain an hq binary."
+                ) from None
+            tar.extract(member, path=temp_dir)
+
+        binary_arch = get_binary_arch(temp_dir / "hq")
+        if binary_arch is None and require_arch:
+            raise ValueError(
+                f"The architecture of the hq binary in {tarball} is not known, use the name of the release tarball."
+            )
+        if binary_arch not in (None, arch):
+            raise ValueError(
+                f"The hq binary in {tarball} is for the {binary_arch} build, not for the {arch} architecture."
+            )
+
+        entry = cache_dir / f"hq-v{version}-{arch}-{get_sha256(temp_dir / 'hq')}"
+        if not entry.exists():
+            temp_dir.rename(entry)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return entry / "hq"
+
+
+def download_tarball(version: str, arch: str, target: Path):
+    """Download the release tarball of hq of a version and architecture."""
+    import requests
+
+    url = f"https://github.com/It4innovations/hyperqueue/releases/download/v{version}/hq-v{version}-{arch}.tar.gz"
+    response = requests.get(url, stream=True)
+
+    if response.status_code != 200:
+        raise ValueError(
+            f"Cannot download the hq {arch} build, please check the version {version} exists."
+        )
+
+    with open(target, "wb") as f:
+        for chunk in response.iter_content(chunk_size=8192):
+            f.write(chunk)
+
+
+def get_binary(version: str, arch: str, tarball: t.Optional[Path] = None) -> Path:
+    """Return the local hq binary of a version and architecture, from the cache or a tarball, or downloaded.
+
+    :param tarball: a release tarball to install from, e.g. at sites without internet access. The version and
+        architecture are taken from its name if it follows that of the releases, otherwise the architecture is read
+        from the binary.
+    :raises ValueError: if the binary cannot be downloaded or extracted, or the tarball is for another architecture.
+    """
+    if tarball is not None:
+        tarball = Path(tarball)
+        match = HQ_TARBALL_REGEX.match(tarball.name)
+        if match is not None:
+            if match.group("arch") != arch:
+                raise ValueError(
+                    f"The tarball {tarball.name} is not for the {arch} architecture."
+                )
+            version = match.group("version")
+        binary = add_to_cache(tarball, version, arch, require_arch=match is None)
+        echo.echo_success(f"The hq version {version} binary taken from {tarball}.")
+        return binary
+
+    binary = get_cached_binary(version, arch)
+    if binary is not None:
+        echo.echo_info(f"The hq version {version} binary found in the cache.")
+        return binary
+
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        tar_path = Path(temp_dir) / "hq.tar.gz"
+        download_tarball(version, arch, tar_path)
+        binary = add_to_cache(tar_path, version, arch)
+
+    echo.echo_success(f"The hq version {version} binary downloaded.")
+
+    return binary
+
+
+def upload_binary(transport, binary: Path, remote_bin_dir: Path) -> bool:
+    """Upload the hq binary to the remote bin dir, unless the remote binary has the same checksum.
+
+    :return: whether the binary was uploaded.
+    """
+    remote_path = str(remote_bin_dir / "hq")
+    retval, stdout, _ = transport.exec_command_wait(f"sha256sum {remote_path}")
+    if retval == 0 and stdout.split()[:1] == [get_sha256(binary)]:
+        return False
+
+    transport.makedirs(path=str(remote_bin_dir), ignore_existing=True)
+    transport.put(localpath=str(binary.resolve()), remotepath=remote_path)
+
+    # XXX: should transport.put take care of this already??
+    transport.exec_command_wait(f"chmod +x {remote_path}")
+
+    return True
+
+
+def install_hq(
+    transport,
+    hq_version: str,
+    remote_bin_dir: Path,
+    write_bashrc: bool,
+    tarball: t.Optional[Path] = None,
+) -> Result:
+    """Install the hq build that matches the architecture of the computer of an open transport."""
+    # Get the architecture and the abs path of remote bin dir in one go
+    retval, stdout, stderr = transport.exec_command_wait(
+        f"uname -m && echo {str(remote_bin_dir)}"
+    )
+    if retval != 0:
+        return (
+            "error",
+            f"Not able to parse remote bin dir {remote_bin_dir}, exit_code={retval}: {stderr}",
+        )
+
+    machine, remote_bin_dir = stdout.strip().split("\n")
+    remote_bin_dir = Path(remote_bin_dir.strip())
+
+    if machine.strip() not in HQ_ARCHS:
+        return "error", f"There is no hq build for the {machine} architecture."
+    arch = HQ_ARCHS[machine.strip()]
+
+    # Computers with the same architecture share the binary, only download it once
+    try:
+        with _binary_lock:
+            binary = get_binary(hq_version, arch, tarball)
+    except ValueError as exception:
+        return "error", str(exception)
+
+    uploaded = upload_binary(transport, binary, remote_bin_dir)
+
+    # write to bashrc
+    if write_bashrc:
+        identity_str = "by aiida-hq"
+        retval, _, stderr = transport.exec_command_wait(
+            f"grep -q '# {identity_str}' ~/.bashrc || echo '# {identity_str}\nexport PATH=$HOME/bin:$PATH' >> ~/.bashrc"
+        )
+
+        if retval != 0:
+            return (
+                "error",
+                f"Not able to set set the path $HOME/bin to your remote bashrc, try to do it manually.\n"
+                f"Info: {stderr}",
+            )
+
+    if not uploaded:
+        return (
+            "success",
+            f"The {arch} hq binary in remote {remote_bin_dir} is up to date",
+        )
+
+    return "success", f"The {arch} hq binary installed into remote {remote_bin_dir}"
 
 
 @cmd_root.command("install")
-@arguments.COMPUTER()
+@arguments.COMPUTERS()
+@options.ALL_COMPUTERS()
 @click.option(
     "-p",
     "--remote-bin-dir",
@@ -29,11 +278,33 @@ from .root import cmd_root
 @click.option(
     "--hq-version", type=str, default="0.19.0", help="the hq version will be installed."
 )
-# TODO: should also support different arch binary??
+@click.option(
+    "--tarball",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="Install from a local hq release tarball instead of downloading it, e.g. at sites without internet access.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=MAX_CONCURRENT_COMPUTERS,
+    show_default=True,
+    help="Maximum number of computers that are installed at the same time.",
+)
 def cmd_install(
-    computer: orm.Computer, remote_bin_dir: Path, hq_version: str, write_bashrc: bool
+    computers: t.Sequence["orm.Computer"],
+    all_computers: bool,
+    remote_bin_dir: Path,
+    hq_version: str,
+    write_bashrc: bool,
+    tarball: t.Optional[Path],
+    jobs: int,
 ):
-    """Install the hq binary to the computer through the transport"""
+    """Install the hq binary to the computers through the transport
+
+    The build that matches the architecture of each computer is installed. Downloaded binaries are cached locally, and
+    the upload is skipped if the remote binary is already identical.
+    """
 
     # The minimal hq version we support is 0.13.0, check the minor version
     try:
@@ -49,72 +320,16 @@ def cmd_install(
                 " Or install version >= 0.13.0"
             )
 
-    # Download the hq binary with specific version to local temp folder
-    # raise if the version not found
-    # Then upload to the remote using opened transport of computer
-    with tempfile.TemporaryDirectory() as temp_dir:
-        url = f"https://github.com/It4innovations/hyperqueue/releases/download/v{hq_version}/hq-v{hq_version}-linux-x64.tar.gz"
-        response = requests.get(url, stream=True)
-        rcode = response.status_code
-
-        if rcode != 200:
-            echo.echo_error(
-                "Cannot download the hq, please check the version is exist."
-            )
-
-        temp_dir = Path(temp_dir)
-        tar_path = temp_dir / "hq.tar.gz"
-
-        with open(tar_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-
-        with tarfile.open(tar_path, "r") as tar:
-            tar.extractall(path=temp_dir)
-
-        echo.echo_success(f"The hq version {hq_version} binary downloaded.")
-
-        bin_path = temp_dir / "hq"
-
-        # upload the binary to remote
-        # TODO: try not override if the binary exist, put has overwrite=True as default
-        with computer.get_transport() as transport:
-            # Get the abs path of remote bin dir
-            retval, stdout, stderr = transport.exec_command_wait(
-                f"echo {str(remote_bin_dir)}"
-            )
-            if retval != 0:
-                echo.echo_critical(
-                    f"Not able to parse remote bin dir {remote_bin_dir}, exit_code={retval}"
-                )
-            else:
-                remote_bin_dir = Path(stdout.strip())
-
-            # first check if the hq exist in the target folder
-            if transport.isfile(str(remote_bin_dir / "hq")):
-                echo.echo_info(
-                    f"hq exist in the {remote_bin_dir} on remote, will override it."
-                )
-
-            transport.makedirs(path=remote_bin_dir, ignore_existing=True)
-            transport.put(
-                localpath=str(bin_path.resolve()), remotepath=str(remote_bin_dir)
-            )
-
-            # XXX: should transport.put take care of this already??
-            transport.exec_command_wait(f"chmod +x {str(remote_bin_dir / 'hq')}")
-
-            # write to bashrc
-            if write_bashrc:
-                identity_str = "by aiida-hq"
-                retval, _, stderr = transport.exec_command_wait(
-                    f"grep -q '# {identity_str}' ~/.bashrc || echo '# {identity_str}\nexport PATH=$HOME/bin:$PATH' >> ~/.bashrc"
-                )
-
-                if retval != 0:
-                    echo.echo_critical(
-                        f"Not able to set set the path $HOME/bin to your remote bashrc, try to do it manually.\n"
-                        f"Info: {stderr}"
-                    )
-
-    echo.echo_success(f"The hq binary installed into remote {remote_bin_dir}")
+    computers = get_computers(computers, all_computers)
+    results = run_on_computers(
+        computers,
+        functools.partial(
+            install_hq,
+            hq_version=hq_version,
+            remote_bin_dir=remote_bin_dir,
+            write_bashrc=write_bashrc,
+            tarball=tarball,
+        ),
+        max_workers=jobs,
+    )
+    echo_results(computers, results, single=len(computers) == 1 and not all_computers)
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+import click
+
+from aiida.cmdline.params import types
+from aiida.cmdline.utils import echo
+
+from .root import cmd_root
+from .params import arguments
+from .utils import Result, echo_results, format_table, run_on_computers
+
+
+@cmd_root.group("job")
+def job_group():
+    """Commands to inspect and manage the HQ jobs of the calculation jobs."""
+
+
+@job_group.command("list")
+@arguments.COMPUTER()
+@click.option(
+    "-a",
+    "--all",
+    "all_jobs",
+    is_flag=True,
+    help="Also list the finished, failed and canceled jobs.",
+)
+def cmd_job_list(computer, all_jobs):
+    """List the HQ jobs of a computer with the calculation jobs that submitted them.
+
+    The jobs of all shards are fetched in one round trip and their calculation jobs are found with one query, so the
+    list stays fast for tens of thousands of jobs. Jobs that were not submitted by a calculation job of the current
+    profile have no PK.
+    """
+    from ..jobs import get_job_calcjobs, get_job_list_command, parse_job_list
+    from ..shards import get_server_dirs
+
+    command = get_job_list_command(get_server_dirs(computer), all_jobs)
+    with computer.get_transport() as transport:
+        retval, stdout, stderr = transport.exec_command_wait(command)
+
+    if retval != 0:
+        echo.echo_critical(f"cannot list the HQ jobs: {stderr}")
+
+    jobs = parse_job_list(stdout)
+    calcjobs = get_job_calcjobs(computer, jobs)
+
+    rows = []
+    for job in jobs:
+        calcjob = calcjobs.get(job["job_id"], {})
+        rows.append(
+            [
+                job["job_id"],
+                job["name"],
+                job["state"],
+                job["tasks"],
+                calcjob.get("pk"),
+                calcjob.get("process_state"),
+                calcjob.get("process_label"),
+                calcjob.get("label"),
+            ]
+        )
+
+    headers = [
+        "Job id",
+        "Name",
+        "State",
+        "Tasks",
+        "PK",
+        "Process state",
+        "Process label",
+        "Label",
+    ]
+    echo.echo(format_table(rows, headers))
+    echo.echo(f"\n{len(jobs)} jobs, {len(calcjobs)} with a calculation job")
+
+
+def reap_orphaned_jobs(computer, dry_run: bool, force: bool = False):
+    """Cancel the orphaned jobs on the HQ servers of a computer, see ``aiida_hyperqueue.jobs.get_orphaned_jobs``.
+
+    :param dry_run: only show the orphaned jobs.
+    :param force: cancel the orphaned jobs without asking for confirmation.
+    :raises RuntimeError: if the jobs cannot be listed or cancelled.
+    """
+    from ..jobs import (
+        get_calcjobs,
+        get_cancel_command,
+        get_job_list_command,
+        get_job_pks,
+        get_orphaned_jobs,
+        parse_job_list,
+    )
+    from ..scheduler import get_profile_tag
+    from ..shards import get_server_dirs
+
+    with computer.get_transport() as transport:
+        retval, stdout, stderr = transport.exec_command_wait(
+            get_job_list_command(get_server_dirs(computer))
+        )
+        if retval != 0:
+            raise RuntimeError(f"cannot list the HQ jobs: {stderr}")
+
+        jobs = parse_job_list(stdout)
+        profile_tag = get_profile_tag()
+        calcjobs = get_calcjobs(get_job_pks(jobs, profile_tag).values())
+        orphans = get_orphaned_jobs(jobs, calcjobs, profile_tag)
+        if not orphans:
+            echo.echo_info(f"no orphaned jobs among {len(jobs)} jobs")
+            return
+
+        rows = [
+            [
+                orphan["job_id"],
+                orphan["name"],
+                orphan["state"],
+                orphan["tasks"],
+                orphan["pk"],
+            ]
+            for orphan in orphans
+        ]
+        echo.echo(format_table(rows, ["Job id", "Name", "State", "Tasks", "PK"]))
+        tasks = sum(orphan["tasks"] for orphan in orphans)
+
+        if dry_run:
+            echo.echo_info(
+                f"would cancel {len(orphans)} orphaned jobs with {tasks} tasks"
+            )
+            return
+
+        if not force:
+            click.confirm(
+                f"Cancel {len(orphans)} orphaned jobs with {tasks} tasks?", abort=True
+            )
+
+        retval, _, stderr = transport.exec_command_wait(
+            get_cancel_command(orphan["job_id"] for orphan in orphans)
+        )
+
+    if retval != 0:
+        raise RuntimeError(f"failed to cancel some of the orphaned jobs: {stderr}")
+
+    echo.echo_success(f"cancelled {len(orphans)} orphaned jobs")
+
+
+@job_group.command("reap")
+@arguments.COMPUTER()
+@click.option(
+    "-n",
+    "--dry-run",
+    is_flag=True,
+    help="Only show the orphaned jobs, without cancelling them.",
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    help="Cancel the orphaned jobs without confirmation. Required to cancel them with `--interval`.",
+)
+@click.option(
+    "-i",
+    "--interval",
+    type=click.IntRange(min=1),
+    help="Keep running and reap the orphaned jobs every this many seconds, e.g. next to the daemon.",
+)
+def cmd_job_reap(computer, dry_run, force, interval):
+    """Cancel the HQ jobs of calculation jobs that are done.
+
+    A calculation job that is killed in AiiDA can leave its HQ job waiting or running, where it keeps occupying the
+    cores of a worker. Only jobs tagged with the current profile whose calculation job is in the database and has
+    terminated are considered. The orphaned jobs of all shards are cancelled with one `hq job cancel` per shard, in one
+    round trip, after confirmation. With `--interval` the orphaned jobs are only shown, unless `--force` is passed.
+    """
+    import time
+
+    if interval is not None and not dry_run and not force:
+        echo.echo_warning(
+            "the orphaned jobs are only shown, pass `--force` to cancel them with `--interval`"
+        )
+        dry_run = True
+
+    while True:
+        start = time.monotonic()
+        try:
+            reap_orphaned_jobs(computer, dry_run, force)
+        except click.Abort:
+            raise
+        except Exception as exception:
+            if interval is None:
+                echo.echo_critical(str(exception))
+            echo.echo_warning(str(exception))
+
+        if interval is None:
+            break
+
+        time.sleep(max(interval - (time.monotonic() - start), 0))
+
+
+def cancel_jobs(transport, job_ids) -> Result:
+    """Cancel jobs on the HQ servers of the computer of an open transport, with one call per shard."""
+    from ..jobs import get_cancel_command
+
+    retval, _, stderr = transport.exec_command_wait(get_cancel_command(job_ids))
+
+    if retval != 0:
+        return "error", f"failed to cancel some of the {len(job_ids)} jobs: {stderr}"
+
+    return "success", f"cancelled {len(job_ids)} jobs"
+
+
+@job_group.command("cancel")
+@click.option(
+    "-p",
+    "--process",
+    type=types.ProcessParamType(),
+    required=True,
+    help="Cancel the jobs of the calculation jobs of this process and all the processes it called.",
+)
+@click.option(
+    "-n",
+    "--dry-run",
+    is_flag=True,
+    help="Only show the number of jobs per computer, without cancelling them or killing the process.",
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    help="Cancel the jobs and kill the process without confirmation.",
+)
+def cmd_job_cancel(process, dry_run, force):
+    """Cancel the HQ jobs of all active calculation jobs of a workflow at once and kill the workflow.
+
+    Killing a workflow makes AiiDA kill its calculation jobs one by one. This cancels the jobs of all its calculation
+    jobs that run on a computer with the `hyperqueue` scheduler right away, with one `hq job cancel` per computer, so
+    the cores are freed before AiiDA's own kill reaches them. The process is then killed as with `verdi process kill`,
+    which finds the jobs already cancelled. Since killing cannot be undone, this asks for confirmation first.
+    """
+    from aiida import orm
+    from aiida.engine.processes import control
+
+    from ..jobs import get_descendant_calcjobs
+
+    computers = []
+    job_ids = []
+    for computer_pk, computer_job_ids in get_descendant_calcjobs(process).items():
+        computer = orm.load_computer(computer_pk)
+        if computer.scheduler_type == "hyperqueue":
+            computers.append(computer)
+            job_ids.append(computer_job_ids)
+
+    for computer, computer_job_ids in zip(computers, job_ids):
+        echo.echo(f"{computer.label}: {len(computer_job_ids)} jobs")
+    if not computers:
+        echo.echo_info(f"process {process.pk} has no active HQ jobs")
+
+    kill = not process.is_terminated
+    if dry_run:
+        if kill:
+            echo.echo_info(f"would kill process {process.pk}")
+        return
+
+    if not computers and not kill:
+        return
+
+    if not force:
+        jobs = sum(len(computer_job_ids) for computer_job_ids in job_ids)
+        click.confirm(
+            f"Cancel {jobs} HQ jobs"
+            + (
+                f" and kill process {process.pk} with all the processes it called"
+                if kill
+                else ""
+            )
+            + "?",
+            abort=True,
+        )
+
+    results = run_on_computers(
+        computers,
+        cancel_jobs,
+        kwargs=[{"job_ids": computer_job_ids} for computer_job_ids in job_ids],
+    )
+
+    # The process is killed even if some of the jobs could not be cancelled, AiiDA then cancels them itself
+    if kill:
+        control.kill_processes(
+            [process], msg_text="Killed through `aiida-hq job cancel`"
+        )
+
+    if computers:
+        echo_results(computers, results, single=len(computers) == 1)
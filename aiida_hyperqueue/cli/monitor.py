@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+
+import click
+
+from aiida.cmdline.utils import echo
+
+from .root import cmd_root
+from .params import arguments
+
+
+def get_store_path(computer):
+    """Return the default path of the file with the samples of the HQ server of a computer."""
+    from aiida.manage.configuration.settings import AiiDAConfigDir
+
+    return AiiDAConfigDir.get() / "hyperqueue" / f"monitor-{computer.uuid}.npz"
+
+
+@cmd_root.group("monitor")
+def monitor_group():
+    """Commands to record and show the load of the HQ server over time."""
+
+
+@monitor_group.command("run")
+@arguments.COMPUTER()
+@click.option(
+    "-i",
+    "--interval",
+    type=click.IntRange(min=1),
+    default=60,
+    show_default=True,
+    help="Number of seconds between two samples.",
+)
+@click.option(
+    "-r",
+    "--retention",
+    type=click.FloatRange(min=0, min_open=True),
+    default=30,
+    show_default=True,
+    help="Number of days the samples are kept, older samples are overwritten by new ones.",
+)
+@click.option(
+    "-s",
+    "--store",
+    type=click.Path(dir_okay=False),
+    help="File the samples are stored in, defaults to a file in the AiiDA configuration directory.",
+)
+@click.option("--once", is_flag=True, help="Take a single sample and exit.")
+def cmd_monitor_run(computer, interval, retention, store, once):
+    """Periodically sample the workers, jobs and allocation queues of the HQ server.
+
+    Every sample takes a single round trip over one connection to the computer. The samples are appended to a fixed-size store that holds
+    the samples of the last `--retention` days.
+    """
+    from ..monitor import SAMPLE_COMMAND, MetricStore, parse_sample
+
+    path = store or get_store_path(computer)
+    capacity = max(int(retention * 24 * 3600 / interval), 1)
+
+    try:
+        metric_store = MetricStore.load(path, capacity)
+    except FileNotFoundError:
+        metric_store = MetricStore(capacity)
+
+    transport = None
+
+    while True:
+        start = time.monotonic()
+        try:
+            if transport is None:
+                transport = computer.get_transport()
+                transport.open()
+            retval, stdout, stderr = transport.exec_command_wait(SAMPLE_COMMAND)
+            data = json.loads(stdout) if retval == 0 else None
+        except Exception as exception:
+            echo.echo_warning(f"failed to sample the HQ server: {exception}")
+            # The connection may be broken, open a new one for the next sample
+            if transport is not None:
+                try:
+                    transport.close()
+                except Exception:
+                    pass
+                transport = None
+        else:
+            if data is None:
+                echo.echo_warning(f"the HQ server is not running: {stderr}")
+            metric_store.append(parse_sample(data))
+            metric_store.save(path)
+
+        if once:
+            break
+
+        time.sleep(max(interval - (time.monotonic() - start), 0))
+
+    if transport is not None:
+        transport.close()
+
+
+@monitor_group.command("show")
+@arguments.COMPUTER()
+@click.option(
+    "-s",
+    "--store",
+    type=click.Path(dir_okay=False, exists=True),
+    help="File the samples are stored in, defaults to a file in the AiiDA configuration directory.",
+)
+@click.option(
+    "--since",
+    type=click.FloatRange(min=0),
+    default=24,
+    show_default=True,
+    help="Only show the samples of this many last hours.",
+)
+@click.option(
+    "-n",
+    "--limit",
+    type=click.IntRange(min=1),
+    default=20,
+    show_default=True,
+    help="Maximum number of samples to show, evenly spread over the time range.",
+)
+def cmd_monitor_show(computer, store, since, limit):
+    """Show the samples of the HQ server recorded with `aiida-hq monitor run`."""
+    import datetime
+
+    import numpy as np
+    from tabulate import tabulate
+
+    from ..monitor import MetricStore
+
+    path = store or get_store_path(computer)
+
+    try:
+        metric_store = MetricStore.load(path)
+    except FileNotFoundError:
+        echo.echo_critical(
+            f"no samples found for {computer.label}, start sampling with `aiida-hq monitor run`."
+        )
+
+    samples = metric_store.query(start=time.time() - since * 3600)
+    if len(samples["time"]) == 0:
+        echo.echo_info(f"no samples in the last {since} hours")
+        return
+
+    indices = np.unique(np.linspace(0, len(samples["time"]) - 1, limit).astype(int))
+    rows = [
+        [
+            datetime.datetime.fromtimestamp(samples["time"][index]).strftime(
+                "%Y-%m-%d %H:%M"
+            )
+        ]
+        + [
+            "-" if np.isnan(samples[metric][index]) else int(samples[metric][index])
+            for metric in metric_store.metrics
+        ]
+        for index in indices
+    ]
+    echo.echo(tabulate(rows, headers=["Time", *metric_store.metrics]))
@@ -2,3 +2,4 @@
 from aiida.cmdline.params import arguments as core_arguments
 
 COMPUTER = core_arguments.COMPUTER
+COMPUTERS = core_arguments.COMPUTERS
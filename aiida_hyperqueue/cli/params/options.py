@@ -8,6 +8,7 @@ from aiida.cmdline.params import options as core_options
 from aiida.cmdline.params import types as core_types
 
 __all__ = (
+    "ALL_COMPUTERS",
     "PROFILE",
     "VERBOSITY",
     "VERSION",
@@ -31,3 +32,12 @@ VERSION = core_options.OverridableOption(
     required=False,
     help="Select the version of the installed configuration.",
 )
+
+ALL_COMPUTERS = core_options.OverridableOption(
+    "-A",
+    "--all",
+    "all_computers",
+    is_flag=True,
+    default=False,
+    help="Run on all configured computers that use the `hyperqueue` scheduler.",
+)
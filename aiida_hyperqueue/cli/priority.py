@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import click
+
+from aiida.cmdline.utils import echo
+
+from ..priority import PRIORITY_POLICY_PROPERTY, get_policies
+from .root import cmd_root
+from .params import arguments
+
+
+@cmd_root.group("priority")
+def priority_group():
+    """Commands to configure the priority of HQ jobs."""
+
+
+@priority_group.command("policy")
+@arguments.COMPUTER()
+@click.argument("policy", required=False, type=click.Choice([*get_policies(), "none"]))
+def cmd_policy(computer, policy):
+    """Show or set the policy that derives the priority of the HQ jobs of a computer.
+
+    Jobs for which a priority is set explicitly through the `priority` option of the calculation keep that priority.
+    """
+    if policy is None:
+        current = computer.get_property(PRIORITY_POLICY_PROPERTY, None) or "none"
+        echo.echo(f"Priority policy of {computer.label}: {current}")
+        return
+
+    computer.set_property(
+        PRIORITY_POLICY_PROPERTY, None if policy == "none" else policy
+    )
+    echo.echo_success(f"Priority policy of {computer.label} set to {policy}")
@@ -3,6 +3,8 @@
 The CLI implementation prototype from `aiida-pseudo`.
 """
 
+import importlib
+
 import click
 
 from aiida.cmdline.groups.verdi import VerdiCommandGroup
@@ -10,13 +12,64 @@ from aiida.cmdline.groups.verdi import VerdiCommandGroup
 from .params import options
 
 
+# The module of each command of the CLI. The subcommand of ``cmd_root`` that a module defines has the name of the
+# module, so the subcommands are loaded lazily from these modules, and the commands are exported lazily by the package
+COMMAND_MODULES = {
+    "cmd_install": "install",
+    "cmd_info": "server",
+    "cmd_start": "server",
+    "cmd_stop": "server",
+    "cmd_restart": "server",
+    "cmd_prune_journal": "server",
+    "cmd_watchdog": "server",
+    "cmd_shards": "server",
+    "cmd_list": "alloc",
+    "cmd_add": "alloc",
+    "cmd_remove": "alloc",
+    "cmd_apply": "alloc",
+    "cmd_autoscale": "alloc",
+    "cmd_report": "alloc",
+    "cmd_profile_set": "alloc",
+    "cmd_profile_remove": "alloc",
+    "cmd_profile_list": "alloc",
+    "cmd_policy": "priority",
+    "cmd_monitor_run": "monitor",
+    "cmd_monitor_show": "monitor",
+    "cmd_exporter": "exporter",
+    "cmd_job_list": "job",
+    "cmd_job_reap": "job",
+    "cmd_job_cancel": "job",
+}
+
+
 class CustomVerdiCommandGroup(VerdiCommandGroup):
     """Subclass of :class:`aiida.cmdline.groups.verdi.VerdiCommandGroup` for the CLI.
 
     This subclass overrides the verbosity option to use a custom one that removes the ``-v`` short version of the option
     since that is used by other options in this CLI and so would clash.
+
+    The module of a lazy subcommand is only imported when the subcommand is used, or when the help of the group is
+    shown, so a command does not pay for importing all others.
+
+    :param lazy_subcommands: mapping of the name of a subcommand to the module that defines it.
     """
 
+    def __init__(self, *args, lazy_subcommands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx):
+        """Return the names of the subcommands, including those that are not loaded yet."""
+        return sorted({*super().list_commands(ctx), *self.lazy_subcommands})
+
+    def get_command(self, ctx, cmd_name):
+        """Return the subcommand with the given name, importing its module first if it is not loaded yet."""
+        if cmd_name not in self.commands and cmd_name in self.lazy_subcommands:
+            # The module registers the subcommand on this group when it is imported
+            importlib.import_module(self.lazy_subcommands[cmd_name])
+
+        return super().get_command(ctx, cmd_name)
+
     @staticmethod
     def add_verbosity_option(cmd):
         """Apply the ``verbosity`` option to the command, which is common to all subcommands."""
@@ -30,6 +83,9 @@ class CustomVerdiCommandGroup(VerdiCommandGroup):
     "aiida-hq",
     cls=CustomVerdiCommandGroup,
     context_settings={"help_option_names": ["-h", "--help"]},
+    lazy_subcommands={
+        module: f"{__package__}.{module}" for module in set(COMMAND_MODULES.values())
+    },
 )
 @options.VERBOSITY()
 @options.PROFILE()
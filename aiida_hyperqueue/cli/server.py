@@ -1,10 +1,21 @@
 # -*- coding: utf-8 -*-
+import functools
+import json
+import posixpath
+import sys
+import time
+
 import click
 
 from aiida.cmdline.utils import echo
 
 from .root import cmd_root
-from .params import arguments
+from .params import arguments, options
+from ..shards import get_hq_command, get_server_dirs, validate_server_dir
+from .utils import Result, echo_results, get_computers, run_on_computers
+
+# Computer property with the options of the last ``aiida-hq server start``, so the server can be started again with them
+SERVER_OPTIONS_PROPERTY = "hyperqueue_server_options"
 
 
 @cmd_root.group("server")
@@ -12,8 +23,278 @@ def server_group():
     """Commands for interacting with the HQ server."""
 
 
+def run_on_shards(
+    transport, operation, server_dirs: list = (None,), **kwargs
+) -> Result:
+    """Run an operation on the HQ server of each shard of a computer.
+
+    :param transport: an open transport to the computer.
+    :param operation: callable that takes the transport and the ``server_dir`` of a shard and returns a ``Result``.
+    :param server_dirs: the server directories of the shards, see ``aiida_hyperqueue.shards.get_server_dirs``.
+    :return: the result of the default server, or the results of all shards combined in one, which is an error if any
+        of them is an error.
+    """
+    if list(server_dirs) == [None]:
+        return operation(transport, **kwargs)
+
+    results = [
+        operation(transport, server_dir=server_dir, **kwargs)
+        for server_dir in server_dirs
+    ]
+    statuses = {status for status, _ in results}
+    status = next(
+        (status for status in ("error", "success") if status in statuses),
+        results[0][0],
+    )
+    message = "\n".join(
+        f"{server_dir}: {message.strip()}"
+        for server_dir, (_, message) in zip(server_dirs, results)
+    )
+
+    return status, message
+
+
+def get_shard_kwargs(computers, **kwargs) -> list:
+    """Return the keyword arguments of ``run_on_shards`` for each computer."""
+    return [
+        {"server_dirs": get_server_dirs(computer), **kwargs} for computer in computers
+    ]
+
+
+def start_server(
+    transport, domain: str = None, journal: str = None, server_dir: str = None
+) -> Result:
+    """Start the HQ server on the computer of an open transport, unless it is already running.
+
+    :param domain: domain that is attached to the hostname of the computer, on which the workers connect to the server.
+    :param journal: path of the journal on the computer. If the journal exists, the jobs and allocation queues that it
+        records are restored.
+    :param server_dir: the server directory of a shard, or ``None`` for the default server.
+    """
+    hq = get_hq_command(server_dir)
+    retval, _, _ = transport.exec_command_wait(f"{hq} server info")
+
+    if retval == 0:
+        return "info", "server is already running!"
+
+    # Mostly the case needed by CSCS machines
+    # The hostname has not domain included, it requires with domain to connect login node from compute node
+    # We attach the domain name to the hostname manually and passed to the start command.
+
+    # start command
+    start_command_lst = ["nohup", hq, "server", "start"]
+
+    if domain is not None:
+        retval, stdout, stderr = transport.exec_command_wait("hostname")
+        if retval != 0:
+            return "error", f"unable to get the hostname: {stderr}"
+        else:
+            hostname = stdout.strip()
+            start_command_lst.extend(["--host", f"{hostname}.{domain}"])
+
+    output_dir = "$HOME"
+    if server_dir is not None:
+        # Each shard keeps its journal and output in its own server directory
+        output_dir = server_dir
+        start_command_lst.insert(0, f"mkdir -p {server_dir} &&")
+        if journal is not None:
+            journal = posixpath.join(server_dir, posixpath.basename(journal))
+
+    if journal is not None:
+        start_command_lst.extend(["--journal", journal])
+
+    start_command_lst.extend(
+        [
+            f"1>{output_dir}/.hq-stdout",
+            f"2>{output_dir}/.hq-stderr",
+            "&",
+        ]
+    )
+    start_command = " ".join(start_command_lst)
+
+    echo.echo_debug(f"Run start command {start_command} on the remote")
+
+    # It requires to sleep a bit after the nohup see https://github.com/aiidateam/aiida-core/issues/6377
+    # This setup require aiida-core >= 2.5.2
+    retval, stdout, stderr = transport.exec_command_wait(
+        start_command,
+        timeout=0.1,
+    )
+
+    if retval != 0:
+        return "error", f"unable to start the server: {stderr}"
+
+    if journal is not None:
+        return "success", f"HQ server started with the journal {journal}!"
+
+    return "success", "HQ server started!"
+
+
+def stop_server(transport, server_dir: str = None) -> Result:
+    """Stop the HQ server on the computer of an open transport, if it is running."""
+    hq = get_hq_command(server_dir)
+    retval, _, _ = transport.exec_command_wait(f"{hq} server info")
+
+    if retval != 0:
+        return "info", "server is not running!"
+
+    echo.echo_info("Stop the hq server will close all allocs.")
+
+    retval, _, stderr = transport.exec_command_wait(f"{hq} server stop")
+
+    if retval != 0:
+        return "error", f"unable to stop the server: {stderr}"
+
+    return "success", "HQ server stopped!"
+
+
+def restart_server(
+    transport,
+    domain: str = None,
+    journal: str = None,
+    timeout: float = 30,
+    server_dir: str = None,
+) -> Result:
+    """Restart the HQ server on the computer of an open transport.
+
+    With a journal, the finished jobs are first pruned from it, so the new server restores the queued and running jobs
+    from a short journal.
+
+    :param timeout: maximum number of seconds to wait for the old server to shut down.
+    """
+    if journal is not None:
+        # Fails if the server is not running, in which case there is nothing to prune
+        transport.exec_command_wait(f"{get_hq_command(server_dir)} journal prune")
+
+    status, message = stop_server(transport, server_dir)
+    if status == "error":
+        return status, message
+
+    # The new server cannot start while the old one still holds the server directory and the journal
+    if not wait_for_server(transport, timeout, running=False, server_dir=server_dir):
+        return "error", f"server did not stop within {timeout} seconds."
+
+    return start_server(
+        transport, domain=domain, journal=journal, server_dir=server_dir
+    )
+
+
+def prune_journal(transport, server_dir: str = None) -> Result:
+    """Remove the finished jobs and disconnected workers from the journal of the HQ server."""
+    retval, _, stderr = transport.exec_command_wait(
+        f"{get_hq_command(server_dir)} journal prune"
+    )
+
+    if retval != 0:
+        return "error", f"unable to prune the journal: {stderr}"
+
+    return "success", "journal pruned!"
+
+
+def get_server_info(transport, summary: bool = False, server_dir: str = None) -> Result:
+    """Return the information on the HQ server on the computer of an open transport.
+
+    :param summary: only return the version, host and start date of the server on one line.
+    """
+    hq = get_hq_command(server_dir)
+    if not summary:
+        retval, stdout, stderr = transport.exec_command_wait(f"{hq} server info")
+    else:
+        retval, stdout, stderr = transport.exec_command_wait(
+            f"{hq} server info --output-mode json"
+        )
+
+    if retval != 0:
+        return (
+            "error",
+            f"cannot obtain HyperQueue server information: {stderr}\n"
+            "Try starting the server with `aiida-qe server start`.",
+        )
+
+    if summary:
+        info = json.loads(stdout)
+        stdout = (
+            f"hq {info.get('version', '?')} on {info.get('client_host', '?')}, "
+            f"started {info.get('start_date', '?')}"
+        )
+
+    return "output", stdout
+
+
+def wait_for_server(
+    transport, timeout: float, running: bool = True, server_dir: str = None
+) -> bool:
+    """Wait until the HQ server on the computer of an open transport responds.
+
+    :param timeout: maximum number of seconds to wait.
+    :param running: instead wait until the server no longer responds if ``False``.
+    :return: whether the server reached the state in time.
+    """
+    deadline = time.monotonic() + timeout
+
+    while True:
+        retval, _, _ = transport.exec_command_wait(
+            f"{get_hq_command(server_dir)} server info"
+        )
+        if (retval == 0) == running:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(1)
+
+
+def watch_server(
+    transport, computer, startup_timeout: float, server_dir: str = None
+) -> Result:
+    """Check the HQ server of a computer, and restart it if it is not running.
+
+    After a restart, the calculation jobs whose job the server lost are submitted again.
+
+    :param transport: an open transport to the computer.
+    :param startup_timeout: maximum number of seconds to wait for a restarted server to respond.
+    :param server_dir: the server directory of a shard, or ``None`` for the default server.
+    """
+    from ..watchdog import resubmit_lost_calcjobs
+
+    retval, _, _ = transport.exec_command_wait(
+        f"{get_hq_command(server_dir)} server info"
+    )
+    if retval == 0:
+        return "info", "server is running."
+
+    options = computer.get_property(SERVER_OPTIONS_PROPERTY, {})
+    status, message = start_server(transport, **options, server_dir=server_dir)
+    if status == "error":
+        return status, message
+
+    if not wait_for_server(transport, startup_timeout, server_dir=server_dir):
+        return (
+            "error",
+            f"server did not respond within {startup_timeout} seconds after the restart.",
+        )
+
+    lost, job_ids, mismatched = resubmit_lost_calcjobs(computer, transport, server_dir)
+    message = (
+        f"server restarted, submitted {len(job_ids)} of {len(lost)} lost jobs again."
+    )
+    if len(job_ids) < len(lost):
+        failed = ", ".join(
+            str(calcjob["pk"]) for calcjob in lost if calcjob["pk"] not in job_ids
+        )
+        message = f"{message} Failed calculation jobs: {failed}"
+        if mismatched:
+            jobs = ", ".join(
+                f"{job_id} (PK {pk})" for pk, job_id in sorted(mismatched.items())
+            )
+            message = f"{message}. Jobs submitted for calculation jobs that no longer wait for them: {jobs}"
+        return "error", message
+
+    return "success", message
+
+
 @server_group.command("start")
-@arguments.COMPUTER()
+@arguments.COMPUTERS()
+@options.ALL_COMPUTERS()
 @click.option(
     "-d",
     "--domain",
@@ -21,101 +302,213 @@ def server_group():
     type=click.STRING,
     help="domain that will attached to the `hostname` of remote.",
 )
-def cmd_start(computer, domain: str):
-    """Start the HyperQueue server."""
+@click.option(
+    "-j",
+    "--journal",
+    required=False,
+    type=click.STRING,
+    help="path of the journal on the remote, e.g. `$HOME/.hq-journal`. The jobs and allocation queues of a server that "
+    "is started with an existing journal are restored from it.",
+)
+def cmd_start(computers, all_computers, domain: str = None, journal: str = None):
+    """Start the HyperQueue server.
 
-    with computer.get_transport() as transport:
-        retval, _, _ = transport.exec_command_wait("hq server info")
+    The options of a server that was started are stored on the computer, so `aiida-hq server restart` and
+    `aiida-hq server watchdog` start the server again with the same options. On a computer with shards, the server of
+    every shard is started.
+    """
+    computers = get_computers(computers, all_computers)
+    options = {"domain": domain, "journal": journal}
 
-    if retval == 0:
-        echo.echo_info("server is already running!")
-        return
+    results = run_on_computers(
+        computers,
+        functools.partial(run_on_shards, operation=start_server),
+        kwargs=get_shard_kwargs(computers, **options),
+    )
+    # A server that was already running keeps the options that it was started with
+    for computer, (status, _) in zip(computers, results):
+        if status == "success":
+            computer.set_property(SERVER_OPTIONS_PROPERTY, options)
 
-    with computer.get_transport() as transport:
-        # Mostly the case needed by CSCS machines
-        # The hostname has not domain included, it requires with domain to connect login node from compute node
-        # We attach the domain name to the hostname manually and passed to the start command.
-
-        # start command
-        start_command_lst = ["nohup", "hq", "server", "start"]
-
-        if domain is not None:
-            retval, stdout, stderr = transport.exec_command_wait("hostname")
-            if retval != 0:
-                echo.echo_critical(f"unable to get the hostname: {stderr}")
-            else:
-                hostname = stdout.strip()
-                start_command_lst.extend(["--host", f"{hostname}.{domain}"])
-
-        start_command_lst.extend(
-            [
-                "1>$HOME/.hq-stdout",
-                "2>$HOME/.hq-stderr",
-                "&",
-            ]
-        )
-        start_command = " ".join(start_command_lst)
+    echo_results(computers, results, single=len(computers) == 1 and not all_computers)
 
-        echo.echo_debug(f"Run start command {start_command} on the remote")
 
-        # It requires to sleep a bit after the nohup see https://github.com/aiidateam/aiida-core/issues/6377
-        # This setup require aiida-core >= 2.5.2
-        retval, stdout, stderr = transport.exec_command_wait(
-            start_command,
-            timeout=0.1,
-        )
+@server_group.command("stop")
+@arguments.COMPUTERS()
+@options.ALL_COMPUTERS()
+def cmd_stop(computers, all_computers):
+    """Stop the HyperQueue server, or the servers of all shards."""
+    computers = get_computers(computers, all_computers)
+    results = run_on_computers(
+        computers,
+        functools.partial(run_on_shards, operation=stop_server),
+        kwargs=get_shard_kwargs(computers),
+    )
+    echo_results(computers, results, single=len(computers) == 1 and not all_computers)
 
-        if retval != 0:
-            echo.echo_critical(f"unable to start the server: {stderr}")
 
-    echo.echo_success("HQ server started!")
+@server_group.command("restart")
+@arguments.COMPUTERS()
+@options.ALL_COMPUTERS()
+def cmd_restart(computers, all_computers):
+    """Restart the HyperQueue server by stop and start again.
 
+    The server is started with the options of the last `aiida-hq server start`. If it was started with a journal, the
+    queued jobs are restored from it.
+    """
+    computers = get_computers(computers, all_computers)
+    kwargs = [
+        {
+            "server_dirs": get_server_dirs(computer),
+            **computer.get_property(SERVER_OPTIONS_PROPERTY, {}),
+        }
+        for computer in computers
+    ]
+    results = run_on_computers(
+        computers,
+        functools.partial(run_on_shards, operation=restart_server),
+        kwargs=kwargs,
+    )
+    echo_results(computers, results, single=len(computers) == 1 and not all_computers)
 
-@server_group.command("stop")
-@arguments.COMPUTER()
-def cmd_stop(computer):
-    """Start the HyperQueue server."""
 
-    with computer.get_transport() as transport:
-        retval, _, _ = transport.exec_command_wait("hq server info")
+@server_group.command("prune-journal")
+@arguments.COMPUTERS()
+@options.ALL_COMPUTERS()
+def cmd_prune_journal(computers, all_computers):
+    """Remove the finished jobs from the journal of the HyperQueue server.
 
-    if retval != 0:
-        echo.echo_info("server is not running!")
-        return
+    This keeps the journal, and thus the time to restore it on a restart, small.
+    """
+    computers = get_computers(computers, all_computers)
+    results = run_on_computers(
+        computers,
+        functools.partial(run_on_shards, operation=prune_journal),
+        kwargs=get_shard_kwargs(computers),
+    )
+    echo_results(computers, results, single=len(computers) == 1 and not all_computers)
 
-    echo.echo_info("Stop the hq server will close all allocs.")
 
-    with computer.get_transport() as transport:
-        retval, _, stderr = transport.exec_command_wait("hq server stop")
+@server_group.command("info")
+@arguments.COMPUTERS()
+@options.ALL_COMPUTERS()
+def cmd_info(computers, all_computers):
+    """Get information on the HyperQueue server, or the servers of all shards."""
+    computers = get_computers(computers, all_computers)
+    single = len(computers) == 1 and not all_computers
+    results = run_on_computers(
+        computers,
+        functools.partial(run_on_shards, operation=get_server_info),
+        kwargs=get_shard_kwargs(computers, summary=not single),
+    )
+    echo_results(computers, results, single)
 
-    if retval != 0:
-        echo.echo_critical(f"unable to stop the server: {stderr}")
 
-    echo.echo_success("HQ server stopped!")
+@server_group.command("watchdog")
+@arguments.COMPUTER()
+@click.option(
+    "-i",
+    "--interval",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help="Number of seconds between two checks of the server.",
+)
+@click.option(
+    "-t",
+    "--startup-timeout",
+    type=click.IntRange(min=1),
+    default=60,
+    show_default=True,
+    help="Maximum number of seconds to wait for a restarted server to respond.",
+)
+@click.option("--once", is_flag=True, help="Check the server once and exit.")
+def cmd_watchdog(computer, interval, startup_timeout, once):
+    """Keep the HyperQueue server running, restarting it when it stops responding.
 
+    The server is checked every `--interval` seconds over one connection to the computer. If it is not running, it is
+    started with the options of the last `aiida-hq server start`, and the active calculation jobs whose job the new
+    server does not know are submitted again in one round trip. On a computer with shards, the server of every shard is
+    checked. Stop the watchdog before stopping the server on purpose.
+    """
+    transport = None
 
-@server_group.command("restart")
-@arguments.COMPUTER()
-# TODO: how to pass domain to restart???
-@click.pass_context
-def cmd_restart(ctx, computer):
-    """Restart the HyperQueue server by stop and start again"""
-    ctx.forward(cmd_stop)
-    ctx.forward(cmd_start)
+    while True:
+        start = time.monotonic()
+        try:
+            if transport is None:
+                transport = computer.get_transport()
+                transport.open()
+            status, message = run_on_shards(
+                transport,
+                functools.partial(watch_server, computer=computer),
+                get_server_dirs(computer),
+                startup_timeout=startup_timeout,
+            )
+        except Exception as exception:
+            status, message = "error", f"{type(exception).__name__}: {exception}"
+            # The connection may be broken, open a new one for the next check
+            if transport is not None:
+                try:
+                    transport.close()
+                except Exception:
+                    pass
+                transport = None
 
+        if status == "success":
+            echo.echo_success(message)
+        elif status == "error":
+            echo.echo_warning(message)
+        else:
+            echo.echo_debug(message)
 
-@server_group.command("info")
+        if once:
+            break
+
+        time.sleep(max(interval - (time.monotonic() - start), 0))
+
+    if transport is not None:
+        transport.close()
+
+    if status == "error":
+        sys.exit(1)
+
+
+@server_group.command("shards")
 @arguments.COMPUTER()
-def cmd_info(computer):
-    """Get information on the HyperQueue server."""
+@click.argument("server_dirs", nargs=-1, type=click.STRING)
+@click.option(
+    "--reset", is_flag=True, help="Submit all jobs to the default server again."
+)
+def cmd_shards(computer, server_dirs, reset):
+    """Show or set the server directories of the HQ servers that the jobs of a computer are sharded over.
 
-    with computer.get_transport() as transport:
-        retval, stdout, stderr = transport.exec_command_wait("hq server info")
+    Each calculation job is submitted to the server of one shard, which is chosen by its pk. Jobs that were already
+    submitted stay on the server they were submitted to, so keep its server running until they are done.
+    """
+    from ..shards import SERVER_DIRS_PROPERTY
 
-    if retval != 0:
-        echo.echo_critical(
-            f"cannot obtain HyperQueue server information: {stderr}\n"
-            "Try starting the server with `aiida-qe server start`."
+    if reset:
+        computer.set_property(SERVER_DIRS_PROPERTY, None)
+        echo.echo_success(
+            f"Jobs of {computer.label} are submitted to the default server"
         )
+        return
+
+    if not server_dirs:
+        current = computer.get_property(SERVER_DIRS_PROPERTY, None)
+        if not current:
+            echo.echo(f"Jobs of {computer.label} are submitted to the default server")
+        for server_dir in current or []:
+            echo.echo(server_dir)
+        return
+
+    try:
+        server_dirs = [validate_server_dir(server_dir) for server_dir in server_dirs]
+    except ValueError as exception:
+        echo.echo_critical(str(exception))
 
-    echo.echo(stdout)
+    computer.set_property(SERVER_DIRS_PROPERTY, list(dict.fromkeys(server_dirs)))
+    echo.echo_success(
+        f"Jobs of {computer.label} are sharded over {len(set(server_dirs))} servers"
+    )
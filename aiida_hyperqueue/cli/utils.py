@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Utilities to run the CLI commands on several computers at once."""
+
+import concurrent.futures
+import sys
+import typing as t
+
+from aiida.cmdline.utils import echo
+
+# Maximum number of computers that are connected to at the same time
+MAX_CONCURRENT_COMPUTERS = 8
+
+# Result of an operation on a computer: a status, which is one of ``success``, ``info``, ``output`` or ``error``, and a
+# message
+Result = t.Tuple[str, str]
+
+
+def get_computers(computers: t.Sequence, all_computers: bool) -> list:
+    """Return the computers to run a command on.
+
+    :param computers: the computers passed on the command line.
+    :param all_computers: also include all computers that use the ``hyperqueue`` scheduler and are configured for the
+        current user.
+    """
+    from aiida import orm
+
+    computers = list(computers)
+
+    if all_computers:
+        for computer in orm.Computer.collection.find(
+            filters={"scheduler_type": "hyperqueue"}, order_by={"label": "asc"}
+        ):
+            if computer.is_configured and computer.pk not in [c.pk for c in computers]:
+                computers.append(computer)
+
+    if not computers:
+        echo.echo_critical(
+            "no computers to run on, pass one or more computers or use `--all`."
+        )
+
+    return computers
+
+
+def run_on_computers(
+    computers: t.Sequence,
+    operation: t.Callable[..., Result],
+    max_workers: int = MAX_CONCURRENT_COMPUTERS,
+    kwargs: t.Optional[t.Sequence[dict]] = None,
+) -> t.List[Result]:
+    """Run an operation on several computers concurrently, with one transport per computer.
+
+    The transports are created in the calling thread, since that needs the storage, and are only opened in the worker
+    threads. An exception raised by the operation is returned as an ``error`` result, so one unreachable computer does
+    not affect the others.
+
+    :param computers: the computers.
+    :param operation: callable that takes an open transport and returns a ``Result``.
+    :param kwargs: optional keyword arguments of the operation for each computer.
+    :return: the result of each computer, in the order of the computers.
+    """
+    transports = [computer.get_transport() for computer in computers]
+    kwargs = kwargs or [{}] * len(computers)
+
+    def run(transport, operation_kwargs) -> Result:
+        try:
+            with transport:
+                return operation(transport, **operation_kwargs)
+        except Exception as exception:
+            return "error", f"{type(exception).__name__}: {exception}"
+
+    if len(transports) == 1:
+        return [run(transports[0], kwargs[0])]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run, transports, kwargs))
+
+
+def echo_results(computers: t.Sequence, results: t.Sequence[Result], single: bool):
+    """Report the results of an operation on one or more computers.
+
+    For a single computer, the result is echoed as is and an error is critical. For several computers, the results are
+    shown in one table and the command exits with a non-zero exit code if any of them failed.
+    """
+    if single:
+        ((status, message),) = results
+        {
+            "success": echo.echo_success,
+            "info": echo.echo_info,
+            "output": echo.echo,
+            "error": echo.echo_critical,
+        }[status](message)
+        return
+
+    from tabulate import tabulate
+
+    rows = [
+        [computer.label, status, message.strip()]
+        for computer, (status, message) in zip(computers, results)
+    ]
+    echo.echo(tabulate(rows, headers=["Computer", "Status", "Message"]))
+
+    if any(status == "error" for status, _ in results):
+        sys.exit(1)
+
+
+def format_table(rows: t.Sequence[t.Sequence], headers: t.Sequence[str]) -> str:
+    """Return the rows as a table with left-aligned columns, in the layout of ``tabulate``.
+
+    Unlike ``tabulate``, this does not inspect the type of every cell, so it stays fast for tables with tens of
+    thousands of rows.
+    """
+    columns = [[str(header)] for header in headers]
+    for row in rows:
+        for column, cell in zip(columns, row):
+            column.append("" if cell is None else str(cell))
+
+    widths = [max(len(cell) for cell in column) for column in columns]
+    lines = [
+        "  ".join(cell.ljust(width) for cell, width in zip(cells, widths)).rstrip()
+        for cells in zip(*columns)
+    ]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+
+    return "\n".join(lines)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Prometheus exporter of the load of an HQ server.
+
+The metrics are served in the Prometheus text exposition format. They are taken from a single ``SAMPLE_COMMAND`` round
+trip to the computer, which is refreshed once per interval in the background, so any number of scrapes only cause one
+bulk query per interval.
+"""
+
+import http.server
+import math
+import threading
+import typing as t
+
+from aiida.common.log import AIIDA_LOGGER
+
+from .monitor import METRICS, parse_sample
+
+LOGGER = AIIDA_LOGGER.getChild("hyperqueue.exporter")
+
+_HELP = {
+    "up": "Whether the HQ server is running.",
+    "workers": "Number of connected workers.",
+    "cpus": "Number of cores of the connected workers.",
+    "jobs_waiting": "Number of jobs without running tasks.",
+    "jobs_running": "Number of jobs with running tasks.",
+    "tasks_waiting": "Number of waiting tasks.",
+    "tasks_running": "Number of running tasks.",
+    "queues": "Number of active allocation queues.",
+    "backlog": "Total backlog of the active allocation queues.",
+    "allocations_queued": "Number of allocations waiting in the queue of the job manager.",
+    "allocations_running": "Number of running allocations.",
+}
+
+_QUEUE_HELP = {
+    "backlog": "Backlog of the allocation queue.",
+    "allocations_queued": "Number of allocations of the queue waiting in the queue of the job manager.",
+    "allocations_running": "Number of running allocations of the queue.",
+}
+
+
+def _format_labels(labels: t.Dict[str, t.Any]) -> str:
+    """Return the labels of a metric sample in the exposition format."""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in labels.values()
+    )
+    return ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped))
+
+
+def _format_value(value: float) -> str:
+    return "NaN" if math.isnan(value) else repr(float(value))
+
+
+def format_metrics(data: t.Optional[dict], labels: t.Dict[str, str]) -> str:
+    """Return the metrics of the HQ server in the Prometheus text exposition format.
+
+    :param data: the parsed output of ``SAMPLE_COMMAND``, or ``None`` if the HQ server is not running.
+    :param labels: labels added to all samples, e.g. the computer.
+    """
+    lines = []
+    sample = parse_sample(data)
+
+    for metric in METRICS:
+        name = f"hyperqueue_{metric}"
+        lines.append(f"# HELP {name} {_HELP[metric]}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(
+            f"{name}{{{_format_labels(labels)}}} {_format_value(sample[metric])}"
+        )
+
+    if data is not None:
+        allocations = {counts["queue"]: counts for counts in data["allocations"]}
+        for metric, help_text in _QUEUE_HELP.items():
+            name = f"hyperqueue_queue_{metric}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for queue in data["queues"]:
+                counts = allocations.get(queue["id"], {"queued": 0, "running": 0})
+                value = {
+                    "backlog": queue.get("backlog") or 0,
+                    "allocations_queued": counts["queued"],
+                    "allocations_running": counts["running"],
+                }[metric]
+                queue_labels = {
+                    **labels,
+                    "queue": queue["id"],
+                    "name": queue.get("name") or "",
+                    "state": str(queue.get("state", "")).lower(),
+                }
+                lines.append(
+                    f"{name}{{{_format_labels(queue_labels)}}} {_format_value(value)}"
+                )
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsCache:
+    """Cache of the metrics of an HQ server, that is refreshed once per interval by a single background thread.
+
+    The scrapes only read the cached metrics, so the computer is never accessed from the threads of the HTTP server.
+
+    :param fetch: callable that returns the parsed output of ``SAMPLE_COMMAND``, or ``None`` if the server is not
+        running. It is only called by one thread at a time, if it raises the exception is logged and the server is
+        reported as not running.
+    :param labels: labels added to all samples.
+    :param interval: number of seconds between two refreshes of the metrics.
+    """
+
+    def __init__(
+        self,
+        fetch: t.Callable[[], t.Optional[dict]],
+        labels: t.Dict[str, str],
+        interval: float,
+    ):
+        self._fetch = fetch
+        self._labels = labels
+        self._interval = interval
+        self._text = format_metrics(None, labels)
+        self._stopped = threading.Event()
+        self._thread: t.Optional[threading.Thread] = None
+
+    def refresh(self) -> None:
+        """Fetch the metrics and replace the cached ones."""
+        try:
+            data = self._fetch()
+        except Exception as exception:
+            # A failed fetch is also cached, so an unreachable computer is only retried once per interval
+            LOGGER.warning(
+                f"unable to fetch the metrics of the HQ server: {exception!r}"
+            )
+            data = None
+
+        self._text = format_metrics(data, self._labels)
+
+    def start(self) -> None:
+        """Fetch the metrics, then keep refreshing them in a background thread once per interval."""
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop refreshing the metrics."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._interval):
+            self.refresh()
+
+    def get(self) -> str:
+        """Return the cached metrics."""
+        return self._text
+
+
+def get_server(host: str, port: int, cache: MetricsCache) -> http.server.HTTPServer:
+    """Return the HTTP server that serves the metrics of the cache on ``/metrics``."""
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+
+            body = cache.get().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            """Do not log every scrape to stderr."""
+
+    return http.server.ThreadingHTTPServer((host, port), MetricsHandler)
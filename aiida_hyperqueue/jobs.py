@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""Cross-referencing of the jobs of the HQ servers of a computer with the calculation jobs that submitted them.
+
+The jobs of all shards are listed in a single round trip, see ``get_job_list_command``. The name of the job of a
+calculation contains its pk, see ``HyperQueueScheduler._get_submit_script_header``, so the calculation jobs of any number
+of HQ jobs are found with one query on their pks, and a job only belongs to a calculation job if the job id of that
+calculation job is the id of the job.
+"""
+
+import json
+import typing as t
+
+from .priority import CALCJOB_NAME_REGEX, iter_called_calcjobs
+from .scheduler import get_profile_tag, split_job_name
+from .shards import get_hq_command, group_job_ids
+
+if t.TYPE_CHECKING:
+    from aiida.orm import Computer, ProcessNode
+
+# States of the tasks of an HQ job, a job is in the first of these states that any of its tasks is in
+JOB_STATES = ("running", "waiting", "failed", "canceled", "finished")
+
+# Maximum number of pks in one query, to stay below the limit on the number of parameters of SQLite
+_QUERY_BATCH_SIZE = 10000
+
+# Process states of calculation jobs that are done, whose job should not be on the HQ server anymore
+TERMINATED_PROCESS_STATES = ("finished", "excepted", "killed")
+
+# Process states of calculation jobs that may have a job on the HQ server
+ACTIVE_PROCESS_STATES = ("created", "waiting", "running")
+
+
+def get_job_list_command(
+    server_dirs: t.Sequence[t.Optional[str]], all_jobs: bool = False
+) -> str:
+    """Return the command that lists the jobs of the HQ servers of all shards as one compact JSON list.
+
+    Each job is listed as a list of its id, name and task statistics. The ids of jobs on a shard are extended with the
+    server directory of the shard, see ``aiida_hyperqueue.shards.split_job_id``.
+
+    :param server_dirs: the server directories of the shards, see ``aiida_hyperqueue.shards.get_server_dirs``.
+    :param all_jobs: also list the finished, failed and canceled jobs.
+    """
+    job_filter = "" if all_jobs else " --filter waiting,running"
+
+    commands = []
+    for server_dir in server_dirs:
+        job_id = ".id" if server_dir is None else f'"\\(.id)@{server_dir}"'
+        commands.append(
+            f"{get_hq_command(server_dir)} job list{job_filter} --output-mode json | "
+            f"jq -c '[.[] | [{job_id}, .name, .task_stats]]'"
+        )
+
+    if len(commands) == 1:
+        return commands[0]
+
+    return f"set -o pipefail; {{ {' && '.join(commands)}; }} | jq -c -s add"
+
+
+def parse_job_list(stdout: str) -> t.List[dict]:
+    """Return the jobs from the output of the command of ``get_job_list_command``.
+
+    :return: a dictionary for each job with its ``job_id``, ``name``, ``state`` and number of ``tasks``.
+    """
+    jobs = []
+    for job_id, name, task_stats in json.loads(stdout):
+        state = next(
+            (state for state in JOB_STATES if task_stats.get(state, 0) > 0), "unknown"
+        )
+        jobs.append(
+            {
+                "job_id": str(job_id),
+                "name": name,
+                "state": state,
+                "tasks": sum(task_stats.values()),
+            }
+        )
+
+    return jobs
+
+
+def get_job_pks(
+    jobs: t.Iterable[dict], profile_tag: t.Optional[str]
+) -> t.Dict[str, int]:
+    """Return the pk of the calculation job that each job was submitted for, according to its name.
+
+    Jobs that are tagged with another profile are skipped, since the pk in their name refers to another profile.
+
+    :param profile_tag: the tag of the loaded profile, see ``aiida_hyperqueue.scheduler.get_profile_tag``.
+    :return: the pk for the id of each job with the name of a calculation job.
+    """
+    pks = {}
+    for job in jobs:
+        tag, name = split_job_name(job["name"])
+        match = CALCJOB_NAME_REGEX.match(name)
+        if match is None or tag not in (None, profile_tag):
+            continue
+        pks[job["job_id"]] = int(match.group(1))
+
+    return pks
+
+
+def get_calcjobs(
+    pks: t.Iterable[int], computer: t.Optional["Computer"] = None
+) -> t.Dict[int, dict]:
+    """Return the calculation jobs with the given pks.
+
+    :param computer: only return the calculation jobs of this computer.
+
+    :return: for the pk of each calculation job that exists, its ``pk``, ``job_id``, ``process_state``,
+        ``process_label`` and ``label``.
+    """
+    from aiida import orm
+
+    pks = sorted(set(pks))
+
+    calcjobs = {}
+    for start in range(0, len(pks), _QUERY_BATCH_SIZE):
+        filters = {"id": {"in": pks[start : start + _QUERY_BATCH_SIZE]}}
+        if computer is not None:
+            filters["dbcomputer_id"] = computer.pk
+        builder = orm.QueryBuilder().append(
+            orm.CalcJobNode,
+            filters=filters,
+            project=[
+                "id",
+                "attributes.job_id",
+                "attributes.process_state",
+                "attributes.process_label",
+                "label",
+            ],
+        )
+        for pk, job_id, process_state, process_label, label in builder.iterall():
+            calcjobs[pk] = {
+                "pk": pk,
+                "job_id": None if job_id is None else str(job_id),
+                "process_state": process_state,
+                "process_label": process_label,
+                "label": label,
+            }
+
+    return calcjobs
+
+
+def get_job_calcjobs(computer: "Computer", jobs: t.Sequence[dict]) -> t.Dict[str, dict]:
+    """Return the calculation job of each job on the HQ servers of a computer.
+
+    :param jobs: the jobs, see ``parse_job_list``.
+    :return: for the id of each job that belongs to a calculation job, the calculation job, see ``get_calcjobs``.
+    """
+    job_pks = get_job_pks(jobs, get_profile_tag())
+    calcjobs = get_calcjobs(job_pks.values(), computer)
+
+    return {
+        job_id: calcjobs[pk]
+        for job_id, pk in job_pks.items()
+        if pk in calcjobs and calcjobs[pk]["job_id"] == job_id
+    }
+
+
+def get_orphaned_jobs(
+    jobs: t.Sequence[dict], calcjobs: t.Dict[int, dict], profile_tag: str
+) -> t.List[dict]:
+    """Return the jobs of calculation jobs that are done.
+
+    Only jobs whose name is tagged with the current profile are considered, since jobs without the tag may have been
+    submitted by another profile that shares the HQ server. Jobs of pks that are not in the database are never
+    considered orphaned, since it cannot be told whether the job belongs to a deleted calculation job or to a calculation
+    job of another installation with the same profile tag.
+
+    :param jobs: the waiting and running jobs, see ``parse_job_list``.
+    :param calcjobs: the calculation jobs of the pks of the jobs on any computer, see ``get_calcjobs``, since several
+        computers of the profile can share one HQ server.
+    :param profile_tag: the tag of the current profile, see ``aiida_hyperqueue.scheduler.get_profile_tag``.
+    :return: the orphaned jobs, with the pk of their calculation job.
+    """
+    orphans = []
+    for job in jobs:
+        tag, name = split_job_name(job["name"])
+        match = CALCJOB_NAME_REGEX.match(name)
+        if tag != profile_tag or match is None:
+            continue
+
+        pk = int(match.group(1))
+        calcjob = calcjobs.get(pk)
+        if (
+            calcjob is not None
+            and calcjob["process_state"] in TERMINATED_PROCESS_STATES
+        ):
+            orphans.append({**job, "pk": pk})
+
+    return orphans
+
+
+def format_job_ids(job_ids: t.Iterable[t.Union[int, str]]) -> str:
+    """Return the ids of jobs on one HQ server as an ``hq`` id selector, with consecutive ids as ranges, e.g. ``1-3,7``."""
+    ids = sorted({int(job_id) for job_id in job_ids})
+
+    ranges = []
+    for job_id in ids:
+        if ranges and ranges[-1][1] == job_id - 1:
+            ranges[-1][1] = job_id
+        else:
+            ranges.append([job_id, job_id])
+
+    return ",".join(
+        str(first) if first == last else f"{first}-{last}" for first, last in ranges
+    )
+
+
+def get_cancel_command(job_ids: t.Iterable[str]) -> str:
+    """Return the command that cancels the jobs with one ``hq job cancel`` per shard.
+
+    The command fails if the cancellation on any of the shards fails, but still cancels the jobs on all other shards.
+
+    :param job_ids: the job ids, that include the server directory of the shard of jobs on a shard.
+    """
+    commands = [
+        f"{get_hq_command(server_dir)} job cancel {format_job_ids(hq_job_ids)}"
+        for server_dir, hq_job_ids in group_job_ids(job_ids).items()
+    ]
+
+    return (
+        "retval=0; "
+        + "".join(f"{command} || retval=1; " for command in commands)
+        + "(exit $retval)"
+    )
+
+
+def get_descendant_calcjobs(process: "ProcessNode") -> t.Dict[int, t.List[str]]:
+    """Return the job ids of the active calculation jobs that a process called, directly or through its workflows.
+
+    The call tree is walked along the call links, see ``aiida_hyperqueue.priority.iter_called_calcjobs``.
+
+    :return: the job ids of the calculation jobs for the pk of each computer.
+    """
+    from aiida import orm
+
+    calcjobs = []
+    if isinstance(process, orm.CalcJobNode):
+        calcjobs.append(
+            (
+                process.get_job_id(),
+                process.base.attributes.get("process_state", None),
+                process.computer.pk,
+            )
+        )
+    if isinstance(process, orm.WorkflowNode):
+        calcjobs.extend(
+            iter_called_calcjobs(
+                [process.pk],
+                ["attributes.job_id", "attributes.process_state", "dbcomputer_id"],
+            )
+        )
+
+    job_ids: t.Dict[int, t.List[str]] = {}
+    for job_id, process_state, computer_pk in calcjobs:
+        if job_id is not None and process_state in ACTIVE_PROCESS_STATES:
+            job_ids.setdefault(computer_pk, []).append(str(job_id))
+
+    return job_ids
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""Time series of the load of an HQ server.
+
+A sample of the server, its workers, jobs and allocation queues is taken with a single round trip of
+``SAMPLE_COMMAND`` and reduced to the scalar ``METRICS`` by ``parse_sample``. The samples are kept in a ``MetricStore``,
+a fixed-size columnar ring buffer that is saved as a compressed NumPy archive, so weeks of samples take up little space
+and the oldest samples are dropped automatically.
+"""
+
+import os
+import pathlib
+import time
+import typing as t
+
+import numpy as np
+
+from .scheduler import parse_inventory
+
+# Fetches the server information, the workers, the task counts of the active jobs, the allocation queues and the number
+# of queued and running allocations of each queue. The command fails if the HQ server is not running.
+SAMPLE_COMMAND = (
+    "hq server info --output-mode json > /dev/null && jq -n "
+    '--argjson workers "$(hq worker list --output-mode json | '
+    "jq -c '[.[] | {configuration: {resources: .configuration.resources}}]')\" "
+    "--argjson jobs \"$(hq job list --filter waiting,running --output-mode json | jq -c '[.[].task_stats]')\" "
+    "--argjson queues \"$(hq alloc list --output-mode json | jq -c '[.[] | {id, name, state, backlog}]')\" "
+    "--argjson allocations \"$(for queue in $(hq alloc list --output-mode json | jq '.[].id'); do "
+    "hq alloc info $queue --output-mode json | jq -c --argjson queue $queue "
+    '\'{queue: $queue, queued: map(select(.status | ascii_downcase == "queued")) | length, '
+    'running: map(select(.status | ascii_downcase == "running")) | length}\'; done | jq -s -c .)" '
+    "'{workers: $workers, jobs: $jobs, queues: $queues, allocations: $allocations}'"
+)
+
+METRICS = (
+    "up",
+    "workers",
+    "cpus",
+    "jobs_waiting",
+    "jobs_running",
+    "tasks_waiting",
+    "tasks_running",
+    "queues",
+    "backlog",
+    "allocations_queued",
+    "allocations_running",
+)
+
+
+def parse_sample(data: t.Optional[dict]) -> t.Dict[str, float]:
+    """Return the metrics of a sample from the output of ``SAMPLE_COMMAND``.
+
+    :param data: the parsed output, or ``None`` if the command failed because the HQ server is not running.
+    :return: the value of each of the ``METRICS``, which are ``nan`` if the server is not running.
+    """
+    if data is None:
+        return {metric: 0.0 if metric == "up" else float("nan") for metric in METRICS}
+
+    inventory = parse_inventory(data["workers"], [])
+    active_queues = [
+        queue
+        for queue in data["queues"]
+        if str(queue.get("state", "")).lower() != "paused"
+    ]
+
+    return {
+        "up": 1.0,
+        "workers": float(len(inventory["shapes"])),
+        "cpus": float(sum(cpus or 0 for cpus, _ in inventory["shapes"])),
+        "jobs_waiting": float(
+            sum(1 for stats in data["jobs"] if not stats.get("running", 0))
+        ),
+        "jobs_running": float(
+            sum(1 for stats in data["jobs"] if stats.get("running", 0))
+        ),
+        "tasks_waiting": float(sum(stats.get("waiting", 0) for stats in data["jobs"])),
+        "tasks_running": float(sum(stats.get("running", 0) for stats in data["jobs"])),
+        "queues": float(len(active_queues)),
+        "backlog": float(sum(queue.get("backlog") or 0 for queue in active_queues)),
+        "allocations_queued": float(
+            sum(counts["queued"] for counts in data["allocations"])
+        ),
+        "allocations_running": float(
+            sum(counts["running"] for counts in data["allocations"])
+        ),
+    }
+
+
+class MetricStore:
+    """Fixed-size ring buffer of samples, with one column per metric.
+
+    Once the store is full, every new sample overwrites the oldest one, so the retention is the capacity times the
+    sampling interval.
+    """
+
+    def __init__(self, capacity: int, metrics: t.Sequence[str] = METRICS):
+        if capacity < 1:
+            raise ValueError(f"the capacity should be positive, got {capacity}")
+
+        self.metrics = tuple(metrics)
+        self._time = np.zeros(capacity, dtype=np.float64)
+        self._columns = {
+            metric: np.full(capacity, np.nan, dtype=np.float32)
+            for metric in self.metrics
+        }
+        self._head = 0
+        self._size = 0
+
+    @property
+    def capacity(self) -> int:
+        """Return the maximum number of samples in the store."""
+        return len(self._time)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, sample: t.Dict[str, float], timestamp: t.Optional[float] = None):
+        """Add a sample, overwriting the oldest one if the store is full.
+
+        :param sample: the value of each metric, metrics that are missing are stored as ``nan``.
+        :param timestamp: the time of the sample in seconds since the epoch, defaults to now.
+        """
+        self._time[self._head] = time.time() if timestamp is None else timestamp
+        for metric, column in self._columns.items():
+            column[self._head] = sample.get(metric, np.nan)
+
+        self._head = (self._head + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def _ordered(self, array: np.ndarray) -> np.ndarray:
+        """Return the stored part of a column, from the oldest to the newest sample."""
+        start = (self._head - self._size) % self.capacity
+        return np.roll(array, -start)[: self._size]
+
+    def query(
+        self,
+        start: t.Optional[float] = None,
+        end: t.Optional[float] = None,
+        metrics: t.Optional[t.Sequence[str]] = None,
+    ) -> t.Dict[str, np.ndarray]:
+        """Return the samples taken in a time range, from the oldest to the newest.
+
+        :param start: only return samples taken at or after this time in seconds since the epoch.
+        :param end: only return samples taken before this time in seconds since the epoch.
+        :param metrics: the metrics to return, defaults to all.
+        :return: a dictionary with the ``time`` of the samples and a column for each metric.
+        """
+        times = self._ordered(self._time)
+        mask = np.ones(len(times), dtype=bool)
+        if start is not None:
+            mask &= times >= start
+        if end is not None:
+            mask &= times < end
+
+        result = {"time": times[mask]}
+        for metric in metrics or self.metrics:
+            result[metric] = self._ordered(self._columns[metric])[mask]
+
+        return result
+
+    def save(self, path: t.Union[str, os.PathLike]):
+        """Write the store to a compressed NumPy archive, replacing the file atomically."""
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        samples = self.query()
+
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with tmp_path.open("wb") as handle:
+            np.savez_compressed(handle, capacity=self.capacity, **samples)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(
+        cls, path: t.Union[str, os.PathLike], capacity: t.Optional[int] = None
+    ) -> "MetricStore":
+        """Read a store that was written with ``save``.
+
+        :param capacity: the capacity of the returned store, defaults to that of the saved store. If it is smaller than
+            the number of saved samples, only the newest samples are kept.
+        """
+        with np.load(path) as archive:
+            saved = [name for name in archive.files if name not in ("time", "capacity")]
+            # Metrics that were added since the store was saved are ``nan`` for the saved samples
+            metrics = [*METRICS, *(name for name in saved if name not in METRICS)]
+            store = cls(capacity or int(archive["capacity"]), metrics)
+            times = archive["time"][-store.capacity :]
+            columns = {metric: archive[metric][-store.capacity :] for metric in saved}
+
+        for index, timestamp in enumerate(times):
+            store.append(
+                {metric: column[index] for metric, column in columns.items()},
+                float(timestamp),
+            )
+
+        return store
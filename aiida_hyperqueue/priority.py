@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""Policies that derive the HQ priority of a job from the calculation that submits it.
+
+HQ runs jobs with a higher priority first. A policy is enabled per computer by setting the ``PRIORITY_POLICY_PROPERTY``
+property, e.g. with ``aiida-hq priority policy``, and only applies to jobs without a priority set by the user.
+
+The available policies are:
+
+* ``workflow``: critical-path aware, deeper calculations of older workflows go first.
+* ``fairshare``: the recent usage of the computer is shared fairly between the AiiDA users.
+* ``fairshare-workflow``: the recent usage of the computer is shared fairly between the root workflows.
+"""
+
+import datetime
+import json
+import re
+import time
+import typing as t
+
+from aiida.common import timezone
+from aiida.manage import get_manager
+
+if t.TYPE_CHECKING:
+    from aiida.orm import CalcJobNode
+
+# Computer property that selects the priority policy of the jobs submitted to that computer
+PRIORITY_POLICY_PROPERTY = "hyperqueue_priority_policy"
+
+# The job name that ``CalcJob`` sets in the job template
+CALCJOB_NAME_REGEX = re.compile(r"^aiida-(\d+)$")
+
+# The priority of a job is made of a depth and an age part, the depth part always takes precedence
+_MAX_DEPTH = 10
+_MAX_AGE_HOURS = 99
+
+# Fair-share: the usage of the calculations that ran in this window determines the priority, which is at most the
+# maximum and halves for the reference usage
+FAIRSHARE_WINDOW = datetime.timedelta(hours=24)
+_MAX_FAIRSHARE_PRIORITY = 100
+FAIRSHARE_REFERENCE_CORE_HOURS = 100.0
+# The usage is queried at most once per this many seconds for each computer and owner
+_USAGE_CACHE_TTL = 300
+_usage_cache: t.Dict[tuple, t.Tuple[float, float]] = {}
+
+
+def get_calcjob_node(job_name: t.Optional[str]) -> t.Optional["CalcJobNode"]:
+    """Return the calculation job node that submits the job with the given name.
+
+    :param job_name: the name of the job, as set in the job template.
+    :return: the node or ``None`` if no profile is loaded or the name does not match a calculation job.
+    """
+    from aiida import orm
+
+    match = CALCJOB_NAME_REGEX.match(job_name or "")
+    if match is None or get_manager().get_profile() is None:
+        return None
+
+    try:
+        node = orm.load_node(int(match.group(1)))
+    except Exception:
+        return None
+
+    return node if isinstance(node, orm.CalcJobNode) else None
+
+
+def get_workflow_priority(node: "CalcJobNode") -> int:
+    """Return the priority of a calculation job from its place in the workflow tree.
+
+    Calculations deeper in the call stack of a workflow, which are typically on the critical path of a long workflow,
+    get a higher priority than calculations of shallow parameter sweeps. For the same depth, calculations of older
+    workflows go first, so workflows that started earlier also finish earlier.
+
+    :param node: the calculation job node.
+    :return: the HQ priority, a non-negative integer.
+    """
+    depth = 0
+    root = node
+    while root.caller is not None:
+        root = root.caller
+        depth += 1
+
+    age = timezone.now() - root.ctime
+    age_hours = int(age / datetime.timedelta(hours=1))
+
+    return min(depth, _MAX_DEPTH) * (_MAX_AGE_HOURS + 1) + min(
+        max(age_hours, 0), _MAX_AGE_HOURS
+    )
+
+
+def iter_called_calcjobs(
+    workflow_pks: t.Iterable[int], project: t.Sequence[str]
+) -> t.Iterator[list]:
+    """Yield the projections of the calculation jobs that workflows called, directly or through their sub-workflows.
+
+    The ``with_descendants`` relationship of the ``QueryBuilder`` only follows the links of the data provenance, not the
+    call links. The call tree is therefore walked one level at a time, with one query for all workflows of a level, so
+    the number of queries is the depth of the tree and not the number of its processes.
+
+    :param workflow_pks: the pks of the workflows.
+    :param project: the properties of the calculation jobs to project, e.g. ``attributes.job_id``.
+    """
+    from aiida import orm
+    from aiida.common.links import LinkType
+
+    parents = list(workflow_pks)
+    while parents:
+        builder = orm.QueryBuilder()
+        builder.append(orm.WorkflowNode, filters={"id": {"in": parents}}, tag="parent")
+        builder.append(
+            orm.ProcessNode,
+            with_incoming="parent",
+            edge_filters={
+                "type": {"in": [LinkType.CALL_CALC.value, LinkType.CALL_WORK.value]}
+            },
+            project=["id", "node_type", *project],
+        )
+        parents = []
+        for pk, node_type, *projections in builder.iterall():
+            if node_type.startswith("process.workflow."):
+                parents.append(pk)
+            elif node_type.startswith("process.calculation.calcjob."):
+                yield projections
+
+
+def get_calcjob_core_hours(
+    resources: t.Optional[dict],
+    last_job_info: t.Optional[dict],
+    detailed_job_info: t.Optional[dict],
+) -> float:
+    """Return the core-hours used by a calculation job from the time its job actually ran.
+
+    The run time is the wallclock time reported by the scheduler in the last job info or else, once the job is done, the
+    time between the start and the end of each task in the ``hq job info`` output of the detailed job info. The time the
+    job waited in the queue does not count, and neither does a job whose run time is not known yet.
+
+    :param resources: the ``resources`` attribute of the calculation job.
+    :param last_job_info: the ``last_job_info`` attribute of the calculation job.
+    :param detailed_job_info: the ``detailed_job_info`` attribute of the calculation job.
+    :return: the used core-hours.
+    """
+    # Imported here, since the utilities import the scheduler, which imports this module
+    from .utils import parse_time
+
+    num_cpus = (resources or {}).get("num_cpus") or 1
+
+    seconds = (last_job_info or {}).get("wallclock_time_seconds")
+    if seconds is not None:
+        return num_cpus * seconds / 3600
+
+    try:
+        hq_job_dicts = json.loads(detailed_job_info["stdout"])
+    except (TypeError, KeyError, ValueError):
+        return 0.0
+
+    if isinstance(hq_job_dicts, dict):
+        hq_job_dicts = [hq_job_dicts]
+
+    tasks = [
+        task for hq_job_dict in hq_job_dicts for task in hq_job_dict.get("tasks", [])
+    ]
+    task_seconds = 0.0
+    for task in tasks:
+        started = parse_time(task.get("started_at"))
+        finished = parse_time(task.get("finished_at"))
+        if started is not None and finished is not None:
+            task_seconds += (finished - started).total_seconds()
+
+    # The cores of a job with several tasks are divided evenly over its tasks
+    return num_cpus * task_seconds / max(len(tasks), 1) / 3600
+
+
+def get_core_hours(computer_pk: int, owner: t.Optional[dict] = None) -> float:
+    """Return the core-hours used by the calculations on a computer over the last ``FAIRSHARE_WINDOW``.
+
+    The usage of a calculation is its number of cores times the time its job ran, see ``get_calcjob_core_hours``.
+    Results are cached for ``_USAGE_CACHE_TTL`` seconds, since the usage is needed for every job that is submitted.
+
+    :param computer_pk: the pk of the computer.
+    :param owner: optional filters on the owner of the calculations: ``{'user': pk}`` or ``{'workflow': pk}`` for the
+        calculations called, directly or indirectly, by a root workflow.
+    :return: the used core-hours.
+    """
+    from aiida import orm
+
+    owner = owner or {}
+    cache_key = (computer_pk, *sorted(owner.items()))
+    cached = _usage_cache.get(cache_key)
+    if cached is not None and time.monotonic() - cached[0] < _USAGE_CACHE_TTL:
+        return cached[1]
+
+    since = timezone.now() - FAIRSHARE_WINDOW
+    project = [
+        "attributes.resources",
+        "attributes.last_job_info",
+        "attributes.detailed_job_info",
+    ]
+
+    if "workflow" in owner:
+        calcjobs = [
+            projections
+            for calcjob_computer_pk, mtime, *projections in iter_called_calcjobs(
+                [owner["workflow"]], ["dbcomputer_id", "mtime", *project]
+            )
+            if calcjob_computer_pk == computer_pk and mtime > since
+        ]
+    else:
+        filters = {"dbcomputer_id": computer_pk, "mtime": {">": since}}
+        if "user" in owner:
+            filters["user_id"] = owner["user"]
+        calcjobs = (
+            orm.QueryBuilder()
+            .append(orm.CalcJobNode, filters=filters, project=project)
+            .all()
+        )
+
+    core_hours = sum(get_calcjob_core_hours(*calcjob) for calcjob in calcjobs)
+
+    _usage_cache[cache_key] = (time.monotonic(), core_hours)
+
+    return core_hours
+
+
+def get_fairshare_priority(usage: float) -> int:
+    """Return the priority of a job from the recent usage of its owner.
+
+    The priority halves when the owner used ``FAIRSHARE_REFERENCE_CORE_HOURS`` and keeps decreasing with more usage.
+    Since it only depends on the usage of the owner itself, owners from different AiiDA profiles that share the same
+    HQ server are treated alike, even though each profile only knows about its own calculations.
+
+    :param usage: the core-hours recently used by the owner of the job.
+    :return: the HQ priority, a non-negative integer.
+    """
+    return round(_MAX_FAIRSHARE_PRIORITY / (1 + usage / FAIRSHARE_REFERENCE_CORE_HOURS))
+
+
+def get_user_fairshare_priority(node: "CalcJobNode") -> int:
+    """Return the fair-share priority of a calculation job from the recent usage of its AiiDA user."""
+    return get_fairshare_priority(
+        get_core_hours(node.computer.pk, {"user": node.user.pk})
+    )
+
+
+def get_workflow_fairshare_priority(node: "CalcJobNode") -> int:
+    """Return the fair-share priority of a calculation job from the recent usage of its root workflow."""
+    root = node
+    while root.caller is not None:
+        root = root.caller
+
+    if root is node:
+        # A calculation that is not part of a workflow has not used anything yet
+        return _MAX_FAIRSHARE_PRIORITY
+
+    return get_fairshare_priority(
+        get_core_hours(node.computer.pk, {"workflow": root.pk})
+    )
+
+
+_POLICIES: t.Dict[str, t.Callable[["CalcJobNode"], int]] = {
+    "workflow": get_workflow_priority,
+    "fairshare": get_user_fairshare_priority,
+    "fairshare-workflow": get_workflow_fairshare_priority,
+}
+
+
+def get_policy_priority(job_name: t.Optional[str]) -> t.Optional[int]:
+    """Return the priority of a job following the policy configured on the computer of its calculation.
+
+    :param job_name: the name of the job, as set in the job template.
+    :return: the priority or ``None`` if no policy is configured or the calculation cannot be found.
+    """
+    node = get_calcjob_node(job_name)
+    if node is None or node.computer is None:
+        return None
+
+    policy = node.computer.get_property(PRIORITY_POLICY_PROPERTY, None)
+    if policy not in _POLICIES:
+        return None
+
+    return _POLICIES[policy](node)
+
+
+def get_policies() -> t.List[str]:
+    """Return the names of the available priority policies."""
+    return list(_POLICIES)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""Efficiency report of the allocations that HQ submitted for its allocation queues.
+
+The report is computed from the JSON output of ``hq alloc info``, ``hq worker list --all`` and ``hq job info``, which
+is fetched in a single round trip with ``REPORT_COMMAND``. For each allocation queue it gives:
+
+* the start-up latency: the time an allocation waited in the Slurm queue before it started;
+* the utilization: the fraction of the lifetime of the workers of the queue that they spent running tasks;
+* the idle tail: the time a worker was still alive after its last task finished, until the allocation ended.
+"""
+
+import datetime
+import typing as t
+
+from .utils import parse_time
+
+# Fetches the queues with their allocations, all workers and the tasks of all jobs, only keeping the fields that are
+# needed for the report. The job information is passed through a file, since it can exceed the maximum argument length.
+REPORT_COMMAND = (
+    "jq -n "
+    "--argjson queues \"$(for queue in $(hq alloc list --output-mode json | jq '.[].id'); do "
+    'hq alloc info $queue --output-mode json | jq -c "{id: $queue, allocations: .}"; done | jq -s -c .)" '
+    '--argjson workers "$(hq worker list --all --output-mode json | '
+    "jq -c '[.[] | {id, started, ended, allocation}]')\" "
+    "--slurpfile tasks <(hq job info all --output-mode json | "
+    "jq -c '[.[].tasks[]? | {worker, workers, started_at, finished_at}]') "
+    "'{queues: $queues, workers: $workers, tasks: $tasks[0]}'"
+)
+
+
+def _get_task_workers(task: dict) -> t.List[int]:
+    """Return the ids of the workers that ran a task, which is a list for multi-node tasks."""
+    if task.get("workers"):
+        return list(task["workers"])
+    if task.get("worker") is not None:
+        return [task["worker"]]
+
+    return []
+
+
+def get_alloc_report(
+    queues: list,
+    workers: list,
+    tasks: list,
+    now: t.Optional[datetime.datetime] = None,
+) -> t.List[dict]:
+    """Return the efficiency of the allocations of each allocation queue.
+
+    :param queues: the allocation queues, each a dictionary with the queue ``id`` and its ``allocations`` as returned by
+        ``hq alloc info``.
+    :param workers: the workers as returned by ``hq worker list --all``.
+    :param tasks: the tasks of the jobs as returned by ``hq job info``.
+    :param now: the current time, used as the end of workers and allocations that are still running.
+    :return: a dictionary for each queue with the number of ``allocations``, the ``workers``, the mean ``latency`` and
+        ``idle_tail`` in seconds (``None`` if not known) and the ``utilization`` as a fraction (``None`` if not known).
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+
+    # Busy time and end of the last task of each worker
+    busy = {}
+    last_task = {}
+    for task in tasks:
+        started = parse_time(task.get("started_at"))
+        finished = parse_time(task.get("finished_at")) or now
+        if started is None:
+            continue
+        for worker_id in _get_task_workers(task):
+            busy[worker_id] = (
+                busy.get(worker_id, 0.0) + (finished - started).total_seconds()
+            )
+            last_task[worker_id] = max(last_task.get(worker_id, finished), finished)
+
+    workers_by_allocation = {}
+    for worker in workers:
+        allocation = worker.get("allocation") or {}
+        if allocation.get("id") is not None:
+            workers_by_allocation.setdefault(str(allocation["id"]), []).append(worker)
+
+    report = []
+    for queue in queues:
+        latencies = []
+        idle_tails = []
+        lifetime = 0.0
+        used = 0.0
+        worker_count = 0
+
+        for allocation in queue["allocations"]:
+            queued = parse_time(allocation.get("queue_time"))
+            started = parse_time(allocation.get("start_time"))
+            if queued is not None and started is not None:
+                latencies.append((started - queued).total_seconds())
+
+            for worker in workers_by_allocation.get(str(allocation["id"]), []):
+                worker_count += 1
+                worker_started = parse_time(worker.get("started"))
+                worker_ended = parse_time((worker.get("ended") or {}).get("at"))
+                if worker_started is None:
+                    continue
+                lifetime += ((worker_ended or now) - worker_started).total_seconds()
+                used += busy.get(worker["id"], 0.0)
+                if worker_ended is not None:
+                    idle_since = last_task.get(worker["id"], worker_started)
+                    idle_tails.append(
+                        max((worker_ended - idle_since).total_seconds(), 0.0)
+                    )
+
+        report.append(
+            {
+                "queue": queue["id"],
+                "allocations": len(queue["allocations"]),
+                "workers": worker_count,
+                "latency": sum(latencies) / len(latencies) if latencies else None,
+                "utilization": min(used / lifetime, 1.0) if lifetime else None,
+                "idle_tail": sum(idle_tails) / len(idle_tails) if idle_tails else None,
+            }
+        )
+
+    return report
@@ -9,13 +9,37 @@
 ###########################################################################
 """Plugin for the HyperQueue meta scheduler."""
 
+import copy
+import hashlib
 import json
+import re
+import time
 import typing as t
 import warnings
 
+from aiida.common.datastructures import CodeRunMode
+from aiida.common.escaping import escape_for_bash
 from aiida.common.extendeddicts import AttributeDict
 from aiida.schedulers import Scheduler, SchedulerError, BashCliScheduler
-from aiida.schedulers.datastructures import JobInfo, JobState, JobResource, JobTemplate
+from aiida.manage import get_manager
+from aiida.schedulers.datastructures import (
+    JobInfo,
+    JobState,
+    JobResource,
+    JobTemplate,
+    JobTemplateCodeInfo,
+)
+
+from .priority import CALCJOB_NAME_REGEX, get_policy_priority
+from .shards import (
+    SERVER_DIR_MARKER,
+    get_hq_command,
+    get_shard,
+    get_workdir_shard,
+    group_job_ids,
+    join_job_id,
+    split_job_id,
+)
 
 # Mapping of HyperQueue states to AiiDA `JobState`s
 _MAP_STATUS_HYPERQUEUE = {
@@ -26,6 +50,121 @@ _MAP_STATUS_HYPERQUEUE = {
     "FINISHED": JobState.DONE,
 }
 
+# Name of the archive the job epilogue packs the files to be retrieved into, see the `retrieve_archive` resource
+RETRIEVE_ARCHIVE_NAME = "_aiida_hq_retrieve.tar.gz"
+
+# A glob pattern of the `retrieve_archive` resource, that cannot be an option of `tar` or contain shell syntax
+_RETRIEVE_PATTERN_REGEX = re.compile(r"^[\w.*?\[\]][\w.*?\[\]/-]*$")
+
+# Line written to the scheduler stderr by a task that was restarted by HQ, see the `crash_limit` resource
+_ATTEMPT_MARKER = "aiida-hq: attempt"
+_ATTEMPT_REGEX = re.compile(rf"^{_ATTEMPT_MARKER} (\d+)$", re.MULTILINE)
+
+# Error of a task that HQ failed because the workers running it were lost more often than its crash limit, e.g.
+# "Task was running on a worker that was lost; the task has occurred 1 times in this situation and limit was reached."
+_CRASH_LIMIT_REGEX = re.compile(r"worker that was lost.*limit was reached")
+
+# Name of a custom HQ resource, see the `locality` resource
+_RESOURCE_NAME_REGEX = re.compile(r"^[\w-]+$")
+
+# Files in the working directory that mark the tasks of a job that have finished, see `_get_epilogue`
+_TASK_DONE_MARKER = ".aiida-hq-task-done"
+
+# Directory created by the task that runs the epilogue of a job, which only one task can create
+_EPILOGUE_LOCK = ".aiida-hq-epilogue"
+
+# File in the working directory of a calculation that records the output of its `hq submit`, see `submit_job`
+SUBMIT_RECORD_NAME = ".aiida-hq-submit.json"
+
+# File in the working directory of a calculation that exists while an `hq submit` may have reached the server without
+# its output being recorded, see `submit_job`
+SUBMIT_PENDING_NAME = ".aiida-hq-submit.pending"
+
+# Exported variables that are specific to a job or the shell and should not be restored from an environment snapshot
+_ENV_SNAPSHOT_EXCLUDE = "HQ_*|SLURM_*|PWD|OLDPWD|SHLVL|_"
+
+# Seconds for which the inventory of the workers and allocation queues of an HQ server is reused
+_INVENTORY_TTL = 60
+
+# Maximum length of the name of an HQ job, longer names make `hq submit` fail
+MAX_JOB_NAME_LENGTH = 40
+
+# Number of characters of the profile name in the profile tag, so the tagged job name of a calculation with a pk of up
+# to 10 digits stays within `MAX_JOB_NAME_LENGTH`, see `get_profile_tag`
+_TAG_NAME_LENGTH = 10
+
+# A job name of a calculation job that is tagged with the AiiDA profile that submitted it, see `get_profile_tag`
+_TAGGED_NAME_REGEX = re.compile(r"^(?P<tag>[\w.-]+)/(?P<name>aiida-\d+)$")
+
+
+def _get_resource_amount(kind: dict) -> t.Optional[int]:
+    """Return the amount of a resource from its description in the ``hq worker list`` JSON output.
+
+    :return: the amount or ``None`` if the kind of resource is not known.
+    """
+    if "List" in kind:
+        return len(kind["List"]["values"])
+    if "Groups" in kind:
+        return sum(len(group) for group in kind["Groups"]["groups"])
+    if "Range" in kind:
+        return kind["Range"]["end"] - kind["Range"]["start"] + 1
+    if "Sum" in kind:
+        return kind["Sum"]["size"]
+
+    return None
+
+
+def parse_inventory(workers: list, queues: list) -> dict:
+    """Return the inventory of an HQ server from the JSON output of ``hq worker list`` and ``hq alloc list``.
+
+    :return: dictionary with the ``shapes`` of the running workers, as a list of the number of cpus and memory in MB
+        (``None`` if not known) of each worker, the names of the other ``resources`` that any of the workers provides,
+        and the number of allocation ``queues`` that can start new workers.
+    """
+    shapes = []
+    resources = set()
+    for worker in workers:
+        amounts = {"cpus": None, "mem": None}
+        for resource in worker["configuration"]["resources"]["resources"]:
+            if resource["name"] in amounts:
+                amounts[resource["name"]] = _get_resource_amount(resource["kind"])
+            else:
+                resources.add(resource["name"])
+        shapes.append((amounts["cpus"], amounts["mem"]))
+
+    return {"shapes": shapes, "resources": sorted(resources), "queues": len(queues)}
+
+
+def get_profile_tag() -> t.Optional[str]:
+    """Return the tag of the loaded AiiDA profile, that prefixes the names of the HQ jobs of its calculations.
+
+    The job name of a calculation contains its pk, which is only unique within a profile. The tag makes it possible to
+    tell apart the jobs of different profiles, or users, that share one HQ server. Since the profiles of different
+    users can have the same name, the name of the profile is followed by the start of its UUID. The name is truncated,
+    since HQ limits the length of job names to ``MAX_JOB_NAME_LENGTH``.
+
+    :return: the tag or ``None`` if no profile is loaded.
+    """
+    profile = get_manager().get_profile()
+    if profile is None:
+        return None
+
+    name = re.sub(r"[^\w.-]", "_", profile.name)[:_TAG_NAME_LENGTH]
+
+    return f"{name}.{profile.uuid.replace('-', '')[:12]}"
+
+
+def split_job_name(name: str) -> t.Tuple[t.Optional[str], str]:
+    """Split the name of an HQ job in the profile tag and the job name of the calculation.
+
+    :return: tuple of the tag, or ``None`` if the name is not tagged, and the job name without the tag.
+    """
+    match = _TAGGED_NAME_REGEX.match(name)
+    if match is None:
+        return None, name
+
+    return match.group("tag"), match.group("name")
+
 
 class AiiDAHypereQueueDeprecationWarning(Warning):
     """Class for HypereQueue plugin deprecations."""
@@ -34,7 +173,14 @@ class AiiDAHypereQueueDeprecationWarning(Warning):
 class HyperQueueJobResource(JobResource):
     """Class for HyperQueue job resources."""
 
-    _default_fields = ("num_cpus", "memory_mb")
+    _default_fields = (
+        "num_cpus",
+        "memory_mb",
+        "retrieve_archive",
+        "crash_limit",
+        "locality",
+        "cache_environment",
+    )
 
     _features = {
         "can_query_by_user": False,
@@ -94,6 +240,52 @@ class HyperQueueJobResource(JobResource):
             if not isinstance(resources.memory_mb, int):
                 raise ValueError("`memory_mb` must be an integer")
 
+        # Glob patterns of the files that the job epilogue packs into a single compressed archive on the remote, so
+        # they can be retrieved in one transfer instead of one by one.
+        resources.retrieve_archive = kwargs.pop("retrieve_archive", None)
+        if resources.retrieve_archive is not None:
+            if isinstance(resources.retrieve_archive, str) or not all(
+                isinstance(pattern, str) for pattern in resources.retrieve_archive
+            ):
+                raise ValueError("`retrieve_archive` must be a list of strings")
+            resources.retrieve_archive = list(resources.retrieve_archive)
+            # The patterns are expanded by the shell of the job, so they cannot be quoted
+            for pattern in resources.retrieve_archive:
+                if not _RETRIEVE_PATTERN_REGEX.match(pattern):
+                    raise ValueError(
+                        f"invalid `retrieve_archive` pattern `{pattern}`: it must be a relative glob pattern of "
+                        "letters, digits and `_.-/*?[]`"
+                    )
+
+        # Number of lost workers after which HQ fails the task: HQ restarts the task on another worker when the worker
+        # running it is lost, until the Nth worker is lost. A limit of 1 fails the task on the first lost worker.
+        resources.crash_limit = kwargs.pop("crash_limit", None)
+        if resources.crash_limit is not None:
+            if not isinstance(resources.crash_limit, int) or resources.crash_limit < 1:
+                raise ValueError(
+                    "`crash_limit` must be a positive integer, the number of lost workers after which the task fails, "
+                    "so 1 means that the task is not restarted"
+                )
+
+        # Name of a custom HQ resource advertised by the workers that hold the data the job needs on a local disk, e.g.
+        # the scratch of a parent calculation. The job requests one unit of the resource, so it is only placed on those
+        # workers, but not necessarily on the worker that ran the parent calculation.
+        resources.locality = kwargs.pop("locality", None)
+        if resources.locality is not None:
+            if not isinstance(
+                resources.locality, str
+            ) or not _RESOURCE_NAME_REGEX.match(resources.locality):
+                raise ValueError("`locality` must be the name of an HQ resource")
+            if resources.locality in ("cpus", "mem"):
+                raise ValueError(
+                    f"`locality` cannot be `{resources.locality}`, which is reserved for the resources of the job"
+                )
+
+        # Resolve the environment set up by the prepend text once per worker and source the snapshot afterwards.
+        resources.cache_environment = kwargs.pop("cache_environment", False)
+        if not isinstance(resources.cache_environment, bool):
+            raise ValueError("`cache_environment` must be a boolean")
+
         return resources
 
     @classmethod
@@ -119,6 +311,9 @@ class HyperQueueScheduler(BashCliScheduler):
     # The class to be used for the job resource.
     _job_resource_class = HyperQueueJobResource
 
+    # Inventory of the HQ server of each host and shard with the time it was taken, shared by all instances
+    _inventories: t.Dict[t.Tuple[str, t.Optional[str]], t.Tuple[float, dict]] = {}
+
     def _get_submit_script_header(self, job_tmpl: JobTemplate) -> str:
         """Return the submit script header, using the parameters from the
         job_tmpl.
@@ -129,14 +324,41 @@ class HyperQueueScheduler(BashCliScheduler):
         hq_options = []
         prefix = "#HQ"
 
+        # Codes that run in parallel are submitted as one HQ task per code, see `_get_run_line`
+        num_tasks = self._get_num_tasks(job_tmpl.codes_info, job_tmpl.codes_run_mode)
+        # Each task writes its own scheduler output, otherwise the tasks would overwrite each other's files. The files
+        # are merged into the scheduler output of the calculation when all tasks are done, see `_get_epilogue`.
+        output_suffix = ".%{TASK_ID}" if num_tasks > 1 else ""
+
         if job_tmpl.job_name:
-            hq_options.append(f'{prefix} --name="{job_tmpl.job_name}"')
+            job_name = job_tmpl.job_name
+            profile_tag = get_profile_tag()
+            tagged_name = f"{profile_tag}/{job_name}"
+            if (
+                profile_tag
+                and CALCJOB_NAME_REGEX.match(job_name)
+                and len(tagged_name) <= MAX_JOB_NAME_LENGTH
+            ):
+                job_name = tagged_name
+            hq_options.append(f'{prefix} --name="{job_name}"')
+
+        # The job is submitted to the HQ server of this shard, see `submit_job`
+        server_dir = get_shard(job_tmpl.job_name)
+        if server_dir is not None:
+            hq_options.append(f"{SERVER_DIR_MARKER} {server_dir}")
+
+        if num_tasks > 1:
+            hq_options.append(f"{prefix} --array=0-{num_tasks - 1}")
 
         if job_tmpl.sched_output_path:
-            hq_options.append(f"{prefix} --stdout={job_tmpl.sched_output_path}")
+            hq_options.append(
+                f"{prefix} --stdout={job_tmpl.sched_output_path}{output_suffix}"
+            )
 
         if job_tmpl.sched_error_path:
-            hq_options.append(f"{prefix} --stderr={job_tmpl.sched_error_path}")
+            hq_options.append(
+                f"{prefix} --stderr={job_tmpl.sched_error_path}{output_suffix}"
+            )
 
         if job_tmpl.max_wallclock_seconds:
             # `--time-request` will only let the HQ job start on the worker in case there is still enough time available
@@ -152,19 +374,345 @@ class HyperQueueScheduler(BashCliScheduler):
                 f"{prefix} --time-limit={job_tmpl.max_wallclock_seconds}s"
             )
 
-        if job_tmpl.priority:
-            # HQ jobs can be assigned priority, where jobs with a higher priority will be executed first. The default
-            # priority is 0.
-            hq_options.append(f"{prefix} --priority={job_tmpl.priority}")
+        # HQ jobs can be assigned priority, where jobs with a higher priority will be executed first. The default
+        # priority is 0. Without a priority set by the user, it is derived from the policy configured on the computer.
+        priority = job_tmpl.priority or get_policy_priority(job_tmpl.job_name)
+        if priority:
+            hq_options.append(f"{prefix} --priority={priority}")
 
-        hq_options.append(f"{prefix} --cpus={job_tmpl.job_resource.num_cpus}")
+        # The resources of the job are divided evenly over its tasks, so each task releases its share when it is done
+        num_cpus, remainder = divmod(job_tmpl.job_resource.num_cpus, num_tasks)
+        if num_cpus < 1 or remainder:
+            raise SchedulerError(
+                f"`num_cpus` must be a multiple of the number of codes run in parallel ({num_tasks})"
+            )
+        hq_options.append(f"{prefix} --cpus={num_cpus}")
 
         mem = job_tmpl.job_resource.memory_mb
         if mem is not None:
-            hq_options.append(f"{prefix} --resource mem={mem}")
+            hq_options.append(f"{prefix} --resource mem={mem // num_tasks}")
+
+        locality = job_tmpl.job_resource.get("locality")
+        if locality is not None:
+            # A plain resource constraint: HQ has no soft placement preferences or affinity to the worker of another job
+            hq_options.append(f"{prefix} --resource {locality}=1")
+
+        crash_limit = job_tmpl.job_resource.get("crash_limit")
+        if crash_limit is not None:
+            # HQ restarts the task when the worker running it is lost, instead of failing the job and leaving it to
+            # AiiDA to resubmit the whole calculation, until `crash_limit` workers were lost. A restarted task gets an incremented `HQ_INSTANCE_ID`, which is
+            # written to the scheduler stderr so the number of attempts can be reported in `parse_output`.
+            hq_options.append(f"{prefix} --crash-limit={crash_limit}")
+            hq_options.append(
+                f'if [ "${{HQ_INSTANCE_ID:-0}}" -gt 0 ]; then echo "{_ATTEMPT_MARKER} $((HQ_INSTANCE_ID + 1))" >&2; fi'
+            )
 
         return "\n".join(hq_options)
 
+    def get_submit_script(self, job_tmpl: JobTemplate) -> str:
+        """Return the submit script as a string.
+
+        If ``cache_environment`` is set in the resources, the prepend text is wrapped so it only runs once per worker,
+        see ``_get_cached_prepend_text``. The append text is extended with the epilogue of the job, see
+        ``_get_epilogue``.
+
+        :parameter job_tmpl: a `aiida.schedulers.datastrutures.JobTemplate` instance.
+        """
+        job_tmpl = copy.copy(job_tmpl)
+        if job_tmpl.prepend_text and job_tmpl.job_resource.get("cache_environment"):
+            job_tmpl.prepend_text = self._get_cached_prepend_text(job_tmpl.prepend_text)
+        job_tmpl.append_text = self._get_epilogue(job_tmpl)
+
+        return super().get_submit_script(job_tmpl)
+
+    def _get_epilogue(self, job_tmpl: JobTemplate) -> t.Optional[str]:
+        """Return the lines that run after the run line: the append text, followed by the epilogue of the job.
+
+        If ``retrieve_archive`` is set in the resources, the matching files are packed into the
+        ``RETRIEVE_ARCHIVE_NAME`` archive on the compute node. The exit code of the calculation is recorded directly
+        after the run line, before the append text runs, and is the exit code of the script, so the state of the HQ job
+        is not affected by the append text or the packing.
+
+        For codes that run in parallel, see ``_get_run_line``, every task marks itself as done and the last task to
+        finish runs the epilogue once for the whole job: it merges the scheduler output of the tasks into the scheduler
+        output files of the calculation, then runs the append text and packs the files to be retrieved. The markers are
+        unique to the HQ job, so a job that is submitted again in the same working directory starts from scratch.
+        """
+        num_tasks = self._get_num_tasks(job_tmpl.codes_info, job_tmpl.codes_run_mode)
+        patterns = job_tmpl.job_resource.get("retrieve_archive")
+
+        final_lines = []
+        if num_tasks > 1:
+            for path in (job_tmpl.sched_output_path, job_tmpl.sched_error_path):
+                if path:
+                    task_paths = " ".join(
+                        f"{path}.{task_id}" for task_id in range(num_tasks)
+                    )
+                    final_lines.append(f"cat {task_paths} > {path} 2>/dev/null")
+        if job_tmpl.append_text:
+            final_lines.append(job_tmpl.append_text)
+        if patterns:
+            final_lines.append(
+                f"tar -czf {RETRIEVE_ARCHIVE_NAME} --ignore-failed-read {' '.join(patterns)} 2>/dev/null"
+            )
+
+        if not final_lines or (num_tasks == 1 and not patterns):
+            return job_tmpl.append_text
+
+        lines = ["_aiida_hq_exit_code=$?"]
+        if num_tasks > 1:
+            lines.extend(
+                [
+                    f'touch "{_TASK_DONE_MARKER}.$HQ_JOB_ID.$HQ_TASK_ID"',
+                    f'if [ "$(ls {_TASK_DONE_MARKER}.$HQ_JOB_ID.* | wc -l)" -eq {num_tasks} ] '
+                    f'&& mkdir "{_EPILOGUE_LOCK}.$HQ_JOB_ID" 2>/dev/null; then',
+                    *final_lines,
+                    "fi",
+                ]
+            )
+        else:
+            lines.extend(final_lines)
+        lines.append("exit $_aiida_hq_exit_code")
+
+        return "\n".join(lines)
+
+    @staticmethod
+    def _get_cached_prepend_text(prepend_text: str) -> str:
+        """Return the prepend text wrapped to snapshot the environment it sets up on the first run on a worker.
+
+        Loading modules or activating environments can take several seconds, which is a lot for short jobs. The first
+        job on a worker runs the prepend text and writes the exported variables it changed to a snapshot in node-local
+        storage, i.e. ``$AIIDA_HQ_ENV_CACHE_DIR`` or else a directory of the user in ``$TMPDIR`` or ``/tmp``. Later jobs
+        with the same prepend text source the snapshot instead. Note that only exported variables are restored, so the
+        prepend text should not rely on side effects such as shell functions or aliases.
+
+        The directory is only accessible to the user and a snapshot is only sourced if the user owns both, so other
+        users cannot inject code. Each variable is written with ``declare -p``, which quotes values that span several
+        lines, and the snapshot is moved into place once complete, so a job never sources a partial snapshot.
+        """
+        key = hashlib.sha256(prepend_text.encode()).hexdigest()[:16]
+
+        return "\n".join(
+            [
+                '_aiida_hq_env_dir="${AIIDA_HQ_ENV_CACHE_DIR:-${TMPDIR:-/tmp}/aiida-hq-env-$(id -u)}"',
+                'mkdir -p -m 700 "$_aiida_hq_env_dir" 2>/dev/null',
+                f'_aiida_hq_env_cache="$_aiida_hq_env_dir/{key}.sh"',
+                'if [ -O "$_aiida_hq_env_dir" ] && [ -f "$_aiida_hq_env_cache" ] && [ -O "$_aiida_hq_env_cache" ]; then',
+                'source "$_aiida_hq_env_cache"',
+                "else",
+                "declare -A _aiida_hq_env_before",
+                'for _aiida_hq_name in $(compgen -e); do _aiida_hq_env_before[$_aiida_hq_name]="${!_aiida_hq_name}"; done',
+                prepend_text,
+                'if [ -O "$_aiida_hq_env_dir" ] && _aiida_hq_env_tmp="$(mktemp "$_aiida_hq_env_dir/.XXXXXX")"; then',
+                "for _aiida_hq_name in $(compgen -e); do",
+                f'case "$_aiida_hq_name" in {_ENV_SNAPSHOT_EXCLUDE}) continue ;; esac',
+                'if [ "${_aiida_hq_env_before[$_aiida_hq_name]+set}" != set ] '
+                '|| [ "${_aiida_hq_env_before[$_aiida_hq_name]}" != "${!_aiida_hq_name}" ]; then',
+                'declare -p "$_aiida_hq_name"',
+                "fi",
+                'done > "$_aiida_hq_env_tmp" && mv -f "$_aiida_hq_env_tmp" "$_aiida_hq_env_cache"',
+                "fi",
+                "fi",
+            ]
+        )
+
+    @staticmethod
+    def _get_num_tasks(
+        codes_info: t.List[JobTemplateCodeInfo], codes_run_mode: CodeRunMode
+    ) -> int:
+        """Return the number of HQ tasks the job is split into: one per code if the codes run in parallel."""
+        if codes_run_mode == CodeRunMode.PARALLEL and len(codes_info) > 1:
+            return len(codes_info)
+
+        return 1
+
+    def _get_run_line(
+        self, codes_info: t.List[JobTemplateCodeInfo], codes_run_mode: CodeRunMode
+    ) -> str:
+        """Return the string with the lines to run the codes.
+
+        Codes that run in parallel are not put in the background of a single task that holds the resources for all of
+        them until the last one is done. Instead, the job is submitted as an array with one task per code, and each
+        task runs the code that matches its ``HQ_TASK_ID``.
+        """
+        if self._get_num_tasks(codes_info, codes_run_mode) == 1:
+            return super()._get_run_line(codes_info, codes_run_mode)
+
+        run_lines = ['case "$HQ_TASK_ID" in']
+        for task_id, code_info in enumerate(codes_info):
+            run_line = super()._get_run_line([code_info], CodeRunMode.SERIAL)
+            run_lines.extend([f"{task_id})", run_line, ";;"])
+        run_lines.append("esac")
+
+        return "\n".join(run_lines)
+
+    def submit_job(self, working_directory: str, filename: str) -> str:
+        """Submit a job, or adopt the HQ job that was already submitted for it.
+
+        If the connection drops after ``hq submit`` reached the server but before its output was received, AiiDA
+        retries the submission. To not run the same calculation twice, the output of ``hq submit`` is recorded in the
+        ``SUBMIT_RECORD_NAME`` file in the working directory, which is unique to the calculation since it is derived
+        from its UUID. A retry returns the recorded job id instead of submitting again.
+
+        If ``hq submit`` itself was killed, e.g. by a SIGHUP when the connection dropped, the server may have accepted
+        the job before its output was recorded. This is marked by the ``SUBMIT_PENDING_NAME`` file, that is only
+        removed once the output is recorded. A retry without a record then first looks up the job on the server by its
+        name, which is unique if it is tagged with the profile, see ``get_profile_tag``, and adopts it if it is found.
+
+        If the submit script records a shard, see ``aiida_hyperqueue.shards``, the job is submitted to the HQ server of
+        that shard and its server directory is added to the record. The feasibility check uses the inventory of the
+        shard of the calculation job and is skipped if the submit script records another shard.
+
+        :param working_directory: The absolute filepath to the working directory where the job is to be executed.
+        :param filename: The filename of the submission script relative to the working directory.
+        """
+        submit_script = escape_for_bash(filename)
+        submit_command = self._get_submit_command(submit_script)
+        server_dir = get_workdir_shard(working_directory)
+        record = SUBMIT_RECORD_NAME
+
+        shard = (
+            f"server_dir=$(sed -n 's|^{SERVER_DIR_MARKER} ||p' {submit_script} 2>/dev/null); "
+            '[ -z "$server_dir" ] || export HQ_SERVER_DIR="$server_dir"; '
+        )
+        add_shard_to_record = (
+            f'[ $retval -ne 0 ] || [ -z "$server_dir" ] || '
+            f"""{{ jq -c --arg server_dir "$server_dir" '. + {{server_dir: $server_dir}}' {record} > {record}.tmp """
+            f"&& mv {record}.tmp {record}; }}; "
+        )
+        pending = SUBMIT_PENDING_NAME
+        find_submitted_job = (
+            f"""[ -e {pending} ] && name=$(sed -n 's/^#HQ --name="\\(.*\\)"$/\\1/p' {submit_script}) && """
+            'case "$name" in */aiida-*) true ;; *) false ;; esac && '
+            "hq job list --all --output-mode json | "
+            f"""jq -ce --arg name "$name" 'map(select(.name == $name)) | last | select(. != null) | {{id}}' > {record}"""
+        )
+        command = (
+            f"{shard}"
+            f"""if grep -qs '"id"' {record}; then cat {record}; """
+            f"elif {find_submitted_job}; then retval=0; {add_shard_to_record}rm -f {pending}; cat {record}; "
+            f"else {self._get_feasibility_check(submit_script, server_dir)}"
+            f"touch {pending}; {submit_command} > {record}; retval=$?; {add_shard_to_record}cat {record}; "
+            f"if [ $retval -eq 0 ]; then rm -f {pending}; else rm -f {record}; fi; (exit $retval); fi"
+        )
+
+        result = self.transport.exec_command_wait(command, workdir=working_directory)
+        return self._parse_submit_output(*result)
+
+    def _get_cached_inventory(
+        self, server_dir: t.Optional[str] = None
+    ) -> t.Optional[dict]:
+        """Return the inventory of the HQ server of a shard if it was taken less than ``_INVENTORY_TTL`` seconds ago.
+
+        :param server_dir: the server directory of the shard, or ``None`` for the default server.
+        """
+        hostname = str(getattr(self._transport, "hostname", None))
+        cached = self._inventories.get((hostname, server_dir))
+        if cached is not None and time.monotonic() - cached[0] < _INVENTORY_TTL:
+            return cached[1]
+
+        return None
+
+    def _get_inventory(self, server_dir: t.Optional[str] = None) -> t.Optional[dict]:
+        """Return the inventory of the workers and allocation queues of the HQ server of a shard, see ``parse_inventory``.
+
+        The inventory is taken with a single ``hq worker list`` and ``hq alloc list`` round trip and cached per host and
+        shard for ``_INVENTORY_TTL`` seconds.
+
+        :param server_dir: the server directory of the shard, or ``None`` for the default server.
+        :return: the inventory or ``None`` if it could not be taken.
+        """
+        inventory = self._get_cached_inventory(server_dir)
+        if inventory is not None:
+            return inventory
+
+        hq = get_hq_command(server_dir)
+        command = (
+            f'jq -n --argjson workers "$({hq} worker list --output-mode json)" '
+            f'--argjson queues "$({hq} alloc list --output-mode json)" '
+            "'{workers: $workers, queues: $queues}'"
+        )
+        retval, stdout, stderr = self.transport.exec_command_wait(command)
+
+        try:
+            if retval != 0:
+                raise ValueError(stderr)
+            hq_inventory = json.loads(stdout)
+            inventory = parse_inventory(hq_inventory["workers"], hq_inventory["queues"])
+        except (ValueError, KeyError, TypeError) as exception:
+            self.logger.warning(
+                f"unable to take the inventory of the HQ server: {exception}"
+            )
+            return None
+
+        hostname = str(getattr(self.transport, "hostname", None))
+        self._inventories[(hostname, server_dir)] = (time.monotonic(), inventory)
+
+        return inventory
+
+    def _get_feasibility_check(
+        self, submit_script: str, server_dir: t.Optional[str] = None
+    ) -> str:
+        """Return the commands that reject the submission of a job that no worker can run.
+
+        A job that requests more cpus or memory than any worker can provide waits forever. Such a job can only be
+        recognised if the shapes of all workers that can run it are known, i.e. if there are running workers and no
+        allocation queues that can start new workers with an unknown shape. The requested resources are read from the
+        header of the submit script on the remote, so the check does not need an extra round trip.
+
+        :param submit_script: the path of the submit script relative to the working directory.
+        :param server_dir: the server directory of the shard of the job, or ``None`` for the default server. The check
+            is only run if the submit script records the same shard in ``$server_dir``, see ``submit_job``.
+        :return: the commands, to be run before the submit command, or an empty string if the check is not possible.
+        """
+        inventory = self._get_inventory(server_dir)
+        if inventory is None:
+            return ""
+
+        if inventory["queues"] > 0:
+            return ""
+
+        if not inventory["shapes"]:
+            self.logger.warning(
+                "the HQ server has no workers and no allocation queues, the job will wait until a worker is started"
+            )
+            return ""
+
+        checks = []
+        for index, resource in enumerate(("cpus", "mem")):
+            amounts = [shape[index] for shape in inventory["shapes"]]
+            if None in amounts:
+                continue
+            checks.append((resource, max(amounts)))
+
+        commands = []
+        for resource, maximum in checks:
+            directive = "#HQ --cpus=" if resource == "cpus" else "#HQ --resource mem="
+            commands.append(
+                f"requested=$(sed -n 's/^{directive}//p' {submit_script}); "
+                f'if [ "${{requested:-0}}" -gt {maximum} ]; then '
+                f'echo "job requests $requested {resource}, but the workers provide at most {maximum}" >&2; exit 1; fi; '
+            )
+
+        # A job that requests a custom resource, see the `locality` resource, can only run on the workers that provide it
+        provided = "|".join(
+            ["mem"]
+            + [
+                name
+                for name in inventory["resources"]
+                if _RESOURCE_NAME_REGEX.match(name)
+            ]
+        )
+        commands.append(
+            f"for resource in $(sed -n 's/^#HQ --resource \\([^=]*\\)=.*/\\1/p' {submit_script}); do "
+            f'case "$resource" in {provided}) ;; *) '
+            'echo "job requests the resource $resource, but no worker provides it" >&2; exit 1 ;; esac; done; '
+        )
+
+        return (
+            f'if [ "$server_dir" = "{server_dir or ""}" ]; then {"".join(commands)}fi; '
+        )
+
     def _get_submit_command(self, submit_script: str) -> str:
         """Return the string to execute to submit a given script.
 
@@ -182,7 +730,7 @@ class HyperQueueScheduler(BashCliScheduler):
         """Parse the output of the submit command, as returned by executing the
         command returned by _get_submit_command command.
 
-        Return a string with the JobID.
+        Return a string with the JobID, which includes the server directory of the shard of the job, if any.
         """
         if retval != 0:
             self.logger.error(
@@ -204,7 +752,7 @@ class HyperQueueScheduler(BashCliScheduler):
 
         try:
             hq_job_dict = json.loads(stdout)
-            return str(hq_job_dict["id"])
+            return join_job_id(hq_job_dict["id"], hq_job_dict.get("server_dir"))
         except Exception:
             # If no valid line is found, log and raise an error
             self.logger.error(
@@ -220,11 +768,38 @@ class HyperQueueScheduler(BashCliScheduler):
     ) -> str:
         """Return the ``hq`` command for listing the active jobs.
 
-        Note: since the ``hq job list`` command cannot filter on job ids (yet), the ``jobs`` input is currently ignored.
-        These could in principle be passed to the ``hq job`` command, but this has an entirely different format.
+        Since the ``hq job list`` command cannot filter on job ids (yet), the list is filtered on the ``jobs`` on the
+        remote with ``jq``. This way a profile that shares the HQ server with others only parses its own jobs, however
+        busy the server is.
+
+        The jobs on shards are listed from the HQ server of their shard, and their ids are extended with the server
+        directory of the shard. The lists of all servers are merged into one. The command fails if ``hq`` fails on any
+        of the servers, so the jobs of an unreachable server are not mistaken for finished jobs.
+
+        The requested ids are looked up in a ``jq`` object, so filtering takes one lookup per job on the server instead
+        of one comparison per job and requested id.
         """
+        list_command = "job list --filter waiting,running --output-mode=json"
+
+        if not jobs:
+            return f"hq {list_command}"
+
+        groups = group_job_ids(jobs)
+        commands = []
+        for server_dir, hq_job_ids in groups.items():
+            wanted = ",".join(f'"{int(job_id)}":true' for job_id in hq_job_ids)
+            job_filter = "select($wanted[.id | tostring])"
+            if server_dir is not None:
+                job_filter += f' | .id = "\\(.id)@{server_dir}"'
+            commands.append(
+                f"{get_hq_command(server_dir)} {list_command} | "
+                f"jq -c '{{{wanted}}} as $wanted | [.[] | {job_filter}]'"
+            )
+
+        if list(groups) == [None]:
+            return f"set -o pipefail; {commands[0]}"
 
-        return "hq job list --filter waiting,running --output-mode=json"
+        return f"set -o pipefail; {{ {' && '.join(commands)}; }} | jq -c -s add"
 
     def _parse_joblist_output(self, retval: int, stdout: str, stderr: str) -> list:
         """Parse the stdout for the joblist command.
@@ -246,7 +821,7 @@ class HyperQueueScheduler(BashCliScheduler):
 
         # convert hq returned job list to job info list
         # HQ support 1 hq job with multiple tasks.
-        # Since the way aiida-hq using hq is 1-1 match between hq job and hq task, we only parse 1 task as aiida job.
+        # A job with codes that run in parallel has one task per code, its state is aggregated over all its tasks.
         hq_job_info_list = json.loads(stdout)
 
         job_info_list = []
@@ -255,14 +830,26 @@ class HyperQueueScheduler(BashCliScheduler):
             job_info.job_id = str(
                 hq_job_dict["id"]
             )  # must be str, if it is a int job will not waiting
-            job_info.title = hq_job_dict["name"]
+            _, job_info.title = split_job_name(hq_job_dict["name"])
             stats: t.List[str] = [
-                stat for stat, v in hq_job_dict["task_stats"].items() if v > 0
+                stat.upper() for stat, v in hq_job_dict["task_stats"].items() if v > 0
             ]
-            if hq_job_dict["task_count"] != 1 or len(stats) != 1:
-                self.logger.error("not able to parse hq job with multiple tasks.")
+            if not stats:
+                self.logger.error(f"not able to parse hq job {job_info.job_id}.")
+            elif "RUNNING" in stats:
+                # As long as one of its tasks is running, the job is running
+                job_info.job_state = JobState.RUNNING
+            elif "WAITING" in stats:
+                job_info.job_state = JobState.QUEUED
+                inventory = self._get_cached_inventory(split_job_id(job_info.job_id)[1])
+                if inventory is not None and not (
+                    inventory["shapes"] or inventory["queues"]
+                ):
+                    job_info.annotation = (
+                        "the HQ server has no workers and no allocation queues"
+                    )
             else:
-                job_info.job_state = _MAP_STATUS_HYPERQUEUE[stats[0].upper()]
+                job_info.job_state = _MAP_STATUS_HYPERQUEUE[stats[0]]
 
             job_info_list.append(job_info)
 
@@ -272,7 +859,8 @@ class HyperQueueScheduler(BashCliScheduler):
 
     def _get_kill_command(self, jobid):
         """Return the command to kill the job with specified jobid."""
-        submit_command = f"hq job cancel {jobid}"
+        hq_job_id, server_dir = split_job_id(jobid)
+        submit_command = f"{get_hq_command(server_dir)} job cancel {hq_job_id}"
 
         self.logger.info(f"killing job {jobid}")
 
@@ -309,4 +897,46 @@ class HyperQueueScheduler(BashCliScheduler):
         The output text is just retrieved, and returned for logging purposes.
         `jq` is used to transform the json into a one-line string.
         """
-        return f"hq job info {job_id} --output-mode json | jq -c ."
+        hq_job_id, server_dir = split_job_id(job_id)
+
+        return f"{get_hq_command(server_dir)} job info {hq_job_id} --output-mode json | jq -c ."
+
+    def parse_output(
+        self,
+        detailed_job_info: t.Optional[dict] = None,
+        stdout: t.Optional[str] = None,
+        stderr: t.Optional[str] = None,
+    ):
+        """Parse the output of the scheduler.
+
+        Reports the number of attempts HQ needed for a job that was restarted after losing its worker, and returns
+        ``ERROR_SCHEDULER_NODE_FAILURE`` if the job failed because it crashed more often than its ``crash_limit``.
+
+        :param detailed_job_info: dictionary with the output returned by the `Scheduler.get_detailed_job_info` command.
+        :param stdout: string with the output written by the scheduler to stdout.
+        :param stderr: string with the output written by the scheduler to stderr.
+        :return: None or an instance of :class:`aiida.engine.processes.exit_code.ExitCode`.
+        """
+        from aiida.engine import CalcJob
+
+        attempts = [int(attempt) for attempt in _ATTEMPT_REGEX.findall(stderr or "")]
+        if attempts:
+            self.logger.warning(
+                f"the HQ job was restarted after losing its worker, it took {max(attempts)} attempts"
+            )
+
+        try:
+            hq_job_dicts = json.loads(detailed_job_info["stdout"])
+        except (TypeError, KeyError, ValueError):
+            return None
+
+        if isinstance(hq_job_dicts, dict):
+            hq_job_dicts = [hq_job_dicts]
+
+        for hq_job_dict in hq_job_dicts:
+            for task in hq_job_dict.get("tasks", []):
+                error = str(task.get("error") or "")
+                if task.get("state") == "failed" and _CRASH_LIMIT_REGEX.search(error):
+                    return CalcJob.exit_codes.ERROR_SCHEDULER_NODE_FAILURE
+
+        return None
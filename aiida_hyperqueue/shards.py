@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Sharding of the calculation jobs of a computer over several HQ servers.
+
+A single HQ server can become the bottleneck for very large campaigns. A computer can therefore run several HQ servers,
+one per server directory listed in the ``SERVER_DIRS_PROPERTY`` property, e.g. set with ``aiida-hq server shards``.
+
+The shard of a calculation job is chosen when its submit script is written, see ``get_shard``, and recorded in the
+script with the ``SERVER_DIR_MARKER`` comment, from which it is read when the script is submitted. The id of a job on
+a shard is ``<id>@<server directory>``, so the ``hq`` commands for the job are run against the server of its shard.
+Jobs with a plain id run on the default server of the computer.
+"""
+
+import pathlib
+import re
+import typing as t
+
+from .priority import get_calcjob_node
+
+if t.TYPE_CHECKING:
+    from aiida.orm import CalcJobNode, Computer
+
+# Computer property with the server directories of the HQ servers that the jobs of the computer are sharded over
+SERVER_DIRS_PROPERTY = "hyperqueue_server_dirs"
+
+# Comment in the submit script that records the server directory of the shard that the job is submitted to
+SERVER_DIR_MARKER = "# aiida-hq server-dir:"
+
+# The server directory ends up in job ids and unquoted shell commands, so only absolute paths without spaces are valid
+_SERVER_DIR_REGEX = re.compile(r"^/[\w./-]*$")
+
+# A complete UUID, so a working directory that does not end with the UUID of a calculation job never matches a node by
+# the start of its UUID
+_UUID_REGEX = re.compile(
+    r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"
+)
+
+
+def validate_server_dir(server_dir: str) -> str:
+    """Return the server directory if it is valid.
+
+    :raises ValueError: if the server directory is not an absolute path made of letters, digits and ``_.-/``.
+    """
+    if not _SERVER_DIR_REGEX.match(server_dir):
+        raise ValueError(
+            f"invalid server directory `{server_dir}`: it must be an absolute path of letters, digits and `_.-/`"
+        )
+
+    return server_dir
+
+
+def get_server_dirs(computer: "Computer") -> t.List[t.Optional[str]]:
+    """Return the server directories of the HQ servers of a computer.
+
+    :return: the server directories, or ``[None]`` for the default server if the jobs of the computer are not sharded.
+    """
+    return list(computer.get_property(SERVER_DIRS_PROPERTY, None) or [None])
+
+
+def get_shard(job_name: t.Optional[str]) -> t.Optional[str]:
+    """Return the server directory of the shard that the job of a calculation is submitted to.
+
+    The calculations are spread evenly over the shards by their pk, so the shard of a calculation does not change when
+    its submit script is written again.
+
+    :param job_name: the name of the job, as set in the job template.
+    :return: the server directory or ``None`` for the default server, if the computer has no shards or the calculation
+        cannot be found.
+    """
+    return _get_calcjob_shard(get_calcjob_node(job_name))
+
+
+def get_workdir_shard(working_directory: str) -> t.Optional[str]:
+    """Return the server directory of the shard of the calculation job with the given working directory.
+
+    The working directory of a calculation job ends with its UUID, split in three directories by AiiDA, so the
+    calculation job is found without knowing its job name.
+
+    :return: the server directory or ``None`` for the default server, see ``get_shard``.
+    """
+    from aiida import orm
+
+    uuid = "".join(pathlib.PurePosixPath(working_directory).parts[-3:])
+    if not _UUID_REGEX.match(uuid):
+        return None
+
+    try:
+        node = orm.load_node(uuid=uuid)
+    except Exception:
+        return None
+
+    return _get_calcjob_shard(node if isinstance(node, orm.CalcJobNode) else None)
+
+
+def _get_calcjob_shard(node: t.Optional["CalcJobNode"]) -> t.Optional[str]:
+    """Return the server directory of the shard of a calculation job, see ``get_shard``."""
+    if node is None or node.computer is None:
+        return None
+
+    server_dirs = node.computer.get_property(SERVER_DIRS_PROPERTY, None)
+    if not server_dirs:
+        return None
+
+    return server_dirs[node.pk % len(server_dirs)]
+
+
+def split_job_id(job_id: str) -> t.Tuple[str, t.Optional[str]]:
+    """Split a job id in the id of the job on its HQ server and the server directory of its shard.
+
+    :return: tuple of the id and the server directory, or ``None`` for a job on the default server.
+    """
+    job_id, _, server_dir = str(job_id).partition("@")
+
+    return job_id, server_dir or None
+
+
+def join_job_id(job_id: t.Union[int, str], server_dir: t.Optional[str]) -> str:
+    """Return the job id of a job with the given id on the HQ server of a shard, see ``split_job_id``."""
+    if server_dir is None:
+        return str(job_id)
+
+    return f"{job_id}@{server_dir}"
+
+
+def get_hq_command(server_dir: t.Optional[str]) -> str:
+    """Return the ``hq`` command that runs against the HQ server of a shard.
+
+    :param server_dir: the server directory, or ``None`` for the default server.
+    """
+    if server_dir is None:
+        return "hq"
+
+    return f"hq --server-dir={server_dir}"
+
+
+def group_job_ids(job_ids: t.Iterable[str]) -> t.Dict[t.Optional[str], t.List[str]]:
+    """Group job ids by the server directory of their shard.
+
+    :return: the ids of the jobs on their HQ server for each server directory, in the order they first appear.
+    """
+    groups: t.Dict[t.Optional[str], t.List[str]] = {}
+    for job_id in job_ids:
+        hq_job_id, server_dir = split_job_id(job_id)
+        groups.setdefault(server_dir, []).append(hq_job_id)
+
+    return groups
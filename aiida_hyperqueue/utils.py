@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Utilities for working with calculations run through the HyperQueue scheduler."""
+
+import datetime
+import os
+import re
+import tarfile
+import typing as t
+from pathlib import Path
+
+from .scheduler import RETRIEVE_ARCHIVE_NAME
+
+
+def unpack_retrieve_archive(
+    folder: t.Union[str, os.PathLike],
+    target: t.Optional[t.Union[str, os.PathLike]] = None,
+) -> t.List[str]:
+    """Unpack the archive created by the job epilogue when the ``retrieve_archive`` resource is set.
+
+    The archive should be retrieved by adding ``RETRIEVE_ARCHIVE_NAME`` to the ``retrieve_list`` or
+    ``retrieve_temporary_list`` of the calculation, after which it can be unpacked by the parser.
+
+    :param folder: local folder that contains the retrieved archive.
+    :param target: folder to unpack the archive into, defaults to ``folder``.
+    :return: list of the names of the unpacked members.
+    :raises FileNotFoundError: if the archive is not present in ``folder``.
+    """
+    folder = Path(folder)
+    target = Path(target) if target is not None else folder
+
+    with tarfile.open(folder / RETRIEVE_ARCHIVE_NAME, "r:gz") as tar:
+        members = [
+            member for member in tar.getmembers() if member.isfile() or member.isdir()
+        ]
+        # Use the safe extraction filter where it is available (Python >= 3.12 and backported security releases)
+        kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+        tar.extractall(path=target, members=members, **kwargs)
+
+    return [member.name for member in members]
+
+
+def parse_time(value: t.Optional[str]) -> t.Optional[datetime.datetime]:
+    """Return the timezone aware datetime of a timestamp in the HQ JSON output.
+
+    :return: the datetime, or ``None`` if the timestamp is not set or cannot be parsed.
+    """
+    if not value:
+        return None
+
+    # HQ writes up to nanoseconds and a ``Z`` suffix, neither of which is understood by ``fromisoformat`` before 3.11
+    value = re.sub(
+        r"\.(\d+)", lambda match: "." + match.group(1)[:6].ljust(6, "0"), value
+    )
+    value = re.sub(r"Z$", "+00:00", value)
+    try:
+        timestamp = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+
+    return timestamp
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""Reconciliation of the active calculation jobs of a computer with the jobs of its HQ server.
+
+When the HQ server dies and is started again, the jobs that it held are lost, unless they are restored from a journal.
+The calculation jobs that are still waiting for such a job are found by comparing their job ids with the jobs known to
+the new server, and their submit scripts are submitted again in a single round trip.
+"""
+
+import json
+import shlex
+import typing as t
+
+from aiida.common.escaping import escape_for_bash
+
+from .scheduler import SUBMIT_RECORD_NAME, split_job_name
+from .shards import get_hq_command, join_job_id, split_job_id
+
+if t.TYPE_CHECKING:
+    from aiida.orm import Computer
+
+    from .scheduler import HyperQueueScheduler
+
+# Lists the ids and names of all jobs the HQ server knows about, also the finished ones
+JOBS_COMMAND = "{hq} job list --all --output-mode json | jq -c '[.[] | {{id, name}}]'"
+
+
+def get_active_calcjobs(computer: "Computer") -> t.List[dict]:
+    """Return the calculation jobs of a computer that are waiting for their job to finish.
+
+    :return: a dictionary for each calculation job with its ``pk``, ``job_id``, ``remote_workdir`` and the
+        ``submit_script_filename``.
+    """
+    from aiida import orm
+
+    builder = orm.QueryBuilder().append(
+        orm.CalcJobNode,
+        filters={
+            "dbcomputer_id": computer.pk,
+            "attributes.process_state": {"in": ["waiting", "running"]},
+            "attributes.state": "withscheduler",
+        },
+        project=[
+            "id",
+            "attributes.job_id",
+            "attributes.remote_workdir",
+            "attributes.submit_script_filename",
+        ],
+    )
+
+    return [
+        {
+            "pk": pk,
+            "job_id": str(job_id),
+            "remote_workdir": remote_workdir,
+            "submit_script_filename": submit_script_filename or "_aiidasubmit.sh",
+        }
+        for pk, job_id, remote_workdir, submit_script_filename in builder.iterall()
+        if job_id is not None and remote_workdir
+    ]
+
+
+def get_lost_calcjobs(calcjobs: t.List[dict], jobs: t.List[dict]) -> t.List[dict]:
+    """Return the calculation jobs whose job is not known to the HQ server.
+
+    A server that is started without a journal numbers its jobs from one again, so a job id can be reused by the job of
+    another calculation. The job therefore only counts as known if its name also matches the calculation.
+
+    :param calcjobs: the active calculation jobs of the HQ server, see ``get_active_calcjobs``.
+    :param jobs: the ``id`` and ``name`` of all jobs of the HQ server.
+    """
+    known = {(str(job["id"]), split_job_name(job["name"])[1]) for job in jobs}
+
+    return [
+        calcjob
+        for calcjob in calcjobs
+        if (split_job_id(calcjob["job_id"])[0], f"aiida-{calcjob['pk']}") not in known
+    ]
+
+
+def get_resubmit_command(
+    calcjobs: t.List[dict],
+    scheduler: "HyperQueueScheduler",
+    server_dir: t.Optional[str] = None,
+) -> str:
+    """Return the command that submits the scripts of the calculation jobs again.
+
+    The record of the previous submission is replaced, so a later retry of the submission by AiiDA adopts the new job.
+    If a submission fails, its record is removed, so such a retry submits the script again.
+    For each calculation job, a line with its pk and the output of ``hq submit`` is written to stdout.
+
+    :param server_dir: the server directory of the shard that the jobs are submitted to, or ``None`` for the default
+        server.
+    """
+    commands = [] if server_dir is None else [f"export HQ_SERVER_DIR={server_dir}"]
+    for calcjob in calcjobs:
+        submit_command = scheduler._get_submit_command(
+            escape_for_bash(calcjob["submit_script_filename"])
+        )
+        commands.append(
+            f"(cd {shlex.quote(calcjob['remote_workdir'])} && rm -f {SUBMIT_RECORD_NAME} && "
+            f"{{ {submit_command} > {SUBMIT_RECORD_NAME} && echo {calcjob['pk']} $(jq -c . {SUBMIT_RECORD_NAME}) "
+            f"|| rm -f {SUBMIT_RECORD_NAME}; }})"
+        )
+
+    return "; ".join(commands)
+
+
+def parse_resubmit_output(stdout: str) -> t.Dict[int, str]:
+    """Return the new job id of each calculation job from the output of the resubmit command."""
+    job_ids = {}
+    for line in stdout.splitlines():
+        pk, _, output = line.partition(" ")
+        try:
+            job_ids[int(pk)] = str(json.loads(output)["id"])
+        except (ValueError, KeyError, TypeError):
+            continue
+
+    return job_ids
+
+
+def is_waiting_for_job(node, job_id: str) -> bool:
+    """Return whether a calculation job is still waiting with the scheduler for the job with the given id."""
+    from aiida.common.datastructures import CalcJobState
+
+    return (
+        not node.is_terminated
+        and node.get_state() == CalcJobState.WITHSCHEDULER
+        and node.get_job_id() == job_id
+    )
+
+
+def resubmit_lost_calcjobs(
+    computer: "Computer", transport, server_dir: t.Optional[str] = None
+) -> t.Tuple[t.List[dict], t.Dict[int, str], t.Dict[int, str]]:
+    """Submit the jobs of the active calculation jobs of a computer that the HQ server lost again.
+
+    The calculation jobs are run by the daemon workers, so they are paused while their job is submitted again and their
+    job id is updated to that of the new job, and played afterwards. A calculation job that cannot be paused, e.g.
+    because no daemon worker runs it, is not submitted again, and neither is one whose worker moved it past the lost
+    job before it was paused. After they are played, the calculation jobs are loaded again to check that they wait for
+    their new job, since the worker may have acted on the lost job in the meantime.
+
+    :param transport: an open transport to the computer.
+    :param server_dir: the server directory of the shard whose server lost the jobs, or ``None`` for the default server.
+    :return: the lost calculation jobs, the new job id of each of them that was submitted again and waits for it, and
+        the new job id of each of them that was submitted again but does not wait for it.
+    :raises RuntimeError: if the jobs of the HQ server cannot be listed.
+    """
+    from aiida import orm
+    from aiida.engine.processes import control
+
+    calcjobs = [
+        calcjob
+        for calcjob in get_active_calcjobs(computer)
+        if split_job_id(calcjob["job_id"])[1] == server_dir
+    ]
+    if not calcjobs:
+        return [], {}, {}
+
+    retval, stdout, stderr = transport.exec_command_wait(
+        JOBS_COMMAND.format(hq=get_hq_command(server_dir))
+    )
+    if retval != 0:
+        raise RuntimeError(f"failed to list the jobs of the HQ server: {stderr}")
+
+    lost = get_lost_calcjobs(calcjobs, json.loads(stdout))
+    if not lost:
+        return [], {}, {}
+
+    nodes = [orm.load_node(calcjob["pk"]) for calcjob in lost]
+    control.pause_processes(
+        nodes, msg_text="Paused by `aiida-hq server watchdog` to submit its job again"
+    )
+    paused = [node for node in nodes if node.paused]
+    if not paused:
+        return lost, {}, {}
+
+    job_ids = {}
+    try:
+        lost_job_ids = {calcjob["pk"]: calcjob["job_id"] for calcjob in lost}
+        resubmit_pks = {
+            node.pk
+            for node in paused
+            if is_waiting_for_job(node, lost_job_ids[node.pk])
+        }
+        if resubmit_pks:
+            _, stdout, _ = transport.exec_command_wait(
+                get_resubmit_command(
+                    [calcjob for calcjob in lost if calcjob["pk"] in resubmit_pks],
+                    computer.get_scheduler(),
+                    server_dir,
+                )
+            )
+            job_ids = {
+                pk: join_job_id(job_id, server_dir)
+                for pk, job_id in parse_resubmit_output(stdout).items()
+            }
+
+        for node in paused:
+            if node.pk in job_ids:
+                node.set_job_id(job_ids[node.pk])
+    finally:
+        control.play_processes(paused)
+
+    mismatched = {
+        pk: job_id
+        for pk, job_id in job_ids.items()
+        if not is_waiting_for_job(orm.load_node(pk), job_id)
+    }
+
+    return (
+        lost,
+        {pk: job_id for pk, job_id in job_ids.items() if pk not in mismatched},
+        mismatched,
+    )
@@ -12,7 +12,7 @@ from pathlib import Path
 import pytest
 
 from .utils import parse_tables
-from .utils.mock import ProgramMock
+from .utils.mock import MockTransport, ProgramMock
 from .utils.wait import wait_until
 
 pytest_plugins = ["aiida.manage.tests.pytest_fixtures"]
@@ -361,6 +361,25 @@ class HqEnv(Env):
         self.processes.sort(key=lambda process: 1 if "server" in process.name else 0)
 
 
+@pytest.fixture
+def mock_hq(tmp_path):
+    """Return a function that mocks ``hq`` with Python code and returns a transport whose commands run the mock.
+
+    The code can use the ``json`` and ``sys`` modules without importing them. The mock is removed after the test.
+    """
+    mock = ProgramMock(tmp_path / "mock")
+
+    with contextlib.ExitStack() as stack:
+
+        def mock_hq(code: str) -> MockTransport:
+            stack.enter_context(
+                mock.mock_program_with_code("hq", f"import json\nimport sys\n{code}")
+            )
+            return MockTransport(mock)
+
+        yield mock_hq
+
+
 @pytest.fixture(autouse=False, scope="function")
 def hq_env(tmp_path):
     with run_hq_env(tmp_path) as env:
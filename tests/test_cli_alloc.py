@@ -1,8 +1,19 @@
 # -*- coding: utf-8 -*-
+import json
+
 import pytest
 from click.testing import CliRunner
 
 from aiida.transports.transport import Transport as TransportClass
+from aiida_hyperqueue.cli.alloc import (
+    apply_alloc_profiles,
+    diff_alloc_queues,
+    get_autoscaled_backlog,
+    get_alloc_add_command,
+    get_pending_cpus,
+    get_queue_name,
+    get_queue_profile,
+)
 
 
 @pytest.fixture
@@ -14,3 +25,143 @@ original_exec_command_wait = TransportClass.exec_command_wait
 
 # TODO: Not yet implemented, seems hard to just use hq_env
 # If using real command, I need to handle the grace for teardown of tests
+
+
+def test_alloc_add_command():
+    """Test the ``hq alloc add`` command built from the shape of an allocation queue."""
+    command = get_alloc_add_command(
+        "ahq",
+        "30m",
+        backlog=2,
+        hyper_threading=False,
+        worker_resources=["scratch_a=sum(1000)"],
+        slurm_options=["-A", "mr0"],
+    )
+
+    assert command == (
+        "hq alloc add slurm --backlog 2 --time-limit 30m --name ahq --no-hyper-threading "
+        "--resource 'scratch_a=sum(1000)' --workers-per-alloc 1 -- -A mr0"
+    )
+
+    command = get_alloc_add_command("ahq", "30m", worker_resources=["it's=sum(1)"])
+    assert "--resource 'it'\"'\"'s=sum(1)' " in command
+
+
+def test_diff_alloc_queues():
+    """Test the allocation queues are diffed against the profiles, leaving queues not created from a profile alone."""
+    spec = {"time_limit": "30m", "backlog": 1, "slurm_options": ["-p", "debug"]}
+    changed = {**spec, "time_limit": "1h"}
+    scaled = {**spec, "backlog": 4}
+    profiles = {"debug": spec, "large": changed, "new": spec, "scaled": scaled}
+
+    queues = [
+        {"id": 1, "name": "ahq", "state": "Active", "backlog": 1},
+        {
+            "id": 2,
+            "name": get_queue_name("debug", spec),
+            "state": "Active",
+            "backlog": 1,
+        },
+        # The ``large`` profile had a different shape when it was applied before
+        {
+            "id": 3,
+            "name": get_queue_name("large", spec),
+            "state": "Active",
+            "backlog": 1,
+        },
+        {"id": 4, "name": get_queue_name("old", spec), "state": "Paused", "backlog": 1},
+        {"id": 5, "name": get_queue_name("new", spec), "state": "Paused", "backlog": 1},
+        # The backlog of the ``scaled`` profile was changed, which keeps the name of its queue
+        {
+            "id": 6,
+            "name": get_queue_name("scaled", spec),
+            "state": "Active",
+            "backlog": 1,
+        },
+    ]
+    assert get_queue_name("scaled", spec) == get_queue_name("scaled", scaled)
+    assert get_queue_profile(get_queue_name("my-profile", spec)) == "my-profile"
+
+    to_add, to_remove, to_resume = diff_alloc_queues(profiles, queues)
+
+    assert to_add == {
+        get_queue_name("large", changed): changed,
+        get_queue_name("scaled", scaled): scaled,
+    }
+    assert [queue["id"] for queue in to_remove] == [3, 4, 6]
+    assert to_resume == [5]
+    assert diff_alloc_queues({}, queues[:1]) == ({}, [], [])
+
+
+def test_apply_alloc_profiles(mock_hq):
+    """Test a stale queue is removed before its replacement is added, unless it has running allocations."""
+    spec = {"time_limit": "30m", "backlog": 1, "slurm_options": []}
+    profiles = {"idle": {**spec, "backlog": 2}, "busy": {**spec, "backlog": 2}}
+    queues = [
+        {
+            "id": 1,
+            "name": get_queue_name("idle", spec),
+            "state": "Active",
+            "backlog": 1,
+        },
+        {
+            "id": 2,
+            "name": get_queue_name("busy", spec),
+            "state": "Active",
+            "backlog": 1,
+        },
+    ]
+
+    code = f"""
+if sys.argv[1:3] == ["alloc", "list"]:
+    print({json.dumps(queues)!r})
+elif sys.argv[1:3] == ["alloc", "info"]:
+    status = "Running" if sys.argv[3] == "2" else "Queued"
+    print(json.dumps([{{"id": "100", "status": status}}]))
+"""
+    transport = mock_hq(code)
+    assert apply_alloc_profiles(transport, profiles)
+
+    commands = [command for command in transport.commands if "info" not in command]
+    assert commands == [
+        "hq alloc list --output-mode json",
+        "hq alloc remove --force 1",
+        "hq alloc pause 2",
+        get_alloc_add_command(get_queue_name("idle", spec), **profiles["idle"]),
+    ]
+
+
+def test_pending_cpus():
+    """Test the pending cores are the waiting tasks and unsubmitted calculations beyond the idle cores."""
+    workers = [
+        {
+            "configuration": {
+                "resources": {
+                    "resources": [
+                        {"name": "cpus", "kind": {"List": {"values": list(range(8))}}}
+                    ]
+                }
+            }
+        }
+    ]
+    jobs = [
+        # A calculation job of 4 cores that is running and one of 16 cores that is waiting
+        {"job_id": "1", "name": "main/aiida-10", "task_stats": {"running": 1}},
+        {"job_id": "2", "name": "main/aiida-11", "task_stats": {"waiting": 1}},
+        # A job that was not submitted by a calculation job, with one core per task
+        {"job_id": "3", "name": "other", "task_stats": {"waiting": 2}},
+    ]
+    calcjob_cpus = {10: ("1", 4), 11: ("2", 16), 12: (None, 8)}
+
+    # 16 + 2 waiting and 8 unsubmitted cores, minus the 4 idle cores of the worker
+    assert get_pending_cpus(jobs, workers, calcjob_cpus, "main") == 22
+    assert get_pending_cpus([], workers, {}, "main") == 0
+
+
+@pytest.mark.parametrize(
+    "pending_cpus, expected",
+    [(0, 1), (64, 1), (65, 2), (256, 4), (10000, 6)],
+)
+def test_autoscaled_backlog(pending_cpus, expected):
+    """Test the backlog covers the pending cores within the limits."""
+    assert get_autoscaled_backlog(pending_cpus, 64, 1, 6) == expected
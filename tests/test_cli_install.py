@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
+import tarfile
+
 import pytest
 from click.testing import CliRunner
 
-from aiida_hyperqueue.cli import cmd_install
+from aiida_hyperqueue.cli import cmd_install, install
+
+from .utils.mock import MockTransport, ProgramMock
 
 
 @pytest.fixture
@@ -28,3 +32,94 @@ def test_install(runner, tmp_path, aiida_computer_local):
 
     assert result.exit_code == 0
     assert f"hq version {version}" in result.output
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setattr(install, "get_cache_dir", lambda: cache_dir)
+    return cache_dir
+
+
+def make_tarball(path, content: bytes):
+    """Write a release tarball with an ``hq`` binary with the given content."""
+    binary = path.parent / "hq"
+    binary.write_bytes(content)
+    with tarfile.open(path, "w:gz") as tar:
+        tar.add(binary, arcname="hq")
+    return path
+
+
+def test_binary_cache(tmp_path, cache_dir, monkeypatch):
+    """Test a binary from a local tarball is cached by version, architecture and checksum, and reused."""
+    tarball = make_tarball(tmp_path / "hq-v0.20.0-linux-x64.tar.gz", b"hq 0.20.0")
+
+    binary = install.get_binary("0.19.0", "linux-x64", tarball)
+
+    assert binary.read_bytes() == b"hq 0.20.0"
+    assert binary.parent.name == f"hq-v0.20.0-linux-x64-{install.get_sha256(binary)}"
+
+    def download_tarball(*args):
+        raise AssertionError("the cached binary should be used")
+
+    monkeypatch.setattr(install, "download_tarball", download_tarball)
+    assert install.get_binary("0.20.0", "linux-x64") == binary
+
+    # A corrupted cache entry is not used
+    binary.write_bytes(b"corrupted")
+    assert install.get_cached_binary("0.20.0", "linux-x64") is None
+
+
+def test_binary_arch_from_elf(tmp_path, cache_dir):
+    """Test the architecture of the binary of a tarball without a release name is read from its ELF header."""
+    elf = b"\x7fELF\x02\x01" + bytes(12) + (62).to_bytes(2, "little") + bytes(44)
+    tarball = make_tarball(tmp_path / "hq.tar.gz", elf)
+
+    assert install.get_binary("0.20.0", "linux-x64", tarball).read_bytes() == elf
+    with pytest.raises(ValueError, match="is for the linux-x64 build"):
+        install.get_binary("0.20.0", "linux-arm64-linux", tarball)
+
+    tarball = make_tarball(tmp_path / "hq-custom.tar.gz", b"hq 0.20.0")
+    with pytest.raises(ValueError, match="is not known"):
+        install.get_binary("0.20.0", "linux-x64", tarball)
+
+
+def test_upload_binary(tmp_path):
+    """Test the binary is only uploaded if the remote one differs."""
+    transport = MockTransport(ProgramMock(tmp_path / "mock"))
+    binary = tmp_path / "hq"
+    binary.write_bytes(b"hq 0.20.0")
+    remote_bin_dir = tmp_path / "remote" / "bin"
+
+    assert install.upload_binary(transport, binary, remote_bin_dir)
+    assert (remote_bin_dir / "hq").read_bytes() == b"hq 0.20.0"
+
+    assert not install.upload_binary(transport, binary, remote_bin_dir)
+
+    binary.write_bytes(b"hq 0.21.0")
+    assert install.upload_binary(transport, binary, remote_bin_dir)
+    assert (remote_bin_dir / "hq").read_bytes() == b"hq 0.21.0"
+
+
+@pytest.mark.parametrize(
+    "machine, expected",
+    [
+        ("x86_64", ("success", "The linux-x64 hq binary installed into remote")),
+        ("aarch64", ("error", "The tarball hq-v0.20.0-linux-x64.tar.gz is not for")),
+        ("riscv64", ("error", "There is no hq build for the riscv64 architecture.")),
+    ],
+)
+def test_install_hq_architecture(tmp_path, cache_dir, machine, expected):
+    """Test the build matching the architecture reported by ``uname`` is installed."""
+    mock = ProgramMock(tmp_path / "mock")
+    transport = MockTransport(mock)
+    tarball = make_tarball(tmp_path / "hq-v0.20.0-linux-x64.tar.gz", b"hq 0.20.0")
+    remote_bin_dir = tmp_path / "remote" / "bin"
+
+    with mock.mock_program_with_code("uname", f"print({machine!r})"):
+        status, message = install.install_hq(
+            transport, "0.20.0", remote_bin_dir, write_bashrc=False, tarball=tarball
+        )
+
+    assert (status, message[: len(expected[1])]) == expected
+    assert (remote_bin_dir / "hq").is_file() == (status == "success")
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import pytest
+from click.testing import CliRunner
+
+from aiida_hyperqueue.cli import job
+from aiida_hyperqueue.cli.job import cmd_job_cancel
+
+
+@pytest.fixture
+def runner():
+    return CliRunner()
+
+
+def test_job_cancel(runner, aiida_profile_clean, monkeypatch):
+    """Test the jobs of the calculation jobs of a workflow are cancelled per computer and the workflow is killed."""
+    from aiida import orm
+    from aiida.common.links import LinkType
+    from aiida.engine import ProcessState
+    from aiida.engine.processes import control
+
+    computers = [
+        orm.Computer(
+            label=label,
+            hostname="localhost",
+            transport_type="core.local",
+            scheduler_type=scheduler_type,
+        ).store()
+        for label, scheduler_type in [
+            ("localhost-hq", "hyperqueue"),
+            ("localhost-direct", "core.direct"),
+        ]
+    ]
+    for computer in computers:
+        computer.configure()
+
+    workflow = orm.WorkflowNode()
+    workflow.set_process_state(ProcessState.WAITING)
+    workflow.store()
+    for computer, job_id in [
+        (computers[0], "1"),
+        (computers[0], "2"),
+        (computers[1], "3"),
+    ]:
+        node = orm.CalcJobNode(computer=computer)
+        node.set_process_state(ProcessState.WAITING)
+        node.set_job_id(job_id)
+        node.base.links.add_incoming(workflow, LinkType.CALL_CALC, "CALL")
+        node.store()
+
+    cancelled = []
+    killed = []
+
+    def cancel_jobs(transport, job_ids):
+        cancelled.extend(job_ids)
+        return "success", f"cancelled {len(job_ids)} jobs"
+
+    monkeypatch.setattr(job, "cancel_jobs", cancel_jobs)
+    monkeypatch.setattr(
+        control, "kill_processes", lambda processes, **kwargs: killed.extend(processes)
+    )
+
+    result = runner.invoke(cmd_job_cancel, ["--process", str(workflow.pk), "--dry-run"])
+    assert result.exit_code == 0, result.output
+    assert "localhost-hq: 2 jobs" in result.output
+    assert "localhost-direct" not in result.output
+    assert cancelled == [] and killed == []
+
+    # Nothing is cancelled or killed without confirmation
+    result = runner.invoke(cmd_job_cancel, ["--process", str(workflow.pk)], input="n\n")
+    assert result.exit_code != 0
+    assert cancelled == [] and killed == []
+
+    result = runner.invoke(cmd_job_cancel, ["--process", str(workflow.pk)], input="y\n")
+    assert result.exit_code == 0, result.output
+    assert sorted(cancelled) == ["1", "2"]
+    assert [process.pk for process in killed] == [workflow.pk]
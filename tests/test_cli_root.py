@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Tests for the startup of the ``aiida-hq`` CLI."""
+
+import json
+import subprocess
+import sys
+
+import click
+import pytest
+
+# Modules that are slow to import and only needed by some subcommands
+HEAVY_MODULES = ("requests", "tarfile", "tabulate", "aiida.orm")
+
+SCRIPT = """
+import json, sys
+from click.testing import CliRunner
+from aiida_hyperqueue.cli import cmd_root
+
+result = CliRunner().invoke(cmd_root, sys.argv[1:])
+assert result.exit_code == 0, result.output
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+def get_imported_modules(*args) -> set:
+    """Return the modules imported by running the CLI with the given arguments in a fresh interpreter."""
+    process = subprocess.run(
+        [sys.executable, "-c", SCRIPT, *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(json.loads(process.stdout.splitlines()[-1]))
+
+
+@pytest.mark.parametrize("args", [("--help",), ("server", "info", "--help")])
+def test_startup_imports(args):
+    """Test the help of the CLI does not import the dependencies of the subcommands."""
+    modules = get_imported_modules(*args)
+
+    assert not modules.intersection(HEAVY_MODULES)
+
+
+def test_lazy_subcommands():
+    """Test a subcommand only imports its own module."""
+    modules = get_imported_modules("server", "info", "--help")
+
+    assert "aiida_hyperqueue.cli.server" in modules
+    assert "aiida_hyperqueue.cli.install" not in modules
+    assert "aiida_hyperqueue.cli.alloc" not in modules
+
+
+def test_lazy_exports():
+    """Test the commands can still be imported from the package."""
+    from aiida_hyperqueue.cli import cmd_install, cmd_root
+
+    assert cmd_root.get_command(None, "install") is cmd_install
+
+    # Every command of the command line interface can be imported from the package
+    import aiida_hyperqueue.cli
+
+    groups = [cmd_root]
+    while groups:
+        group = groups.pop()
+        for name in group.list_commands(None):
+            command = group.get_command(None, name)
+            if isinstance(command, click.Group):
+                groups.append(command)
+            else:
+                assert (
+                    getattr(aiida_hyperqueue.cli, command.callback.__name__) is command
+                )
+
+    with pytest.raises(ImportError):
+        from aiida_hyperqueue.cli import cmd_missing  # noqa: F401
@@ -5,6 +5,8 @@ from click.testing import CliRunner
 
 from aiida.transports.transport import Transport as TransportClass
 from aiida_hyperqueue.cli import cmd_info, cmd_start, cmd_stop
+from aiida_hyperqueue.cli import server
+from aiida_hyperqueue.cli.server import SERVER_OPTIONS_PROPERTY, restart_server
 
 from .conftest import HqEnv, get_hq_binary
 
@@ -150,3 +152,56 @@ def test_server_start_info_stop_circle(
 
     assert result.exit_code == 1
     assert "Critical: cannot obtain HyperQueue server information" in result.output
+
+
+def test_restart_server_journal(tmp_path, mock_hq):
+    """Test a restart prunes the journal, waits for the old server to stop and starts it with the same options."""
+    state = tmp_path / "running"
+    state.touch()
+    code = f"""
+import os
+args = sys.argv[1:]
+if args == ["server", "info"]:
+    sys.exit(0 if os.path.exists({str(state)!r}) else 1)
+elif args == ["server", "stop"]:
+    os.unlink({str(state)!r})
+elif args[:2] == ["server", "start"]:
+    open({str(state)!r}, "w").write(" ".join(args))
+elif args != ["journal", "prune"]:
+    sys.exit(1)
+"""
+    transport = mock_hq(code)
+    status, message = restart_server(transport, journal=str(tmp_path / "journal"))
+    time.sleep(0.5)
+
+    assert status == "success", message
+    assert transport.commands[0] == "hq journal prune"
+    assert state.read_text() == f"server start --journal {tmp_path / 'journal'}"
+
+
+def test_server_start_stores_options(
+    runner: CliRunner, aiida_computer_local, monkeypatch: pytest.MonkeyPatch
+):
+    """Test the options are only stored on the computer when the server was actually started."""
+    computer = aiida_computer_local(label="localhost-hq")
+    computer.set_property(SERVER_OPTIONS_PROPERTY, {"domain": None, "journal": "j"})
+
+    monkeypatch.setattr(
+        server, "start_server", lambda *args, **kwargs: ("info", "running")
+    )
+    result = runner.invoke(cmd_start, "localhost-hq")
+    assert result.exit_code == 0, result.output
+    assert computer.get_property(SERVER_OPTIONS_PROPERTY) == {
+        "domain": None,
+        "journal": "j",
+    }
+
+    monkeypatch.setattr(
+        server, "start_server", lambda *args, **kwargs: ("success", "started")
+    )
+    result = runner.invoke(cmd_start, ["localhost-hq", "--domain", "cscs.ch"])
+    assert result.exit_code == 0, result.output
+    assert computer.get_property(SERVER_OPTIONS_PROPERTY) == {
+        "domain": "cscs.ch",
+        "journal": None,
+    }
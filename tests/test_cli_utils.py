@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Tests for running the CLI commands on several computers."""
+
+import threading
+import types
+
+import pytest
+
+from aiida_hyperqueue.cli import utils
+from aiida_hyperqueue.cli.utils import echo_results, run_on_computers
+
+from .utils.mock import MockTransport, ProgramMock
+
+
+class _Unreachable:
+    def __enter__(self):
+        raise ConnectionError("no route to host")
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+@pytest.fixture
+def computers(tmp_path):
+    """Return stand-ins for three computers, of which the last one cannot be connected to."""
+    mock = ProgramMock(tmp_path / "mock")
+
+    return [
+        types.SimpleNamespace(label="eiger", get_transport=lambda: MockTransport(mock)),
+        types.SimpleNamespace(label="daint", get_transport=lambda: MockTransport(mock)),
+        types.SimpleNamespace(label="down", get_transport=_Unreachable),
+    ]
+
+
+def test_run_on_computers(computers):
+    """Test an operation runs concurrently on all computers, and a failing computer is reported as an error."""
+    barrier = threading.Barrier(2, timeout=10)
+
+    def operation(transport):
+        # Only passes if the two reachable computers are handled at the same time
+        barrier.wait()
+        retval, stdout, _ = transport.exec_command_wait("echo ok")
+        return "output", stdout
+
+    results = run_on_computers(computers, operation)
+
+    assert results[:2] == [("output", "ok\n"), ("output", "ok\n")]
+    assert results[2] == ("error", "ConnectionError: no route to host")
+
+
+def test_echo_results(computers, monkeypatch):
+    """Test the results of several computers are shown in one table, with a non-zero exit code on errors."""
+    messages = []
+    monkeypatch.setattr(
+        utils.echo, "echo", lambda message: messages.append(("output", message))
+    )
+    monkeypatch.setattr(
+        utils.echo,
+        "echo_success",
+        lambda message: messages.append(("success", message)),
+    )
+
+    results = [("success", "started"), ("output", "already running")]
+
+    echo_results(computers[:1], results[:1], single=True)
+    assert messages.pop() == ("success", "started")
+
+    echo_results(computers[:2], results, single=False)
+    status, table = messages.pop()
+    assert status == "output"
+    assert "daint" in table and "already running" in table
+
+    with pytest.raises(SystemExit) as exception:
+        echo_results(computers, [*results, ("error", "no route to host")], single=False)
+    assert exception.value.code == 1
+    assert "no route to host" in messages.pop()[1]
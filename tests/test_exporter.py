@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Tests for the Prometheus exporter of the HQ server."""
+
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from aiida_hyperqueue.exporter import LOGGER, MetricsCache, format_metrics, get_server
+
+from .utils.wait import wait_until
+
+DATA = {
+    "workers": [],
+    "jobs": [{"waiting": 2, "running": 1}],
+    "queues": [{"id": 1, "name": "ahq", "state": "Active", "backlog": 2}],
+    "allocations": [{"queue": 1, "queued": 1, "running": 3}],
+}
+
+
+def test_format_metrics():
+    """Test the metrics are written in the exposition format, with a sample per allocation queue."""
+    text = format_metrics(DATA, {"computer": 'eiger "hq"'})
+
+    assert (
+        '# TYPE hyperqueue_up gauge\nhyperqueue_up{computer="eiger \\"hq\\""} 1.0\n'
+        in text
+    )
+    assert 'hyperqueue_tasks_waiting{computer="eiger \\"hq\\""} 2.0\n' in text
+    assert (
+        'hyperqueue_queue_allocations_running{computer="eiger \\"hq\\"",queue="1",name="ahq",state="active"} 3.0\n'
+        in text
+    )
+
+    text = format_metrics(None, {"computer": "eiger"})
+    assert 'hyperqueue_up{computer="eiger"} 0.0\n' in text
+    assert 'hyperqueue_workers{computer="eiger"} NaN\n' in text
+    assert "hyperqueue_queue_" not in text
+
+
+def test_metrics_cache(caplog):
+    """Test the metrics are refreshed by one background thread, and a failed fetch is logged."""
+
+    def fetch_unreachable():
+        raise ConnectionError("unreachable")
+
+    # The AiiDA logger does not propagate to the root logger once a profile is loaded, so attach the handler directly
+    LOGGER.addHandler(caplog.handler)
+    try:
+        cache = MetricsCache(fetch_unreachable, {}, interval=3600)
+        cache.start()
+        cache.stop()
+    finally:
+        LOGGER.removeHandler(caplog.handler)
+
+    assert "hyperqueue_up{} 0.0" in cache.get()
+    assert "unreachable" in caplog.text
+
+    threads = []
+
+    def fetch():
+        threads.append(threading.current_thread())
+        return DATA
+
+    cache = MetricsCache(fetch, {}, interval=0.01)
+    cache.start()
+    try:
+        wait_until(lambda: len(threads) > 2)
+    finally:
+        cache.stop()
+
+    # After the first fetch, the metrics are only fetched by the background thread
+    assert "hyperqueue_up{} 1.0" in cache.get()
+    assert threads[0] is threading.current_thread()
+    assert len(set(threads[1:])) == 1
+    assert threading.current_thread() not in threads[1:]
+
+
+def test_server():
+    """Test the metrics are served on ``/metrics``."""
+    cache = MetricsCache(lambda: DATA, {}, interval=3600)
+    cache.start()
+    server = get_server("127.0.0.1", 0, cache)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "hyperqueue_jobs_running{} 1.0" in response.read().decode()
+
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/other")
+    finally:
+        server.shutdown()
+        server.server_close()
+        cache.stop()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""Tests for the cross-referencing of HQ jobs with calculation jobs."""
+
+from aiida_hyperqueue.cli.utils import format_table
+from aiida_hyperqueue.jobs import (
+    format_job_ids,
+    get_cancel_command,
+    get_descendant_calcjobs,
+    get_job_list_command,
+    get_job_pks,
+    get_orphaned_jobs,
+    parse_job_list,
+)
+
+
+def test_job_list_shards(mock_hq):
+    """Test the jobs of all shards are listed in one command with the shard in their id."""
+    code = """
+shard = sys.argv[1].split("=", 1)[1] if sys.argv[1].startswith("--server-dir=") else None
+jobs = {
+    None: [{"id": 1, "name": "main/aiida-10", "task_stats": {"running": 1, "waiting": 0}}],
+    "/shard-1": [{"id": 1, "name": "aiida-11", "task_stats": {"failed": 1, "finished": 2}}],
+}
+print(json.dumps(jobs[shard]))
+"""
+    transport = mock_hq(code)
+    retval, stdout, stderr = transport.exec_command_wait(
+        get_job_list_command([None, "/shard-1"], all_jobs=True)
+    )
+
+    assert retval == 0, stderr
+    assert parse_job_list(stdout) == [
+        {"job_id": "1", "name": "main/aiida-10", "state": "running", "tasks": 1},
+        {"job_id": "1@/shard-1", "name": "aiida-11", "state": "failed", "tasks": 3},
+    ]
+
+
+def test_job_pks():
+    """Test only jobs of calculation jobs of the current profile are resolved to a pk."""
+    jobs = [
+        {"job_id": "1", "name": "main/aiida-10"},
+        {"job_id": "2", "name": "other/aiida-11"},
+        {"job_id": "3", "name": "aiida-12"},
+        {"job_id": "4", "name": "manual job"},
+    ]
+
+    assert get_job_pks(jobs, "main") == {"1": 10, "3": 12}
+
+
+def test_format_table():
+    """Test the table has the layout of `tabulate` and stays fast for many rows."""
+    table = format_table(
+        [[1, "aiida-1", None], [10, "x", "done"]], ["Id", "Name", "State"]
+    )
+
+    assert table.splitlines() == [
+        "Id  Name     State",
+        "--  -------  -----",
+        "1   aiida-1",
+        "10  x        done",
+    ]
+
+    rows = [[index, f"aiida-{index}", "running"] for index in range(50000)]
+    assert len(format_table(rows, ["Id", "Name", "State"]).splitlines()) == 50002
+
+
+def test_orphaned_jobs():
+    """Test only the jobs of terminated calculation jobs of the current profile are orphans."""
+    jobs = [
+        {"job_id": "1", "name": "main/aiida-10"},
+        {"job_id": "2", "name": "main/aiida-11"},
+        {"job_id": "3", "name": "main/aiida-12"},
+        {"job_id": "4", "name": "other/aiida-13"},
+        {"job_id": "5", "name": "aiida-14"},
+    ]
+    calcjobs = {
+        10: {"process_state": "waiting"},
+        11: {"process_state": "killed"},
+    }
+
+    orphans = get_orphaned_jobs(jobs, calcjobs, "main")
+
+    assert [(orphan["job_id"], orphan["pk"]) for orphan in orphans] == [("2", 11)]
+
+
+def test_cancel_command(tmp_path, mock_hq):
+    """Test the jobs are cancelled with one call per shard, with the ids compressed to ranges."""
+    assert format_job_ids(["7", "1", "3", "2", "9", "8"]) == "1-3,7-9"
+
+    calls = tmp_path / "calls"
+    code = f"""
+with open({str(calls)!r}, "a") as handle:
+    handle.write(" ".join(sys.argv[1:]) + "\\n")
+sys.exit(1 if "--server-dir=/down" in sys.argv else 0)
+"""
+    transport = mock_hq(code)
+    command = get_cancel_command(["1", "2", "5@/shard-1", "3@/down", "4"])
+    retval, _, _ = transport.exec_command_wait(command)
+
+    assert retval == 1
+    assert len(transport.commands) == 1
+    assert calls.read_text().splitlines() == [
+        "job cancel 1-2,4",
+        "--server-dir=/shard-1 job cancel 5",
+        "--server-dir=/down job cancel 3",
+    ]
+
+
+def test_descendant_calcjobs(aiida_profile_clean, aiida_computer_local):
+    """Test the jobs of the active calculation jobs in the whole call tree of a workflow are found."""
+    from aiida import orm
+    from aiida.common.links import LinkType
+    from aiida.engine import ProcessState
+
+    computer = aiida_computer_local(label="localhost-hq")
+
+    root = orm.WorkflowNode().store()
+    child = orm.WorkflowNode()
+    child.base.links.add_incoming(root, LinkType.CALL_WORK, "CALL")
+    child.store()
+
+    def calcjob(caller, process_state, job_id=None):
+        node = orm.CalcJobNode(computer=computer)
+        node.set_process_state(process_state)
+        if job_id is not None:
+            node.set_job_id(job_id)
+        if caller is not None:
+            node.base.links.add_incoming(caller, LinkType.CALL_CALC, "CALL")
+        return node.store()
+
+    # Active calculation jobs called by the sub-workflow and by the root workflow
+    nested = calcjob(child, ProcessState.WAITING, "1")
+    calcjob(root, ProcessState.RUNNING, "2@/shard")
+    # A calculation job that is done, one that was not submitted yet and one of another workflow
+    calcjob(child, ProcessState.FINISHED, "3")
+    calcjob(child, ProcessState.CREATED)
+    calcjob(None, ProcessState.WAITING, "4")
+
+    job_ids = get_descendant_calcjobs(root)
+    assert list(job_ids) == [computer.pk]
+    assert sorted(job_ids[computer.pk]) == ["1", "2@/shard"]
+
+    assert get_descendant_calcjobs(child) == {computer.pk: ["1"]}
+    assert get_descendant_calcjobs(nested) == {computer.pk: ["1"]}
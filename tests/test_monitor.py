@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Tests for the time series of the load of the HQ server."""
+
+import json
+import math
+
+import numpy as np
+import pytest
+
+from aiida_hyperqueue.monitor import (
+    METRICS,
+    SAMPLE_COMMAND,
+    MetricStore,
+    parse_sample,
+)
+
+
+def test_sample(mock_hq):
+    """Test a sample of a mocked HQ server is reduced to its metrics."""
+    cpus = {"name": "cpus", "kind": {"Range": {"start": 0, "end": 7}}}
+    workers = [{"id": 1, "configuration": {"resources": {"resources": [cpus]}}}]
+    jobs = [
+        {"id": 1, "task_stats": {"waiting": 2, "running": 1}},
+        {"id": 2, "task_stats": {"waiting": 3, "running": 0}},
+    ]
+    queues = [
+        {"id": 1, "name": "ahq", "state": "Active", "backlog": 2},
+        {"id": 2, "name": "old", "state": "Paused", "backlog": 4},
+    ]
+    allocations = {
+        "1": [{"id": "1001", "status": "running"}, {"id": "1002", "status": "queued"}],
+        "2": [{"id": "1000", "status": "running"}, {"id": "999", "status": "finished"}],
+    }
+    code = f"""
+args = sys.argv[1:]
+if args[:2] == ["server", "info"]:
+    print("{{}}")
+elif args[:2] == ["worker", "list"]:
+    print(json.dumps({workers!r}))
+elif args[:2] == ["job", "list"]:
+    print(json.dumps({jobs!r}))
+elif args[:2] == ["alloc", "list"]:
+    print(json.dumps({queues!r}))
+elif args[:2] == ["alloc", "info"]:
+    print(json.dumps({allocations!r}[args[2]]))
+else:
+    sys.exit(1)
+"""
+    transport = mock_hq(code)
+    retval, stdout, stderr = transport.exec_command_wait(SAMPLE_COMMAND)
+
+    assert retval == 0, stderr
+    assert parse_sample(json.loads(stdout)) == {
+        "up": 1.0,
+        "workers": 1.0,
+        "cpus": 8.0,
+        "jobs_waiting": 1.0,
+        "jobs_running": 1.0,
+        "tasks_waiting": 5.0,
+        "tasks_running": 1.0,
+        "queues": 1.0,
+        "backlog": 2.0,
+        "allocations_queued": 1.0,
+        "allocations_running": 2.0,
+    }
+
+
+def test_sample_server_down():
+    """Test the metrics of a server that is not running."""
+    sample = parse_sample(None)
+
+    assert sample["up"] == 0.0
+    assert all(math.isnan(sample[metric]) for metric in METRICS if metric != "up")
+
+
+def test_metric_store_ring_buffer():
+    """Test the oldest samples are overwritten once the store is full."""
+    store = MetricStore(3)
+    for index in range(5):
+        store.append({"workers": index}, timestamp=100.0 + index)
+
+    assert len(store) == 3
+    samples = store.query()
+    np.testing.assert_array_equal(samples["time"], [102.0, 103.0, 104.0])
+    np.testing.assert_array_equal(samples["workers"], [2, 3, 4])
+    assert np.isnan(samples["cpus"]).all()
+
+    samples = store.query(start=103.0, end=104.0, metrics=["workers"])
+    assert list(samples) == ["time", "workers"]
+    np.testing.assert_array_equal(samples["workers"], [3])
+
+
+def test_metric_store_save_load(tmp_path):
+    """Test a store can be saved and loaded again, with a smaller capacity."""
+    path = tmp_path / "monitor.npz"
+    store = MetricStore(4)
+    for index in range(3):
+        store.append({"workers": index, "up": 1}, timestamp=100.0 + index)
+    store.save(path)
+
+    loaded = MetricStore.load(path)
+    assert loaded.capacity == 4
+    for metric, column in store.query().items():
+        np.testing.assert_array_equal(loaded.query()[metric], column)
+
+    smaller = MetricStore.load(path, capacity=2)
+    np.testing.assert_array_equal(smaller.query()["workers"], [1, 2])
+
+    with pytest.raises(ValueError):
+        MetricStore(0)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Tests for the priority policies."""
+
+import datetime
+import json
+from types import SimpleNamespace
+
+from aiida.common import timezone
+
+from aiida_hyperqueue import priority
+from aiida_hyperqueue.priority import (
+    FAIRSHARE_REFERENCE_CORE_HOURS,
+    get_calcjob_node,
+    get_core_hours,
+    get_fairshare_priority,
+    get_workflow_priority,
+)
+
+
+def mock_process(caller=None, age_hours=0):
+    """Return a minimal stand-in for a process node with a caller and creation time."""
+    ctime = timezone.now() - datetime.timedelta(hours=age_hours)
+    return SimpleNamespace(caller=caller, ctime=ctime)
+
+
+def test_workflow_priority():
+    """Deeper calculations go first, and for the same depth those of older workflows."""
+    sweep_calc = mock_process(caller=mock_process(age_hours=50))
+    deep_calc = mock_process(
+        caller=mock_process(caller=mock_process(caller=mock_process()))
+    )
+    old_deep_calc = mock_process(
+        caller=mock_process(caller=mock_process(caller=mock_process(age_hours=5)))
+    )
+
+    assert get_workflow_priority(mock_process()) == 0
+    assert get_workflow_priority(sweep_calc) == 100 + 50
+    assert get_workflow_priority(deep_calc) == 300
+    assert get_workflow_priority(old_deep_calc) == 305
+
+
+def test_calcjob_node_job_name():
+    """Only job names set by ``CalcJob`` refer to a calculation job node."""
+    assert get_calcjob_node(None) is None
+    assert get_calcjob_node("echo hello") is None
+
+
+def test_fairshare_priority():
+    """The priority decreases with the recent usage of the owner of the job."""
+    assert get_fairshare_priority(0) == 100
+    assert get_fairshare_priority(FAIRSHARE_REFERENCE_CORE_HOURS) == 50
+    assert get_fairshare_priority(10 * FAIRSHARE_REFERENCE_CORE_HOURS) == 9
+
+
+def test_core_hours(aiida_profile_clean, aiida_computer_local, monkeypatch):
+    """The usage is the time the jobs ran, and that of a workflow includes the calculations of its sub-workflows."""
+    from aiida import orm
+    from aiida.common.links import LinkType
+    from aiida.schedulers.datastructures import JobInfo
+
+    monkeypatch.setattr(priority, "_usage_cache", {})
+    computer = aiida_computer_local(label="localhost-hq")
+
+    root = orm.WorkflowNode().store()
+    child = orm.WorkflowNode()
+    child.base.links.add_incoming(root, LinkType.CALL_WORK, "CALL")
+    child.store()
+
+    def calcjob(caller=None):
+        node = orm.CalcJobNode(computer=computer)
+        node.set_option("resources", {"num_cpus": 4})
+        if caller is not None:
+            node.base.links.add_incoming(caller, LinkType.CALL_CALC, "CALL")
+        return node
+
+    # A job that ran for half an hour according to HQ, called through the sub-workflow
+    node = calcjob(child)
+    node.set_detailed_job_info(
+        {
+            "retval": 0,
+            "stdout": json.dumps(
+                {
+                    "tasks": [
+                        {
+                            "id": 0,
+                            "state": "finished",
+                            "started_at": "2024-05-13T12:00:00.123456789Z",
+                            "finished_at": "2024-05-13T12:30:00.123456789Z",
+                        }
+                    ]
+                }
+            ),
+            "stderr": "",
+        }
+    )
+    node.store()
+
+    # A job that ran for an hour according to the scheduler, called by the root workflow
+    job_info = JobInfo()
+    job_info.wallclock_time_seconds = 3600
+    node = calcjob(root)
+    node.set_last_job_info(job_info)
+    node.store()
+
+    # A job that is still waiting in the queue, and a job of another workflow
+    calcjob(child).store()
+    node = calcjob()
+    node.set_last_job_info(job_info)
+    node.store()
+
+    assert get_core_hours(computer.pk, {"workflow": root.pk}) == 6.0
+    assert get_core_hours(computer.pk, {"workflow": child.pk}) == 2.0
+    assert get_core_hours(computer.pk) == 10.0
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Tests for the allocation efficiency report."""
+
+import datetime
+import json
+
+import pytest
+
+from aiida_hyperqueue.report import REPORT_COMMAND, get_alloc_report
+from aiida_hyperqueue.utils import parse_time
+
+
+ALLOCATIONS = [
+    {
+        "id": "1001",
+        "queue_time": "2024-01-01T10:00:00Z",
+        "start_time": "2024-01-01T10:10:00Z",
+        "end_time": "2024-01-01T11:10:00Z",
+        "status": "finished",
+    },
+    {"id": "1002", "queue_time": "2024-01-01T10:00:00Z", "status": "queued"},
+]
+WORKERS = [
+    {
+        "id": 1,
+        "started": "2024-01-01T10:10:00.123456789Z",
+        "ended": {"at": "2024-01-01T11:10:00.123456789Z"},
+        "allocation": {"manager": "SLURM", "id": "1001"},
+    },
+    # A worker that was started by hand
+    {"id": 2, "started": "2024-01-01T10:00:00Z", "ended": None, "allocation": None},
+]
+JOBS = [
+    {
+        "tasks": [
+            {
+                "id": 0,
+                "worker": 1,
+                "started_at": "2024-01-01T10:15:00Z",
+                "finished_at": "2024-01-01T10:45:00Z",
+            },
+            {
+                "id": 1,
+                "worker": 2,
+                "started_at": "2024-01-01T10:15:00Z",
+                "finished_at": "2024-01-01T10:30:00Z",
+            },
+        ]
+    },
+    {"tasks": [{"id": 0, "state": "waiting"}]},
+]
+
+
+def test_parse_time():
+    """Test the timestamps of HQ are parsed with their nanoseconds and time zone."""
+    assert parse_time("2024-01-01T10:00:00.123456789Z") == datetime.datetime(
+        2024, 1, 1, 10, 0, 0, 123456, tzinfo=datetime.timezone.utc
+    )
+    assert parse_time("2024-01-01T10:00:00.5+01:00") == datetime.datetime(
+        2024, 1, 1, 9, 0, 0, 500000, tzinfo=datetime.timezone.utc
+    )
+    assert parse_time(None) is None
+    assert parse_time("not a time") is None
+
+
+def test_alloc_report(mock_hq):
+    """Test the report of the allocation queues, fetched from a mocked ``hq``."""
+    code = f"""
+args = sys.argv[1:]
+if args[:2] == ["alloc", "list"]:
+    print(json.dumps([{{"id": 3, "name": "ahq"}}]))
+elif args[:3] == ["alloc", "info", "3"]:
+    print(json.dumps({ALLOCATIONS!r}))
+elif args[:2] == ["worker", "list"]:
+    assert "--all" in args
+    print(json.dumps({WORKERS!r}))
+elif args[:3] == ["job", "info", "all"]:
+    print(json.dumps({JOBS!r}))
+else:
+    sys.exit(1)
+"""
+    transport = mock_hq(code)
+    retval, stdout, stderr = transport.exec_command_wait(REPORT_COMMAND)
+
+    assert retval == 0, stderr
+    data = json.loads(stdout)
+
+    (report,) = get_alloc_report(data["queues"], data["workers"], data["tasks"])
+
+    assert report["queue"] == 3
+    assert report["allocations"] == 2
+    assert report["workers"] == 1
+    assert report["latency"] == 600
+    # The worker of the allocation was busy for 30 of its 60 minutes and idle for 25 minutes after its last task
+    assert report["utilization"] == pytest.approx(0.5)
+    assert report["idle_tail"] == pytest.approx(25 * 60, abs=1)
+
+
+def test_alloc_report_running():
+    """Test workers and tasks that are still running are counted until now, but have no idle tail yet."""
+    now = parse_time("2024-01-01T10:40:00Z")
+    workers = [{**WORKERS[0], "ended": None}]
+    queues = [{"id": 1, "allocations": ALLOCATIONS}]
+    tasks = [{"worker": 1, "started_at": "2024-01-01T10:15:00Z", "finished_at": None}]
+
+    (report,) = get_alloc_report(queues, workers, tasks, now=now)
+
+    assert report["utilization"] == pytest.approx(25 / 30, rel=1e-3)
+    assert report["idle_tail"] is None
@@ -1,14 +1,29 @@
 # -*- coding: utf-8 -*-
 """Tests for command line interface."""
 
+import json
+import os
 import pytest
+import signal
+import subprocess
 import uuid
 from pathlib import Path
+from types import SimpleNamespace
 
-from aiida.schedulers import JobState
+from aiida.schedulers import JobState, SchedulerError
 from aiida.common.datastructures import CodeRunMode
 from aiida.schedulers.datastructures import JobTemplate, JobTemplateCodeInfo
-from aiida_hyperqueue.scheduler import HyperQueueJobResource, HyperQueueScheduler
+from aiida_hyperqueue.scheduler import (
+    RETRIEVE_ARCHIVE_NAME,
+    SUBMIT_PENDING_NAME,
+    SUBMIT_RECORD_NAME,
+    HyperQueueJobResource,
+    HyperQueueScheduler,
+    MAX_JOB_NAME_LENGTH,
+    get_profile_tag,
+    split_job_name,
+)
+from aiida_hyperqueue.utils import unpack_retrieve_archive
 
 from .conftest import HqEnv
 from .utils import wait_for_job_state
@@ -213,3 +228,553 @@ def test_get_and_parse_joblist(hq_env: HqEnv):
     assert len(job_info_list) == 1
     assert job_info_list[0].job_state == JobState.RUNNING
     assert job_info_list[0].title == "sleep"
+
+
+def test_submit_script_retrieve_archive(tmp_path):
+    """Test the epilogue that packs the files to be retrieved into a single archive."""
+    scheduler = HyperQueueScheduler()
+
+    job_tmpl = JobTemplate()
+    job_tmpl.shebang = "#!/bin/bash"
+    job_tmpl.uuid = str(uuid.uuid4())
+    job_tmpl.job_resource = scheduler.create_job_resource(
+        num_cpus=1, retrieve_archive=["aiida.out", "*.xml"]
+    )
+    tmpl_code_info = JobTemplateCodeInfo()
+    tmpl_code_info.cmdline_params = ["echo", "Hello"]
+    job_tmpl.codes_info = [tmpl_code_info]
+    job_tmpl.codes_run_mode = CodeRunMode.SERIAL
+    job_tmpl.append_text = "echo appended"
+
+    submit_script_text = scheduler.get_submit_script(job_tmpl)
+
+    assert submit_script_text.endswith(
+        "_aiida_hq_exit_code=$?\n"
+        "echo appended\n"
+        f"tar -czf {RETRIEVE_ARCHIVE_NAME} --ignore-failed-read aiida.out *.xml 2>/dev/null\n"
+        "exit $_aiida_hq_exit_code\n"
+    )
+
+    # The epilogue keeps the exit code of the calculation, not of the append text, and only packs the matching files
+    (tmp_path / "aiida.out").write_text("output")
+    (tmp_path / "data-file-schema.xml").write_text("<xml/>")
+    (tmp_path / "large.wfc").write_text("wavefunction")
+    script = tmp_path / "_aiidasubmit.sh"
+    script.write_text(submit_script_text.replace("'echo' 'Hello'", "false"))
+
+    result = subprocess.run(["bash", str(script)], cwd=tmp_path)
+    assert result.returncode == 1
+
+    unpacked = tmp_path / "unpacked"
+    members = unpack_retrieve_archive(tmp_path, unpacked)
+
+    assert sorted(members) == ["aiida.out", "data-file-schema.xml"]
+    assert (unpacked / "aiida.out").read_text() == "output"
+
+    with pytest.raises(
+        ValueError, match="`retrieve_archive` must be a list of strings"
+    ):
+        scheduler.create_job_resource(num_cpus=1, retrieve_archive="aiida.out")
+
+    for pattern in ("aiida.out; rm -rf ~", "--to-command=sh", "/etc/passwd"):
+        with pytest.raises(ValueError, match="invalid `retrieve_archive` pattern"):
+            scheduler.create_job_resource(num_cpus=1, retrieve_archive=[pattern])
+
+
+# Error of HQ for a task that exceeded its crash limit, see `test_crash_limit_worker_lost` for the real output
+CRASH_LIMIT_ERROR = (
+    "Task was running on a worker that was lost; the task has occurred 1 times in this situation and limit was "
+    "reached."
+)
+
+
+def test_crash_limit():
+    """Test the crash limit is set in the script and the number of attempts is reported."""
+    scheduler = HyperQueueScheduler()
+
+    job_tmpl = JobTemplate()
+    job_tmpl.shebang = "#!/bin/bash"
+    job_tmpl.uuid = str(uuid.uuid4())
+    job_tmpl.job_resource = scheduler.create_job_resource(num_cpus=1, crash_limit=3)
+    tmpl_code_info = JobTemplateCodeInfo()
+    tmpl_code_info.cmdline_params = ["echo", "Hello"]
+    job_tmpl.codes_info = [tmpl_code_info]
+    job_tmpl.codes_run_mode = CodeRunMode.SERIAL
+
+    submit_script_text = scheduler.get_submit_script(job_tmpl)
+
+    assert "#HQ --crash-limit=3" in submit_script_text
+
+    # A restarted task reports its attempt to the scheduler stderr
+    result = subprocess.run(
+        ["bash", "-c", submit_script_text],
+        env={"HQ_INSTANCE_ID": "2"},
+        capture_output=True,
+        text=True,
+    )
+    assert "aiida-hq: attempt 3" in result.stderr
+
+    detailed_job_info = {
+        "retval": 0,
+        "stdout": json.dumps(
+            [{"tasks": [{"id": 0, "state": "failed", "error": CRASH_LIMIT_ERROR}]}]
+        ),
+        "stderr": "",
+    }
+    exit_code = scheduler.parse_output(detailed_job_info, "", result.stderr)
+    assert exit_code.status == 140
+
+    detailed_job_info["stdout"] = '[{"tasks": [{"id": 0, "state": "finished"}]}]'
+    assert scheduler.parse_output(detailed_job_info, "", result.stderr) is None
+
+    with pytest.raises(ValueError, match="`crash_limit` must be a positive integer"):
+        scheduler.create_job_resource(num_cpus=1, crash_limit=0)
+
+
+def test_crash_limit_worker_lost(hq_env: HqEnv):
+    """Test a job that lost its worker more often than its crash limit is reported as a node failure."""
+    scheduler = HyperQueueScheduler()
+
+    hq_env.start_server()
+    hq_env.start_worker(cpus="1")
+    hq_env.command(["submit", "--crash-limit=1", "--", "sleep", "100"])
+    wait_for_job_state(hq_env, 1, "RUNNING")
+
+    hq_env.kill_worker(1, signal=signal.SIGKILL)
+    wait_for_job_state(hq_env, 1, "FAILED")
+
+    detailed_job_info = {
+        "retval": 0,
+        "stdout": hq_env.command(["job", "info", "1", "--output-mode", "json"]),
+        "stderr": "",
+    }
+    exit_code = scheduler.parse_output(detailed_job_info, "", "")
+    assert exit_code is not None
+    assert exit_code.status == 140
+
+
+def test_submit_script_parallel_codes(tmp_path):
+    """Test codes that run in parallel are submitted as one HQ task per code."""
+    scheduler = HyperQueueScheduler()
+
+    job_tmpl = JobTemplate()
+    job_tmpl.shebang = "#!/bin/bash"
+    job_tmpl.uuid = str(uuid.uuid4())
+    job_tmpl.sched_output_path = "_scheduler-stdout.txt"
+    job_tmpl.job_resource = scheduler.create_job_resource(num_cpus=4, memory_mb=256)
+    codes_info = []
+    for output in ("first", "second"):
+        tmpl_code_info = JobTemplateCodeInfo()
+        tmpl_code_info.cmdline_params = ["echo", output]
+        tmpl_code_info.stdout_name = f"{output}.out"
+        codes_info.append(tmpl_code_info)
+    job_tmpl.codes_info = codes_info
+    job_tmpl.codes_run_mode = CodeRunMode.PARALLEL
+
+    submit_script_text = scheduler.get_submit_script(job_tmpl)
+
+    assert "#HQ --array=0-1" in submit_script_text
+    assert "#HQ --stdout=_scheduler-stdout.txt.%{TASK_ID}" in submit_script_text
+    assert "#HQ --cpus=2" in submit_script_text
+    assert "#HQ --resource mem=128" in submit_script_text
+
+    # Each task only runs its own code and writes its own scheduler output
+    job_tmpl.append_text = "echo appended >> appended.txt"
+    submit_script_text = scheduler.get_submit_script(job_tmpl)
+    for task_id in (1, 0):
+        with open(tmp_path / f"_scheduler-stdout.txt.{task_id}", "w") as handle:
+            subprocess.run(
+                ["bash", "-c", submit_script_text],
+                cwd=tmp_path,
+                env={"HQ_JOB_ID": "7", "HQ_TASK_ID": str(task_id)},
+                stdout=handle,
+            )
+        if task_id == 1:
+            assert not (tmp_path / "first.out").exists()
+            assert (tmp_path / "second.out").read_text() == "second\n"
+            assert not (tmp_path / "_scheduler-stdout.txt").exists()
+            assert not (tmp_path / "appended.txt").exists()
+
+    # The last task merges the scheduler output and runs the append text once
+    assert (tmp_path / "first.out").read_text() == "first\n"
+    assert (tmp_path / "_scheduler-stdout.txt").exists()
+    assert (tmp_path / "appended.txt").read_text() == "appended\n"
+
+    # A job submitted again in the same directory runs the epilogue again when all its tasks are done
+    (tmp_path / "appended.txt").unlink()
+    for task_id in (0, 1):
+        subprocess.run(
+            ["bash", "-c", submit_script_text],
+            cwd=tmp_path,
+            env={"HQ_JOB_ID": "8", "HQ_TASK_ID": str(task_id)},
+        )
+    assert (tmp_path / "appended.txt").read_text() == "appended\n"
+
+    # The cores cannot be divided evenly over the codes
+    job_tmpl.job_resource = scheduler.create_job_resource(num_cpus=3)
+    with pytest.raises(SchedulerError, match="`num_cpus` must be a multiple"):
+        scheduler.get_submit_script(job_tmpl)
+    job_tmpl.job_resource = scheduler.create_job_resource(num_cpus=4)
+
+    # The serial run mode is still a single task
+    job_tmpl.codes_run_mode = CodeRunMode.SERIAL
+    submit_script_text = scheduler.get_submit_script(job_tmpl)
+
+    assert "--array" not in submit_script_text
+    assert "#HQ --cpus=4" in submit_script_text
+
+
+def test_parse_joblist_multiple_tasks():
+    """Test the state of a job with multiple tasks is aggregated over its tasks."""
+    scheduler = HyperQueueScheduler()
+
+    def hq_job(job_id, **task_stats):
+        stats = {"running": 0, "finished": 0, "failed": 0, "canceled": 0}
+        stats.update(task_stats)
+        return {
+            "id": job_id,
+            "name": "aiida-1",
+            "task_count": sum(stats.values()),
+            "task_stats": stats,
+        }
+
+    joblist = json.dumps(
+        [
+            hq_job(1, running=1, waiting=1, finished=1),
+            hq_job(2, waiting=1, finished=1),
+            hq_job(3, finished=1, failed=1),
+        ]
+    )
+    job_info_list = scheduler._parse_joblist_output(0, joblist, "")
+
+    assert [job_info.job_state for job_info in job_info_list] == [
+        JobState.RUNNING,
+        JobState.QUEUED,
+        JobState.DONE,
+    ]
+
+
+def test_submit_script_locality():
+    """Test the job requests the custom resource of the workers that hold its data."""
+    scheduler = HyperQueueScheduler()
+
+    job_tmpl = JobTemplate()
+    job_tmpl.shebang = "#!/bin/bash"
+    job_tmpl.uuid = str(uuid.uuid4())
+    job_tmpl.job_resource = scheduler.create_job_resource(
+        num_cpus=1, locality="scratch_a"
+    )
+    tmpl_code_info = JobTemplateCodeInfo()
+    tmpl_code_info.cmdline_params = ["echo", "Hello"]
+    job_tmpl.codes_info = [tmpl_code_info]
+    job_tmpl.codes_run_mode = CodeRunMode.SERIAL
+
+    assert "#HQ --resource scratch_a=1" in scheduler.get_submit_script(job_tmpl)
+
+    with pytest.raises(ValueError, match="`locality` must be the name"):
+        scheduler.create_job_resource(num_cpus=1, locality="scratch a; rm")
+
+    with pytest.raises(ValueError, match="`locality` cannot be `cpus`"):
+        scheduler.create_job_resource(num_cpus=1, locality="cpus")
+
+
+def test_get_profile_tag(monkeypatch):
+    """Test profiles with the same name get different tags, that can be split off the job name."""
+    import aiida_hyperqueue.scheduler
+
+    tags = []
+    for profile_uuid in ("4c0e7a0f-3f4b-4bd4-9d43-7ad1e5c3f0a1", str(uuid.uuid4())):
+        profile = SimpleNamespace(name="my profile", uuid=profile_uuid)
+        monkeypatch.setattr(
+            aiida_hyperqueue.scheduler,
+            "get_manager",
+            lambda profile=profile: SimpleNamespace(get_profile=lambda: profile),
+        )
+        tags.append(get_profile_tag())
+
+    assert tags[0] == "my_profile.4c0e7a0f3f4b"
+    assert tags[0] != tags[1]
+    assert split_job_name(f"{tags[0]}/aiida-42") == (tags[0], "aiida-42")
+
+
+def test_get_profile_tag_long_name(monkeypatch):
+    """Test the job names of a profile with a long name stay within the limit of HQ on the length of job names."""
+    import aiida_hyperqueue.scheduler
+
+    profile = SimpleNamespace(
+        name="my-project-production-2024", uuid="4c0e7a0f-3f4b-4bd4-9d43-7ad1e5c3f0a1"
+    )
+    monkeypatch.setattr(
+        aiida_hyperqueue.scheduler,
+        "get_manager",
+        lambda: SimpleNamespace(get_profile=lambda: profile),
+    )
+
+    tag = get_profile_tag()
+    assert tag == "my-project.4c0e7a0f3f4b"
+
+    scheduler = HyperQueueScheduler()
+    job_tmpl = JobTemplate()
+    job_tmpl.job_name = "aiida-1234567890"
+    job_tmpl.shebang = "#!/bin/bash"
+    job_tmpl.job_resource = scheduler.create_job_resource(num_cpus=1)
+    tmpl_code_info = JobTemplateCodeInfo()
+    tmpl_code_info.cmdline_params = ["echo", "Hello"]
+    job_tmpl.codes_info = [tmpl_code_info]
+    job_tmpl.codes_run_mode = CodeRunMode.SERIAL
+
+    job_name = f"{tag}/aiida-1234567890"
+    assert len(job_name) <= MAX_JOB_NAME_LENGTH
+    assert f'#HQ --name="{job_name}"' in scheduler.get_submit_script(job_tmpl)
+
+
+def test_profile_tag(monkeypatch):
+    """Test the jobs of calculations are tagged with the profile and the tag is removed from the title."""
+    import aiida_hyperqueue.scheduler
+
+    monkeypatch.setattr(aiida_hyperqueue.scheduler, "get_profile_tag", lambda: "main")
+    scheduler = HyperQueueScheduler()
+
+    job_tmpl = JobTemplate()
+    job_tmpl.job_name = "aiida-42"
+    job_tmpl.shebang = "#!/bin/bash"
+    job_tmpl.uuid = str(uuid.uuid4())
+    job_tmpl.job_resource = scheduler.create_job_resource(num_cpus=1)
+    tmpl_code_info = JobTemplateCodeInfo()
+    tmpl_code_info.cmdline_params = ["echo", "Hello"]
+    job_tmpl.codes_info = [tmpl_code_info]
+    job_tmpl.codes_run_mode = CodeRunMode.SERIAL
+
+    assert '#HQ --name="main/aiida-42"' in scheduler.get_submit_script(job_tmpl)
+
+    # Names that are not set by a calculation job are kept as is
+    job_tmpl.job_name = "echo hello"
+    assert '#HQ --name="echo hello"' in scheduler.get_submit_script(job_tmpl)
+
+    assert split_job_name("main/aiida-42") == ("main", "aiida-42")
+    assert split_job_name("echo hello") == (None, "echo hello")
+
+
+def test_joblist_command_filters_jobs():
+    """Test the job list is filtered on the requested job ids on the remote."""
+    scheduler = HyperQueueScheduler()
+
+    assert (
+        scheduler._get_joblist_command()
+        == "hq job list --filter waiting,running --output-mode=json"
+    )
+
+    hq_job_list = json.dumps(
+        [
+            {
+                "id": job_id,
+                "name": f"main/aiida-{job_id}",
+                "task_count": 1,
+                "task_stats": {"running": 0, "waiting": 1},
+            }
+            for job_id in range(1, 6)
+        ]
+    )
+    command = scheduler._get_joblist_command(jobs=["2", "4"])
+    result = subprocess.run(
+        f"echo '{hq_job_list}' | {command.split(' | ', 1)[1]}",
+        shell=True,
+        capture_output=True,
+        text=True,
+    )
+    job_info_list = scheduler._parse_joblist_output(0, result.stdout, "")
+
+    assert [job_info.job_id for job_info in job_info_list] == ["2", "4"]
+    assert [job_info.title for job_info in job_info_list] == ["aiida-2", "aiida-4"]
+
+
+def test_joblist_command_fails_with_hq(mock_hq):
+    """Test a failure of ``hq`` is not hidden by the filter of the job list."""
+    scheduler = HyperQueueScheduler()
+
+    code = """
+print("Error: No online server found", file=sys.stderr)
+sys.exit(1)
+"""
+    transport = mock_hq(code)
+    scheduler.set_transport(transport)
+    with pytest.raises(SchedulerError, match="No online server found"):
+        scheduler.get_jobs(jobs=["2", "4"])
+
+
+def test_submit_job_is_idempotent(tmp_path, mock_hq):
+    """Test a retried submission adopts the job that was already submitted."""
+    scheduler = HyperQueueScheduler()
+    scheduler._inventories = {}
+
+    workdir = tmp_path / "workdir"
+    workdir.mkdir()
+    counter = tmp_path / "submissions"
+    code = f"""
+import pathlib
+if sys.argv[1] in ("worker", "alloc"):
+    sys.exit(print("[]"))
+counter = pathlib.Path("{counter}")
+count = int(counter.read_text()) + 1 if counter.exists() else 1
+counter.write_text(str(count))
+if "fail" in sys.argv[-1]:
+    sys.exit("cannot submit")
+print('{{"id": ' + str(count) + '}}')
+"""
+    transport = mock_hq(code)
+    scheduler.set_transport(transport)
+    # A failed submission is not recorded
+    with pytest.raises(SchedulerError, match="Error during submission"):
+        scheduler.submit_job(str(workdir), "fail.sh")
+    assert not (workdir / SUBMIT_RECORD_NAME).exists()
+
+    assert scheduler.submit_job(str(workdir), "_aiidasubmit.sh") == "2"
+    assert scheduler.submit_job(str(workdir), "_aiidasubmit.sh") == "2"
+    assert not (workdir / SUBMIT_PENDING_NAME).exists()
+
+    assert counter.read_text() == "2"
+
+
+def test_submit_job_adopts_unrecorded_job(tmp_path, mock_hq):
+    """Test a retry adopts the job of a submission that was killed before its output was recorded."""
+    scheduler = HyperQueueScheduler()
+    scheduler._inventories = {}
+
+    submissions = tmp_path / "submissions"
+    code = f"""
+import pathlib
+if sys.argv[1] in ("worker", "alloc"):
+    print("[]")
+elif sys.argv[1] == "job":
+    print(json.dumps([{{"id": 7, "name": "main.0123/aiida-42"}}, {{"id": 8, "name": "aiida-43"}}]))
+else:
+    pathlib.Path("{submissions}").open("a").write(sys.argv[-1] + "\\n")
+    print('{{"id": 9}}')
+"""
+    for name, job_name in (("tagged", "main.0123/aiida-42"), ("untagged", "aiida-43")):
+        workdir = tmp_path / name
+        workdir.mkdir()
+        (workdir / "_aiidasubmit.sh").write_text(
+            f'#!/bin/bash\n#HQ --name="{job_name}"\n'
+        )
+        # The earlier `hq submit` was killed after it reached the server, so its output was not recorded
+        (workdir / SUBMIT_PENDING_NAME).touch()
+
+    transport = mock_hq(code)
+    scheduler.set_transport(transport)
+    assert scheduler.submit_job(str(tmp_path / "tagged"), "_aiidasubmit.sh") == "7"
+    assert not (tmp_path / "tagged" / SUBMIT_PENDING_NAME).exists()
+    assert scheduler.submit_job(str(tmp_path / "tagged"), "_aiidasubmit.sh") == "7"
+
+    # A job name without the profile tag can belong to another profile, so the job is submitted again
+    assert scheduler.submit_job(str(tmp_path / "untagged"), "_aiidasubmit.sh") == "9"
+
+    assert submissions.read_text().splitlines() == ["_aiidasubmit.sh"]
+
+
+def test_submit_job_feasibility(tmp_path, mock_hq):
+    """Test a job that requests more resources than any worker provides is rejected at submission."""
+    scheduler = HyperQueueScheduler()
+    scheduler._inventories = {}
+
+    workers = [
+        {
+            "id": worker_id,
+            "configuration": {
+                "resources": {
+                    "resources": [
+                        {
+                            "name": "cpus",
+                            "kind": {"List": {"values": list(range(cpus))}},
+                        },
+                        {"name": "mem", "kind": {"Sum": {"size": 1024}}},
+                    ]
+                    + [
+                        {"name": name, "kind": {"Sum": {"size": 1000}}}
+                        for name in resources
+                    ]
+                }
+            },
+        }
+        for worker_id, cpus, resources in ((1, 4, []), (2, 8, ["scratch_a"]))
+    ]
+    code = f"""
+if sys.argv[1] == "worker":
+    print({json.dumps(json.dumps(workers))})
+elif sys.argv[1] == "alloc":
+    print("[]")
+else:
+    print('{{"id": 1}}')
+"""
+    workdir = tmp_path / "workdir"
+    workdir.mkdir()
+    (workdir / "big.sh").write_text("#!/bin/bash\n#HQ --cpus=16\n")
+    (workdir / "small.sh").write_text(
+        "#!/bin/bash\n#HQ --cpus=8\n#HQ --resource mem=512\n"
+    )
+
+    transport = mock_hq(code)
+    scheduler.set_transport(transport)
+    with pytest.raises(
+        SchedulerError,
+        match="job requests 16 cpus, but the workers provide at most 8",
+    ):
+        scheduler.submit_job(str(workdir), "big.sh")
+
+    assert scheduler.submit_job(str(workdir), "small.sh") == "1"
+
+    # Only the resources that some worker provides can be requested
+    workdir = tmp_path / "local"
+    workdir.mkdir()
+    (workdir / "local.sh").write_text(
+        "#!/bin/bash\n#HQ --cpus=1\n#HQ --resource scratch_b=1\n"
+    )
+    with pytest.raises(
+        SchedulerError,
+        match="job requests the resource scratch_b, but no worker provides it",
+    ):
+        scheduler.submit_job(str(workdir), "local.sh")
+
+    (workdir / "local.sh").write_text(
+        "#!/bin/bash\n#HQ --cpus=1\n#HQ --resource scratch_a=1\n"
+    )
+    assert scheduler.submit_job(str(workdir), "local.sh") == "1"
+
+    # The inventory is taken once and reused
+    assert sum("hq worker list" in command for command in transport.commands) == 1
+
+
+def test_submit_script_cache_environment(tmp_path):
+    """Test the environment set up by the prepend text is snapshotted once and reused by later jobs."""
+    scheduler = HyperQueueScheduler()
+
+    job_tmpl = JobTemplate()
+    job_tmpl.shebang = "#!/bin/bash"
+    job_tmpl.uuid = str(uuid.uuid4())
+    job_tmpl.job_resource = scheduler.create_job_resource(
+        num_cpus=1, cache_environment=True
+    )
+    job_tmpl.prepend_text = (
+        "echo setup >> setup.log\nexport AIIDA_HQ_TEST=$'loaded\\nover lines'"
+    )
+    tmpl_code_info = JobTemplateCodeInfo()
+    tmpl_code_info.cmdline_params = ["printenv", "AIIDA_HQ_TEST"]
+    tmpl_code_info.stdout_name = "aiida.out"
+    job_tmpl.codes_info = [tmpl_code_info]
+    job_tmpl.codes_run_mode = CodeRunMode.SERIAL
+
+    script = tmp_path / "_aiidasubmit.sh"
+    script.write_text(scheduler.get_submit_script(job_tmpl))
+    env = {"PATH": os.environ["PATH"], "TMPDIR": str(tmp_path)}
+
+    for _ in range(2):
+        subprocess.run(["bash", str(script)], cwd=tmp_path, env=env, check=True)
+        assert (tmp_path / "aiida.out").read_text() == "loaded\nover lines\n"
+
+    # The prepend text only ran for the first job, whose snapshot is only accessible to the user
+    assert (tmp_path / "setup.log").read_text() == "setup\n"
+    cache_dir = tmp_path / f"aiida-hq-env-{os.getuid()}"
+    assert cache_dir.stat().st_mode & 0o777 == 0o700
+    (snapshot,) = cache_dir.iterdir()
+    assert "AIIDA_HQ_TEST" in snapshot.read_text()
+    assert "PATH" not in snapshot.read_text()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Tests for the sharding of the jobs of a computer over several HQ servers."""
+
+import pytest
+
+from aiida.schedulers import SchedulerError
+
+from aiida_hyperqueue.scheduler import SUBMIT_RECORD_NAME, HyperQueueScheduler
+from aiida_hyperqueue.shards import (
+    SERVER_DIR_MARKER,
+    group_job_ids,
+    join_job_id,
+    split_job_id,
+    validate_server_dir,
+)
+
+
+# Mocked `hq` that keeps a counter of the submitted jobs for each server directory, passed with `--server-dir=` or the
+# `HQ_SERVER_DIR` environment variable
+HQ_CODE = """
+import os, pathlib
+args = sys.argv[1:]
+server_dir = os.environ.get("HQ_SERVER_DIR", "{default}")
+if args[0].startswith("--server-dir="):
+    server_dir = args.pop(0).split("=", 1)[1]
+if server_dir == "/down":
+    sys.exit("cannot connect to the server")
+counter = pathlib.Path("{tmp_path}") / ("counter" + server_dir.replace("/", "_"))
+if args[:2] == ["job", "list"]:
+    count = int(counter.read_text()) if counter.exists() else 0
+    jobs = [{{"id": index, "name": "aiida-1", "task_stats": {{"waiting": 1}}}} for index in range(1, count + 1)]
+    print(json.dumps(jobs))
+elif args[0] == "submit":
+    count = (int(counter.read_text()) if counter.exists() else 0) + 1
+    counter.write_text(str(count))
+    print(json.dumps({{"id": count}}))
+elif args[0] in ("worker", "alloc"):
+    print("[]")
+"""
+
+
+def test_job_ids():
+    """Test the job ids of jobs on shards carry the server directory."""
+    assert split_job_id("12") == ("12", None)
+    assert split_job_id("12@/scratch/hq-1") == ("12", "/scratch/hq-1")
+    assert join_job_id(12, None) == "12"
+    assert join_job_id(12, "/scratch/hq-1") == "12@/scratch/hq-1"
+    assert group_job_ids(["1@/a", "2", "3@/b", "4@/a"]) == {
+        "/a": ["1", "4"],
+        None: ["2"],
+        "/b": ["3"],
+    }
+
+    assert validate_server_dir("/scratch/hq-1") == "/scratch/hq-1"
+    for server_dir in ("relative/hq", "$HOME/hq", "/with space"):
+        with pytest.raises(ValueError):
+            validate_server_dir(server_dir)
+
+
+def test_submit_and_list_on_shards(tmp_path, mock_hq):
+    """Test a job is submitted to the shard in its script and listed from the server of that shard."""
+    scheduler = HyperQueueScheduler()
+    scheduler._inventories = {}
+
+    for name in ("default", "shard"):
+        (tmp_path / name).mkdir()
+    (tmp_path / "default" / "_aiidasubmit.sh").write_text("#!/bin/bash\n")
+    (tmp_path / "shard" / "_aiidasubmit.sh").write_text(
+        f"#!/bin/bash\n{SERVER_DIR_MARKER} /shard-1\n"
+    )
+
+    transport = mock_hq(HQ_CODE.format(default="default", tmp_path=tmp_path))
+    scheduler.set_transport(transport)
+    assert scheduler.submit_job(str(tmp_path / "default"), "_aiidasubmit.sh") == "1"
+    job_id = scheduler.submit_job(str(tmp_path / "shard"), "_aiidasubmit.sh")
+    assert job_id == "1@/shard-1"
+    # A retry adopts the recorded job, also on a shard
+    assert scheduler.submit_job(str(tmp_path / "shard"), "_aiidasubmit.sh") == job_id
+    assert (
+        '"server_dir":"/shard-1"'
+        in (tmp_path / "shard" / SUBMIT_RECORD_NAME).read_text()
+    )
+
+    job_info_list = scheduler.get_jobs(jobs=["1", "1@/shard-1", "2@/shard-1"])
+    assert sorted(job_info.job_id for job_info in job_info_list) == [
+        "1",
+        "1@/shard-1",
+    ]
+
+    # The jobs of an unreachable shard are not mistaken for finished jobs
+    with pytest.raises(SchedulerError):
+        scheduler.get_jobs(jobs=["1", "1@/down"])
+
+    assert (
+        scheduler._get_kill_command("3@/shard-1")
+        == "hq --server-dir=/shard-1 job cancel 3"
+    )
+
+
+def test_feasibility_check_on_shards(tmp_path, mock_hq, monkeypatch):
+    """Test a job is checked against the workers of the HQ server of its shard, with one inventory per shard."""
+    import json
+
+    import aiida_hyperqueue.scheduler
+
+    scheduler = HyperQueueScheduler()
+    scheduler._inventories = {}
+
+    def worker(cpus):
+        resources = [{"name": "cpus", "kind": {"List": {"values": list(range(cpus))}}}]
+        return [{"id": 1, "configuration": {"resources": {"resources": resources}}}]
+
+    # The default server has a worker with 16 cores, the shard only one with 4 cores
+    code = f"""
+args = sys.argv[1:]
+shard = args[0].startswith("--server-dir=")
+if shard:
+    args.pop(0)
+if args[0] == "worker":
+    print({json.dumps(json.dumps(worker(16)))} if not shard else {json.dumps(json.dumps(worker(4)))})
+elif args[0] == "alloc":
+    print("[]")
+else:
+    print('{{"id": 1}}')
+"""
+    script = f"#!/bin/bash\n{SERVER_DIR_MARKER} /shard-1\n#HQ --cpus=8\n"
+    for name in ("shard", "moved"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "_aiidasubmit.sh").write_text(script)
+    monkeypatch.setattr(
+        aiida_hyperqueue.scheduler, "get_workdir_shard", lambda workdir: "/shard-1"
+    )
+
+    transport = mock_hq(code)
+    scheduler.set_transport(transport)
+    with pytest.raises(SchedulerError, match="the workers provide at most 4"):
+        scheduler.submit_job(str(tmp_path / "shard"), "_aiidasubmit.sh")
+
+    # A script that records another shard than the calculation job now has is not checked against its inventory
+    monkeypatch.setattr(
+        aiida_hyperqueue.scheduler, "get_workdir_shard", lambda workdir: None
+    )
+    assert scheduler.submit_job(str(tmp_path / "moved"), "_aiidasubmit.sh") == (
+        "1@/shard-1"
+    )
+
+    assert any(
+        "hq --server-dir=/shard-1 worker list" in command
+        for command in transport.commands
+    )
+    assert set(server_dir for _, server_dir in scheduler._inventories) == {
+        "/shard-1",
+        None,
+    }
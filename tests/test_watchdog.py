@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Tests for the reconciliation of the calculation jobs with the jobs of a restarted HQ server."""
+
+import json
+
+from aiida_hyperqueue.scheduler import SUBMIT_RECORD_NAME, HyperQueueScheduler
+from aiida_hyperqueue.watchdog import (
+    JOBS_COMMAND,
+    get_lost_calcjobs,
+    get_resubmit_command,
+    parse_resubmit_output,
+    resubmit_lost_calcjobs,
+)
+
+
+def test_lost_calcjobs_reused_job_id(mock_hq):
+    """Test a job id that the new server gave to the job of another calculation does not count as known."""
+    jobs = [
+        {"id": 1, "name": "default/aiida-12"},
+        {"id": 2, "name": "aiida-10"},
+    ]
+    code = f"""
+print(json.dumps([dict(job, state="waiting") for job in {jobs!r}]))
+"""
+    transport = mock_hq(code)
+    retval, stdout, stderr = transport.exec_command_wait(JOBS_COMMAND.format(hq="hq"))
+
+    assert retval == 0, stderr
+    calcjobs = [
+        {"pk": 10, "job_id": "2"},
+        {"pk": 11, "job_id": "1"},
+        {"pk": 12, "job_id": "1"},
+        {"pk": 13, "job_id": "7"},
+    ]
+    lost = get_lost_calcjobs(calcjobs, json.loads(stdout))
+
+    assert [calcjob["pk"] for calcjob in lost] == [11, 13]
+
+
+def test_resubmit(tmp_path, mock_hq):
+    """Test the lost jobs are submitted again in one command and the submit records are replaced."""
+    calcjobs = []
+    for pk in (5, 6):
+        workdir = tmp_path / f"calc {pk}"
+        workdir.mkdir()
+        (workdir / "_aiidasubmit.sh").write_text("#!/bin/bash\n")
+        (workdir / SUBMIT_RECORD_NAME).write_text('{"id": 1}')
+        calcjobs.append(
+            {
+                "pk": pk,
+                "job_id": "1",
+                "remote_workdir": str(workdir),
+                "submit_script_filename": "_aiidasubmit.sh",
+            }
+        )
+    # The second submission fails, so it is missing from the output
+    code = """
+import os
+if os.path.basename(os.getcwd()) == "calc 6":
+    raise SystemExit(1)
+print(json.dumps({"id": 42}, indent=2))
+"""
+    transport = mock_hq(code)
+    _, stdout, _ = transport.exec_command_wait(
+        get_resubmit_command(calcjobs, HyperQueueScheduler())
+    )
+
+    assert len(transport.commands) == 1
+    assert parse_resubmit_output(stdout) == {5: "42"}
+    assert json.loads((tmp_path / "calc 5" / SUBMIT_RECORD_NAME).read_text()) == {
+        "id": 42
+    }
+    assert not (tmp_path / "calc 6" / SUBMIT_RECORD_NAME).exists()
+
+
+def test_parse_resubmit_output():
+    """Test lines that are not a pk with a submit record are ignored."""
+    stdout = '3 {"id":7}\nwarning: something\n4\n5 {"error":"x"}\n'
+
+    assert parse_resubmit_output(stdout) == {3: "7"}
+
+
+def test_resubmit_lost_calcjobs_paused(
+    aiida_profile_clean, tmp_path, mock_hq, monkeypatch
+):
+    """Test only the lost calculation jobs that are paused while waiting for their job are submitted again.
+
+    The calculation jobs are played after, and one that no longer waits for its new job is reported.
+    """
+    from aiida import orm
+    from aiida.common.datastructures import CalcJobState
+    from aiida.engine.processes import control
+    from aiida.engine import ProcessState
+
+    computer = orm.Computer(
+        label="localhost-hq",
+        hostname="localhost",
+        transport_type="core.local",
+        scheduler_type="hyperqueue",
+    ).store()
+
+    nodes = []
+    for index in range(4):
+        workdir = tmp_path / f"calc{index}"
+        workdir.mkdir()
+        (workdir / "_aiidasubmit.sh").write_text("#!/bin/bash\n")
+        node = orm.CalcJobNode(computer=computer)
+        node.set_process_state(ProcessState.WAITING)
+        node.set_state(CalcJobState.WITHSCHEDULER)
+        node.set_job_id("1")
+        node.set_remote_workdir(str(workdir))
+        nodes.append(node.store())
+
+    # The second calculation job is not run by a daemon worker that responds to the pause, the worker of the third
+    # moves it past the lost job before the pause, and the worker of the fourth after the play
+    def pause_processes(processes, **kwargs):
+        for node in (nodes[0], nodes[2], nodes[3]):
+            node.pause()
+        nodes[2].set_state(CalcJobState.RETRIEVING)
+
+    played = []
+
+    def play_processes(processes, **kwargs):
+        played.extend(processes)
+        nodes[3].set_state(CalcJobState.RETRIEVING)
+
+    monkeypatch.setattr(control, "pause_processes", pause_processes)
+    monkeypatch.setattr(control, "play_processes", play_processes)
+
+    code = """
+print("[]" if sys.argv[1] == "job" else '{"id": 42}')
+"""
+    transport = mock_hq(code)
+    lost, job_ids, mismatched = resubmit_lost_calcjobs(computer, transport)
+
+    assert sorted(calcjob["pk"] for calcjob in lost) == sorted(
+        node.pk for node in nodes
+    )
+    assert job_ids == {nodes[0].pk: "42"}
+    assert mismatched == {nodes[3].pk: "42"}
+    assert [node.get_job_id() for node in nodes] == ["42", "1", "1", "42"]
+    assert [node.pk for node in played] == [nodes[0].pk, nodes[2].pk, nodes[3].pk]
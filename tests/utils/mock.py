@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import contextlib
 import os
+import shutil
+import subprocess
 import sys
 from pathlib import Path
 from typing import Dict
@@ -41,3 +43,41 @@ class ProgramMock:
         yield
 
         os.unlink(program_path)
+
+
+class MockTransport:
+    """Stand-in for an AiiDA transport that runs the commands in a local shell.
+
+    Programs mocked with the ``ProgramMock`` take precedence over the ones on the ``PATH``.
+    """
+
+    hostname = "localhost"
+
+    def __init__(self, mock: ProgramMock):
+        self.mock = mock
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def makedirs(self, path, ignore_existing=False):
+        os.makedirs(path, exist_ok=ignore_existing)
+
+    def put(self, localpath, remotepath):
+        shutil.copy(localpath, remotepath)
+
+    def exec_command_wait(self, command: str, workdir=None, **kwargs):
+        self.commands.append(command)
+        env = os.environ.copy()
+        self.mock.update_env(env)
+        process = subprocess.run(
+            ["bash", "-c", command],
+            cwd=workdir,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        return process.returncode, process.stdout, process.stderr